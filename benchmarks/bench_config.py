@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark: per-request config/key-pool overhead before and after the mtime-cached snapshot
+
+Before: every HTTP attempt re-parsed ~/.veo_image2video_cfg.json (utils.config.load) and
+key_manager.refresh() rebuilt all four key pools. After: a clock check per call, a stat()
+at most once per CHECK_INTERVAL, and pools rebuilt only when the file changes.
+
+Run from the repo root:  python benchmarks/bench_config.py [iterations]
+"""
+import json
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import config as cfg_store  # noqa: E402
+
+
+def _write_config(path: str):
+    data = {
+        "google_api_keys": [f"AIza-bench-google-{i:03d}-xxxxxxxxxxxxxxxx" for i in range(20)],
+        "labs_tokens": [f"ya29.bench-labs-{i:03d}-" + "x" * 180 for i in range(20)],
+        "openai_api_keys": [f"sk-bench-{i:03d}" for i in range(5)],
+        "elevenlabs_api_keys": [f"el-bench-{i:03d}" for i in range(5)],
+        "resilience": {"max_attempts": 5, "concurrency": {"labs": 3}},
+        "download_root": tempfile.gettempdir(),
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def main(n: int = 20000):
+    tmp = tempfile.mkdtemp(prefix="bench_cfg_")
+    cfg_store.CFG_PATH = os.path.join(tmp, "cfg.json")
+    cfg_store.reset()
+    _write_config(cfg_store.CFG_PATH)
+
+    from services.core import key_manager
+
+    def before():
+        # old utils.config.load() + old key_manager.refresh() on every get_all_keys()
+        with open(cfg_store.CFG_PATH, "r", encoding="utf-8") as f:
+            c = json.load(f)
+        key_manager._rebuild(c)
+        return c.get("resilience", {}).get("max_attempts", 5), key_manager._POOLS["google"].get_all()
+
+    def after():
+        c = cfg_store.load()
+        return c.get("resilience", {}).get("max_attempts", 5), key_manager.get_all_keys("google")
+
+    after()  # build the pools once
+    t_before = min(timeit.repeat(before, number=n // 10, repeat=3)) / (n // 10)
+    t_after = min(timeit.repeat(after, number=n, repeat=3)) / n
+    print(f"per-request config + key lookup ({n} iterations)")
+    print(f"  before: {t_before * 1e6:9.2f} us")
+    print(f"  after : {t_after * 1e6:9.2f} us")
+    print(f"  saved : {(t_before - t_after) * 1e6:9.2f} us/request ({t_before / max(t_after, 1e-12):.0f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
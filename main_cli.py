@@ -0,0 +1,103 @@
+"""
+Headless batch rendering - the ProjectPanel flow without Qt
+
+    python main_cli.py --project Catalog --prompts scenes.json --images ./photos --copies 2
+    python main_cli.py --project Catalog --resume          # continue an interrupted run
+
+Tokens, download_root and default_project_id come from the same config as the app.
+"""
+import argparse
+import json
+import signal
+import sys
+import threading
+import time
+
+from services.core.config import load as load_cfg
+from services.labs_flow_service import DEFAULT_PROJECT_ID, LabsClient
+from services.orchestrator import ProjectRunner, build_jobs, list_images, parse_prompt_file, project_paths
+
+
+def _parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Render a prompt-JSON + image-folder project end to end (no UI)")
+    ap.add_argument("--project", required=True, help="project name (folder under download_root)")
+    ap.add_argument("--prompts", help="prompt JSON file (same formats as the app)")
+    ap.add_argument("--images", help="folder of reference images, paired with scenes by file name order")
+    ap.add_argument("--model", default="veo_3_1_i2v_s_fast_portrait_ultra", help="video model key (*_t2v* = text only)")
+    ap.add_argument("--aspect", default="VIDEO_ASPECT_RATIO_PORTRAIT",
+                    choices=["VIDEO_ASPECT_RATIO_PORTRAIT", "VIDEO_ASPECT_RATIO_LANDSCAPE", "VIDEO_ASPECT_RATIO_SQUARE"])
+    ap.add_argument("--copies", type=int, default=4, help="videos per scene")
+    ap.add_argument("--concurrency", type=int, help="parallel start calls (default: submission.concurrency)")
+    ap.add_argument("--upload-concurrency", type=int, help="parallel image uploads")
+    ap.add_argument("--download-concurrency", type=int, default=4)
+    ap.add_argument("--timeout", type=float, help="give up following renders after this many seconds")
+    ap.add_argument("--out", help="video folder (default: <download_root>/<project>/Video)")
+    ap.add_argument("--resume", action="store_true", help="continue the saved project instead of preparing a new one")
+    ap.add_argument("--json", action="store_true", help="print events as JSON lines")
+    return ap.parse_args(argv)
+
+
+def _printer(as_json: bool):
+    lock = threading.Lock()
+    def on_event(ev):
+        kind = ev.get("kind")
+        if as_json:
+            line = json.dumps({k: v for k, v in ev.items() if k != "job"}, ensure_ascii=False, default=str)
+        elif kind == "log":
+            line = f"[{ev['level']}] {ev['msg']}"
+        elif kind == "scene_started":
+            line = f"[START] cảnh {ev['index']+1}: {ev.get('ops')} operation"
+        elif kind == "scene_failed":
+            line = f"[ERR] cảnh {ev['index']+1} ({ev.get('stage')}): {ev.get('error')}"
+        elif kind == "progress":
+            line = f"[{ev['percent']}%] {ev['text']}"
+        else:
+            return
+        with lock:
+            print(line, flush=True)
+    return on_event
+
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    cfg = load_cfg()
+    tokens = [t.strip() for t in cfg.get("tokens", []) if t and t.strip()]
+    if not tokens:
+        print("Thiếu token: nhập token trong tab Cài đặt (hoặc config) trước khi chạy.", file=sys.stderr)
+        return 2
+    paths = project_paths(cfg, args.project)
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    on_event = _printer(args.json)
+    runner = ProjectRunner(args.project, LabsClient(tokens), args.model, args.aspect, args.copies,
+                           cfg.get("default_project_id") or DEFAULT_PROJECT_ID, args.out or paths["videos"],
+                           on_event=on_event, concurrency=args.concurrency,
+                           upload_concurrency=args.upload_concurrency,
+                           download_concurrency=args.download_concurrency, should_stop=stop.is_set)
+    if args.resume:
+        n = runner.resume()
+        if not n:
+            print(f"Không có dữ liệu đã lưu cho dự án '{args.project}'.", file=sys.stderr)
+            return 2
+        on_event({"kind": "log", "level": "INFO", "msg": f"Khôi phục {n} cảnh."})
+    else:
+        if not args.prompts:
+            print("Cần --prompts (hoặc --resume).", file=sys.stderr)
+            return 2
+        is_t2v = "_t2v" in args.model
+        jobs, warnings = build_jobs(args.project, parse_prompt_file(args.prompts),
+                                    list_images(args.images) if args.images else [], args.copies, is_t2v, paths)
+        for w in warnings:
+            on_event({"kind": "log", "level": "WARN", "msg": w})
+        if not jobs:
+            return 2
+        runner.set_jobs(jobs)
+    t0 = time.monotonic()
+    summary = runner.run(timeout=args.timeout)
+    summary["elapsed_sec"] = round(time.monotonic() - t0, 1)
+    print(json.dumps(summary, ensure_ascii=False))
+    return 0 if summary["downloaded"] >= summary["expected"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
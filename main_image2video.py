@@ -1,6 +1,7 @@
 import sys, os
-from PyQt5.QtWidgets import QApplication, QWidget, QHBoxLayout, QVBoxLayout, QPushButton, QLineEdit, QListWidget, QSplitter, QLabel, QTabWidget
-from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import (QApplication, QWidget, QHBoxLayout, QVBoxLayout, QPushButton, QLineEdit, QListWidget, QSplitter, QLabel, QTabWidget,
+                             QTableWidget, QTableWidgetItem, QAbstractItemView, QHeaderView)
+from PyQt5.QtCore import Qt, QTimer
 try:
     from ui.project_panel import ProjectPanel
     from ui.settings_panel import SettingsPanel
@@ -11,6 +12,15 @@ try:
     from utils.config import load as load_cfg
 except Exception:
     from config import load as load_cfg
+try:
+    from services.job_store import get_store
+    from services.project_scheduler import get_scheduler
+except Exception:
+    from job_store import get_store
+    from project_scheduler import get_scheduler
+
+QUEUE_COLS = ["Dự án", "Ưu tiên", "Trọng số", "Trạng thái", "Chờ gửi", "Đang render"]
+QUEUE_STATES = {"queued": "Chờ", "submitting": "Đang gửi", "rendering": "Đang render", "done": "Xong", "cancelled": "Đã hủy"}
 
 class ProjectsPane(QWidget):
     def __init__(self):
@@ -18,6 +28,9 @@ class ProjectsPane(QWidget):
         self._build_ui()
         self._projects = {}
         self._queue_running = False
+        self._queue_waiting = set()
+        # Reopen projects that still have renders/downloads outstanding (panels resume them)
+        self._restore_projects()
         # Always ensure at least one project exists so the right pane is visible immediately
         self._ensure_default_project()
 
@@ -36,7 +49,16 @@ class ProjectsPane(QWidget):
         self.btn_run_all.setStyleSheet("QPushButton{background:#43a047;color:white;font-weight:700;font-size:15px;border-radius:8px;padding:10px;} QPushButton:hover{background:#2e7d32;}")
         self.btn_run_all.clicked.connect(self._run_all_queue)
         lv.addWidget(QLabel("Quản lý dự án")); lv.addWidget(self.ed_name); lv.addWidget(self.btn_add); lv.addWidget(self.btn_del); self.list=QListWidget(); self.list.currentTextChanged.connect(self._switch_project); lv.addWidget(self.list,1)
+        lv.addWidget(self.btn_run_all)
+        # Global queue: every project's scenes share one in-flight operation budget
+        self.lb_queue=QLabel("Hàng đợi chung"); lv.addWidget(self.lb_queue)
+        self.q_table=QTableWidget(0, len(QUEUE_COLS)); self.q_table.setHorizontalHeaderLabels(QUEUE_COLS)
+        self.q_table.verticalHeader().setVisible(False); self.q_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.q_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.q_table.setToolTip("Sửa cột Ưu tiên / Trọng số để đổi thứ tự và tỉ lệ chia suất render")
+        self.q_table.cellChanged.connect(self._on_queue_edit); lv.addWidget(self.q_table,1)
         split.addWidget(left)
+        self._q_timer=QTimer(self); self._q_timer.timeout.connect(self._refresh_queue); self._q_timer.start(1000)
 
         self.right_holder=QWidget(); self.right_layout=QVBoxLayout(self.right_holder); split.addWidget(self.right_holder)
 
@@ -51,7 +73,9 @@ class ProjectsPane(QWidget):
         if not it: return
         name=it.text()
         panel=self._projects.pop(name, None)
-        if panel: panel.setParent(None); panel.deleteLater()
+        if panel: panel._unwatch_ops(); panel.setParent(None); panel.deleteLater()
+        get_scheduler().forget(name); self._on_project_completed(name)
+        get_store().delete_project(name)
         self.list.takeItem(self.list.currentRow())
         self._maybe_auto_add_after_delete()
 
@@ -70,6 +94,13 @@ class ProjectsPane(QWidget):
         return root
 
 
+    def _restore_projects(self):
+        try: names=get_store().projects(outstanding_only=True)
+        except Exception: names=[]
+        for name in names:
+            self.ed_name.setText(name); self._add_project()
+        self.ed_name.clear()
+
     def _ensure_default_project(self):
         if not self._projects:
             # Create a default project immediately so users don't need to click 'Thêm dự án'
@@ -81,34 +112,55 @@ class ProjectsPane(QWidget):
             self._ensure_default_project()
 
     def _run_all_queue(self):
-        # Start from the first project in list
+        # Queue every project at once; list order becomes priority, capacity goes to the next
+        # project as soon as the one before has nothing left to submit
         if not self._projects or self._queue_running:
             return
+        names = [self.list.item(i).text() for i in range(self.list.count())]
+        queued = set()
+        for pos, name in enumerate(names):
+            panel = self._projects.get(name)
+            if panel and panel._run_seq(priority=len(names) - pos):
+                queued.add(name)
+        if not queued:
+            return
         self._queue_running = True
+        self._queue_waiting = queued
         self.btn_run_all.setEnabled(False)
-        first = self.list.item(0).text() if self.list.count() else None
-        if first:
-            self.list.setCurrentRow(0)
-            panel = self._projects.get(first)
-            if panel: panel._run_seq()
+        self._refresh_queue()
 
     def _on_project_completed(self, project_name: str):
-        if not self._queue_running:
-            # even nếu user chạy thủ công, vẫn tiếp tục dự án kế tiếp theo yêu cầu
-            self._queue_running = True
-        # find next
-        names = [self.list.item(i).text() for i in range(self.list.count())]
-        if project_name in names:
-            idx = names.index(project_name) + 1
-            if idx < len(names):
-                nxt = self._projects.get(names[idx])
-                if nxt:
-                    self.list.setCurrentRow(idx)
-                    nxt._run_seq()
-                    return
-        # no more
-        self._queue_running = False
-        self.btn_run_all.setEnabled(True)
+        self._queue_waiting.discard(project_name)
+        if self._queue_running and not self._queue_waiting:
+            self._queue_running = False
+            self.btn_run_all.setEnabled(True)
+
+    def _refresh_queue(self):
+        if self.q_table.state() == QAbstractItemView.EditingState:
+            return
+        sched = get_scheduler()
+        rows = [r for r in sched.queue() if r["project"] in self._projects]
+        self.lb_queue.setText(f"Hàng đợi chung — đang render {sched.inflight()}/{sched.target_inflight} operation")
+        self.q_table.blockSignals(True)
+        self.q_table.setRowCount(len(rows))
+        for i, r in enumerate(rows):
+            vals = [r["project"], str(r["priority"]), f"{r['weight']:g}", QUEUE_STATES.get(r["state"], r["state"]),
+                    f"{r['waiting']}/{r['scenes']}", str(r["inflight"])]
+            for c, v in enumerate(vals):
+                it = QTableWidgetItem(v)
+                if c not in (1, 2): it.setFlags(it.flags() & ~Qt.ItemIsEditable)
+                self.q_table.setItem(i, c, it)
+        self.q_table.blockSignals(False)
+
+    def _on_queue_edit(self, row, col):
+        name_it = self.q_table.item(row, 0); it = self.q_table.item(row, col)
+        if not name_it or not it or col not in (1, 2): return
+        try:
+            if col == 1: get_scheduler().set_share(name_it.text(), priority=int(it.text()))
+            else: get_scheduler().set_share(name_it.text(), weight=float(it.text()))
+        except ValueError:
+            pass
+        self._refresh_queue()
 
 class MainWindow(QTabWidget):
     def __init__(self):
@@ -134,8 +186,18 @@ class MainWindow(QTabWidget):
         except Exception as e:
             print("Ads tab error:", e)
 
+def _warm_up_connections():
+    # Pre-open pooled connections to Labs/Gemini while the UI loads (config: transport.warm_up)
+    try:
+        if (load_cfg().get("transport") or {}).get("warm_up", True):
+            from services.transport import warm_up_async
+            warm_up_async()
+    except Exception as e:
+        print(f"Warning: connection warm-up skipped: {e}")
+
 def main():
     app=QApplication(sys.argv)
+    _warm_up_connections()
     
     # Apply unified Material Design theme
     try:
@@ -1,61 +1,67 @@
 # -*- coding: utf-8 -*-
+import time
 from typing import Dict, Any, Tuple
 from services.http_retry import request_json
-from services.core.key_manager import get_all_keys
-from services.resilience import acquire
+from services.core import key_manager
+from services import rate_limiter
 
-def labs_call(method:str, url:str, *, json_body=None, params=None, headers=None):
-    tokens = get_all_keys('labs')
-    last_err = ""; last_code = 0; last_headers = {}
-    for t in tokens or [""]:
-        h = dict(headers or {})
-        if t: h['authorization'] = f'Bearer {t}'
-        with acquire('labs'):
-            ok, data, err, code, resp_headers = request_json(method, url, headers=h, params=params, json_body=json_body)
-        if ok: return ok, data, code, resp_headers
-        last_err, last_code, last_headers = err, code, resp_headers
-        if code in (401, 403): continue
-        break
+def _bearer(h:Dict[str,str], p:Dict[str,Any], k:str): h['authorization'] = f'Bearer {k}'
+def _query_key(h:Dict[str,str], p:Dict[str,Any], k:str): p['key'] = k
+def _xi_key(h:Dict[str,str], p:Dict[str,Any], k:str): h['xi-api-key'] = k
+
+# How each provider's key is attached to a request (shared with services.async_clients)
+AUTH_STYLES = {'labs': _bearer, 'google': _query_key, 'openai': _bearer, 'elevenlabs': _xi_key}
+
+def with_key(provider:str, key:str, headers=None, params=None):
+    """Copy headers/params and attach the provider key; params stays None if unused"""
+    h = dict(headers or {}); p = dict(params or {})
+    if key: AUTH_STYLES[provider](h, p, key)
+    return h, (p or None)
+
+def failure(last_err:str, last_code:int, last_headers:Dict[str,str]):
     return False, {"error": last_err, "trace": last_headers.get("x-request-id","")}, last_code, last_headers
 
-def google_call(method:str, url:str, *, json_body=None, params=None, headers=None):
-    keys = get_all_keys('google')
+def key_order(provider:str, keys, tokens:int=0):
+    """Yield keys soonest-available first, reserving a rate-limit slot on each before it is handed out"""
+    left = [k for k in keys if k]
+    if not left:
+        yield ""; return
+    while left:
+        k = rate_limiter.acquire_key(provider, left, tokens)
+        left.remove(k)
+        yield k
+
+def report_outcome(provider:str, key:str, status:int, latency:float=None, headers=None, body=None):
+    """Feed a response into key health (services.core.key_manager) and the key's rate-limit bucket"""
+    cooldown = None
+    if status == 429:
+        cooldown = rate_limiter.retry_window(status, headers, body)
+        rate_limiter.penalize(provider, key, cooldown)
+    key_manager.report(provider, key, status, latency, cooldown)
+
+def _call(provider:str, method:str, url:str, *, json_body=None, params=None, headers=None):
+    keys = key_manager.ranked_keys(provider)
     last_err = ""; last_code = 0; last_headers = {}
-    for k in keys or [""]:
-        p = dict(params or {})
-        if k: p['key'] = k
-        with acquire('google'):
-            ok, data, err, code, resp_headers = request_json(method, url, headers=headers, params=p, json_body=json_body)
+    for k in key_order(provider, keys):
+        h, p = with_key(provider, k, headers, params)
+        t0 = time.monotonic()
+        ok, data, err, code, resp_headers = request_json(method, url, headers=h, params=p, json_body=json_body)
+        report_outcome(provider, k, code, time.monotonic() - t0, resp_headers, err)
         if ok: return ok, data, code, resp_headers
         last_err, last_code, last_headers = err, code, resp_headers
+        if code == 429: continue
         if code in (401, 403): continue
         break
-    return False, {"error": last_err, "trace": last_headers.get("x-request-id","")}, last_code, last_headers
+    return failure(last_err, last_code, last_headers)
+
+def labs_call(method:str, url:str, *, json_body=None, params=None, headers=None):
+    return _call('labs', method, url, json_body=json_body, params=params, headers=headers)
+
+def google_call(method:str, url:str, *, json_body=None, params=None, headers=None):
+    return _call('google', method, url, json_body=json_body, params=params, headers=headers)
 
 def openai_call(method:str, url:str, *, json_body=None, params=None, headers=None):
-    keys = get_all_keys('openai')
-    last_err = ""; last_code = 0; last_headers = {}
-    for k in keys or [""]:
-        h = dict(headers or {})
-        if k: h['authorization'] = f'Bearer {k}'
-        with acquire('openai'):
-            ok, data, err, code, resp_headers = request_json(method, url, headers=h, params=params, json_body=json_body)
-        if ok: return ok, data, code, resp_headers
-        last_err, last_code, last_headers = err, code, resp_headers
-        if code in (401, 403): continue
-        break
-    return False, {"error": last_err, "trace": last_headers.get("x-request-id","")}, last_code, last_headers
+    return _call('openai', method, url, json_body=json_body, params=params, headers=headers)
 
 def eleven_call(method:str, url:str, *, json_body=None, params=None, headers=None):
-    keys = get_all_keys('elevenlabs')
-    last_err = ""; last_code = 0; last_headers = {}
-    for k in keys or [""]:
-        h = dict(headers or {})
-        if k: h['xi-api-key'] = k
-        with acquire('elevenlabs'):
-            ok, data, err, code, resp_headers = request_json(method, url, headers=h, params=params, json_body=json_body)
-        if ok: return ok, data, code, resp_headers
-        last_err, last_code, last_headers = err, code, resp_headers
-        if code in (401, 403): continue
-        break
-    return False, {"error": last_err, "trace": last_headers.get("x-request-id","")}, last_code, last_headers
+    return _call('elevenlabs', method, url, json_body=json_body, params=params, headers=headers)
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed store for downloaded videos and generated images
+A rendered video used to be fetched again on every "download all" (only_missing=False) and
+for every project it landed in, and preview images were rewritten per project. Files now live
+once under the store directory as objects/<sha256[:2]>/<sha256>; source keys (operation name,
+or the URL without its signing parameters) map to the hash. Project files are materialized
+from the object as a reflink (copy-on-write clone) where the filesystem supports it, else a
+hardlink, else a plain copy, so repeat exports are instant and take no extra space. Keep the
+store on the same volume as the download root: links can't cross volumes and fall back to
+copies. Materialized files are shared with the store (a hardlink shares its bytes outright), so
+tools that edit them must write a new file rather than modify one in place.
+
+Objects are evicted least-recently-used first once the store exceeds max_gb; project files
+linked to an evicted object keep their data. The index lives in ~/.veo_artifacts.json.
+
+Config (optional)::
+
+    "artifacts": {"enabled": true, "dir": "~/.veo_artifacts", "max_gb": 20, "link": "auto"}
+
+link: "auto" (reflink, hardlink, copy), "reflink", "hardlink" or "copy".
+"""
+import atexit
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from services.core.config import load as load_config
+
+INDEX_PATH = Path.home() / ".veo_artifacts.json"
+_DEFAULTS = {'enabled': True, 'dir': os.path.join(os.path.expanduser("~"), ".veo_artifacts"), 'max_gb': 20,
+             'link': 'auto'}
+_SAVE_INTERVAL = 10.0
+# query parameters that sign a URL rather than name the object (they change on every refresh)
+_SIGNING_PARAMS = {'expires', 'googleaccessid', 'signature', 'x-goog-algorithm', 'x-goog-credential',
+                   'x-goog-date', 'x-goog-expires', 'x-goog-signedheaders', 'x-goog-signature'}
+_FICLONE = 0x40049409   # Linux ioctl: clone src extents into dst
+
+_KEYS: Dict[str, str] = {}      # source key -> sha256
+_BLOBS: Dict[str, dict] = {}    # sha256 -> {"size", "at"}
+_LOCK = threading.Lock()
+_dirty = False
+_last_save = 0.0
+
+
+def _settings() -> dict:
+    return {**_DEFAULTS, **(load_config().get('artifacts') or {})}
+
+
+def enabled() -> bool:
+    return bool(_settings().get('enabled', True))
+
+
+def _load():
+    try:
+        with open(INDEX_PATH, "r", encoding="utf-8") as f:
+            raw = json.load(f) or {}
+        _KEYS.update({str(k): str(v) for k, v in (raw.get("keys") or {}).items()})
+        for h, b in (raw.get("blobs") or {}).items():
+            if isinstance(b, dict):
+                _BLOBS[h] = {"size": int(b.get("size") or 0), "at": float(b.get("at") or 0)}
+    except Exception:
+        pass
+
+
+def save(force: bool = False):
+    """Persist the index (throttled unless forced)"""
+    global _dirty, _last_save
+    with _LOCK:
+        now = time.monotonic()
+        if not _dirty or (not force and now - _last_save < _SAVE_INTERVAL):
+            return
+        data = {"keys": dict(_KEYS), "blobs": {h: dict(b) for h, b in _BLOBS.items()}}
+        _dirty = False; _last_save = now
+    try:
+        tmp = INDEX_PATH.with_suffix('.tmp')
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        tmp.replace(INDEX_PATH)
+    except Exception:
+        pass
+
+
+def url_key(url: str) -> str:
+    """Source key for a URL: the object it names, without the signature that changes per refresh"""
+    parts = urlsplit(url)
+    q = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k.lower() not in _SIGNING_PARAMS]
+    return "url:" + urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, urlencode(q), ''))
+
+
+def op_key(op_name: str) -> str:
+    """Source key for the video of a finished operation"""
+    return f"op:{op_name}"
+
+
+def _object(h: str) -> str:
+    return os.path.join(os.path.expanduser(_settings()['dir']), "objects", h[:2], h)
+
+
+def _hash_file(path: str) -> str:
+    d = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            d.update(chunk)
+    return d.hexdigest()
+
+
+def _reflink(src: str, dst: str) -> bool:
+    try:
+        if sys.platform.startswith("linux"):
+            import fcntl
+            with open(src, "rb") as s, open(dst, "wb") as d:
+                fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+            return True
+        if sys.platform == "darwin":
+            import ctypes
+            libc = ctypes.CDLL("libc.dylib", use_errno=True)
+            return libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) == 0
+    except Exception:
+        pass
+    try: os.remove(dst)
+    except OSError: pass
+    return False
+
+
+def _link(src: str, dst: str) -> str:
+    """Make dst a new name for src's content; returns the method used"""
+    mode = str(_settings().get('link') or 'auto').lower()
+    if mode in ('auto', 'reflink') and _reflink(src, dst):
+        return 'reflink'
+    if mode in ('auto', 'hardlink'):
+        try:
+            os.link(src, dst)
+            return 'hardlink'
+        except OSError:
+            pass
+    shutil.copyfile(src, dst)
+    return 'copy'
+
+
+def _same(a: str, b: str) -> bool:
+    try: return os.path.samefile(a, b)
+    except OSError: return False
+
+
+def lookup(key: Optional[str]) -> Optional[str]:
+    """sha256 stored for a source key (None when unknown or its object is gone)"""
+    global _dirty
+    if not key or not enabled():
+        return None
+    with _LOCK:
+        h = _KEYS.get(key)
+        b = _BLOBS.get(h) if h else None
+        if b is None:
+            return None
+    try:
+        ok = os.path.getsize(_object(h)) == b["size"]
+    except OSError:
+        ok = False
+    with _LOCK:
+        if ok:
+            b["at"] = time.time()
+        else:
+            _BLOBS.pop(h, None)
+            for k in [k for k, v in _KEYS.items() if v == h]: del _KEYS[k]
+        _dirty = True
+    save()
+    return h if ok else None
+
+
+def materialize(h: str, dest: str) -> str:
+    """
+    Place object h at dest (reflink, hardlink or copy; atomic replace)
+
+    Returns:
+        dest
+    """
+    src = _object(h)
+    if _same(src, dest):
+        return dest
+    os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+    tmp = dest + ".link"
+    try: os.remove(tmp)
+    except OSError: pass
+    _link(src, tmp)
+    os.replace(tmp, dest)
+    return dest
+
+
+def ingest(path: str, keys: Iterable[Optional[str]] = ()) -> Optional[str]:
+    """
+    Add a finished file to the store and map the source keys to it
+
+    The file stays where it is: a new object is linked to it (or copied when the store is on
+    another volume); content the store already holds replaces the file with a link to the object.
+
+    Returns:
+        sha256, or None when the store is disabled or the file can't be stored
+    """
+    global _dirty
+    if not enabled():
+        return None
+    try:
+        h = _hash_file(path)
+        obj = _object(h)
+        if os.path.exists(obj):
+            materialize(h, path)
+        else:
+            os.makedirs(os.path.dirname(obj), exist_ok=True)
+            tmp = obj + ".tmp"
+            try: os.remove(tmp)
+            except OSError: pass
+            _link(path, tmp)
+            os.replace(tmp, obj)
+        size = os.path.getsize(obj)
+    except OSError:
+        return None
+    with _LOCK:
+        _BLOBS[h] = {"size": size, "at": time.time()}
+        for k in keys:
+            if k: _KEYS[k] = h
+        _dirty = True
+    evict()
+    save()
+    return h
+
+
+def write_bytes(data: bytes, dest: str, keys: Iterable[Optional[str]] = ()) -> str:
+    """Write generated bytes (preview images) to dest through the store; returns dest"""
+    if not enabled():
+        with open(dest, "wb") as f:
+            f.write(data)
+        return dest
+    h = hashlib.sha256(data).hexdigest()
+    with _LOCK:
+        b = _BLOBS.get(h)
+        if b is not None:
+            b["at"] = time.time()
+            for k in keys:
+                if k: _KEYS[k] = h
+    if b is not None and os.path.exists(_object(h)):
+        try:
+            return materialize(h, dest)
+        except OSError:
+            pass
+    tmp = dest + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, dest)
+    ingest(dest, keys)
+    return dest
+
+
+def fetch_cached(keys: Iterable[Optional[str]], dest: str) -> bool:
+    """Materialize dest from the first known key; False when none is stored"""
+    for k in keys:
+        h = lookup(k)
+        if h:
+            try:
+                materialize(h, dest)
+                return True
+            except OSError:
+                return False
+    return False
+
+
+def evict(budget_bytes: Optional[int] = None) -> int:
+    """
+    Drop least-recently-used objects until the store fits the budget (max_gb by default)
+
+    Returns:
+        Bytes removed from the store
+    """
+    global _dirty
+    budget = int(float(_settings().get('max_gb') or 0) * 1024 ** 3) if budget_bytes is None else int(budget_bytes)
+    if budget <= 0:
+        return 0
+    with _LOCK:
+        total = sum(b["size"] for b in _BLOBS.values())
+        victims = []
+        for h, b in sorted(_BLOBS.items(), key=lambda kv: kv[1]["at"]):
+            if total <= budget:
+                break
+            victims.append(h); total -= b["size"]
+        freed = 0
+        for h in victims:
+            freed += _BLOBS.pop(h)["size"]
+            for k in [k for k, v in _KEYS.items() if v == h]: del _KEYS[k]
+        if victims:
+            _dirty = True
+    for h in victims:
+        try: os.remove(_object(h))
+        except OSError: pass
+    return freed
+
+
+def stats() -> dict:
+    """Objects, keys and bytes held"""
+    with _LOCK:
+        return {"objects": len(_BLOBS), "keys": len(_KEYS), "bytes": sum(b["size"] for b in _BLOBS.values()),
+                "budget_bytes": int(float(_settings().get('max_gb') or 0) * 1024 ** 3)}
+
+
+def clear():
+    """Forget every object and remove them from disk"""
+    global _dirty
+    with _LOCK:
+        hashes = list(_BLOBS)
+        _BLOBS.clear(); _KEYS.clear(); _dirty = True
+    for h in hashes:
+        try: os.remove(_object(h))
+        except OSError: pass
+    save(True)
+
+
+_load()
+atexit.register(save, True)
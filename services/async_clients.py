@@ -0,0 +1,406 @@
+# -*- coding: utf-8 -*-
+"""
+Asyncio client layer - one event-loop thread multiplexes every in-flight API call
+Async equivalents of labs_call/google_call/openai_call/eleven_call and LabsClient.
+A waiting call costs a coroutine, not a blocked OS thread; the provider concurrency
+slot is only held while a request is on the wire, never during backoff sleeps.
+Blocking code (QThread workers, services) hands coroutines over with submit()/run_sync().
+
+Waiting for a concurrency slot or an open circuit costs no thread either: the limiter and
+breaker (shared with blocking callers) wake waiting coroutines when a slot frees up or the
+circuit changes state. Without aiohttp, HTTP calls fall back to the blocking transport in
+the loop's default executor, which brings back one thread per in-flight request (capped by
+the executor's max_workers, so calls beyond it queue): install aiohttp for the async path.
+"""
+import asyncio
+import contextvars
+import functools
+import json
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
+
+try:
+    import aiohttp  # type: ignore
+except Exception:  # pragma: no cover - optional; falls back to the blocking transport in an executor
+    aiohttp = None
+
+from services import media_cache, rate_limiter, token_dispatch, upload_body
+from services.api_clients import failure, report_outcome, with_key
+from services.circuit_breaker import CircuitBreaker, CircuitOpenError, breaker_for
+from services.core import key_manager
+from services.core.key_manager import ranked_keys
+from services.http_retry import RETRY_STATUS, _attempt_timeout, _emit, plan_retry, request_json
+from services.labs_flow_service import (
+    BATCH_CHECK_URL, DEFAULT_PROJECT_ID, UPLOAD_IMAGE_URL, LabsClient, _checked, _headers, _media_id_of,
+    _LAST_TOKEN, _learn, _max_start_batch, _parse_batch_check, _probe_plan, _start_many_plan, _start_plan,
+    _upload_payload,
+)
+from services.resilience import AdaptiveLimiter, limiter
+from services.retry_policy import RetryPolicy, policy_for
+from services.transport import origin, pool_size, provider_of
+
+
+class AsyncHTTPError(Exception):
+    """Non-2xx response from an async call (message starts with the status code like requests.HTTPError)"""
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+# ---------------------------------------------------------------------------
+# Event loop thread
+# ---------------------------------------------------------------------------
+_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_LOOP_LOCK = threading.Lock()
+_SESSIONS: Dict[str, Any] = {}
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """The shared event loop (started on a daemon thread on first use)"""
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            loop = asyncio.new_event_loop()
+            th = threading.Thread(target=_run_loop, args=(loop,), name='async-clients', daemon=True)
+            th.start()
+            _LOOP = loop
+        return _LOOP
+
+
+def _run_loop(loop: asyncio.AbstractEventLoop):
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+
+def submit(coro: Awaitable) -> Future:
+    """Schedule a coroutine on the shared loop from any thread"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run_sync(coro: Awaitable, timeout: Optional[float] = None):
+    """Run a coroutine on the shared loop and block the calling (non-loop) thread for its result"""
+    return submit(coro).result(timeout)
+
+
+def _session_for(url: str):
+    # Must be called on the loop thread (aiohttp binds sessions to the running loop)
+    key = origin(url)
+    sess = _SESSIONS.get(key)
+    if sess is None or sess.closed:
+        connector = aiohttp.TCPConnector(limit=pool_size(url), keepalive_timeout=60)
+        sess = aiohttp.ClientSession(connector=connector)
+        _SESSIONS[key] = sess
+    return sess
+
+
+class _Wakeup:
+    """with _Wakeup(limiter_or_breaker) as w: await w.wait(timeout) - woken from any thread by its watchers"""
+
+    def __init__(self, source):
+        self.source = source
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+
+    def _fire(self):
+        try:
+            self.loop.call_soon_threadsafe(self.event.set)
+        except RuntimeError:  # loop closed
+            pass
+
+    def __enter__(self):
+        self.source.add_watcher(self._fire)
+        return self
+
+    def __exit__(self, *exc):
+        self.source.remove_watcher(self._fire)
+        return False
+
+    async def wait(self, timeout: Optional[float] = None):
+        """Until the source signals (or timeout); the caller re-checks its condition afterwards"""
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.event.clear()
+
+
+class _Slot:
+    """async with _Slot(provider) as slot: ...; slot.done(status) - the shared adaptive limiter, awaited"""
+
+    def __init__(self, provider: str):
+        self.lim: Optional[AdaptiveLimiter] = limiter(provider) if provider else None
+        self.status = None
+        self.t0 = 0.0
+
+    def done(self, status: int):
+        self.status = status
+
+    async def __aenter__(self):
+        # the limiter is shared with blocking callers: wait for its release signal, not on its lock
+        if self.lim is not None and not self.lim.try_acquire():
+            with _Wakeup(self.lim) as w:
+                while not self.lim.try_acquire():
+                    await w.wait()
+        self.t0 = time.monotonic()
+        return self
+
+    async def __aexit__(self, *exc):
+        if self.lim is not None:
+            self.lim.release(self.status, time.monotonic() - self.t0)
+        return False
+
+
+async def _breaker_acquire(breaker: CircuitBreaker, wait: Optional[float] = None):
+    # CircuitBreaker.acquire() without blocking the loop thread
+    give_up_at = time.monotonic() + (breaker.max_wait if wait is None else max(0.0, wait))
+    ok, retry_in = breaker.try_acquire()
+    if ok:
+        return
+    # woken when the half-open probe reports; the open -> half-open switch is timed (retry_in)
+    with _Wakeup(breaker) as w:
+        while True:
+            left = give_up_at - time.monotonic()
+            if left <= 0:
+                raise CircuitOpenError(breaker.key, retry_in)
+            await w.wait(min(left, retry_in))
+            ok, retry_in = breaker.try_acquire()
+            if ok:
+                return
+
+
+def _client_timeout(timeout):
+    if isinstance(timeout, (int, float)):
+        conn_t = read_t = timeout
+    else:
+        conn_t, read_t = timeout
+    return aiohttp.ClientTimeout(sock_connect=conn_t, sock_read=read_t)
+
+
+async def close():
+    """Close pooled async sessions (call via run_sync(close()) at shutdown)"""
+    for sess in list(_SESSIONS.values()):
+        try:
+            await sess.close()
+        except Exception:
+            pass
+    _SESSIONS.clear()
+
+
+# ---------------------------------------------------------------------------
+# request_json equivalent
+# ---------------------------------------------------------------------------
+async def request_json_async(method: str, url: str, *, headers: Dict[str, str] = None,
+                             params: Dict[str, Any] = None, json_body: Any = None, data: Any = None,
+                             timeout=None, deadline: Optional[float] = None, on_event=None,
+                             circuit_wait: Optional[float] = None,
+                             policy: Optional[RetryPolicy] = None) -> Tuple[bool, Any, str, int, Dict[str, str]]:
+    """Async services.http_retry.request_json: same retry policy, breaker, events and return tuple"""
+    if aiohttp is None:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(
+            request_json, method, url, headers=headers, params=params, json_body=json_body,
+            data=data, timeout=timeout, deadline=deadline, on_event=on_event, circuit_wait=circuit_wait,
+            policy=policy))
+    sess = _session_for(url)
+    breaker = breaker_for(url)
+    policy = policy or policy_for(url)
+    max_attempts = policy.max_attempts
+    timeout = timeout or policy.timeout
+    deadline = deadline if deadline is not None else policy.deadline_sec
+    deadline_at = (time.monotonic() + float(deadline)) if deadline else None
+    kwargs = {}
+    if json_body is not None: kwargs['json'] = json_body
+    if data is not None: kwargs['data'] = data
+    provider = provider_of(url)
+    last_err, last_code, last_headers = "", 0, {}
+    for attempt in range(1, max_attempts+1):
+        status, text = 0, None
+        try:
+            await _breaker_acquire(breaker, circuit_wait)
+        except CircuitOpenError as e:
+            last_err = str(e)
+            _emit(on_event, "give_up", url=url, attempt=attempt, status=0, reason="circuit_open", error=last_err)
+            break
+        try:
+            ct = _client_timeout(_attempt_timeout(timeout, deadline_at))
+            async with _Slot(provider) as slot:
+                async with sess.request(method, url, headers=headers, params=params, timeout=ct, **kwargs) as r:
+                    raw = await r.read()
+                    last_code = r.status; last_headers = dict(r.headers or {})
+                slot.done(last_code)
+            breaker.record_status(last_code)
+            text = raw.decode('utf-8', 'replace')
+            if 200 <= last_code < 300:
+                try:
+                    return True, (json.loads(raw) if raw else {}), "", last_code, last_headers
+                except ValueError:
+                    return True, text, "", last_code, last_headers
+            if last_code not in RETRY_STATUS:
+                return False, None, f"HTTP {last_code}: {text[:500]}", last_code, last_headers
+            last_err = f"HTTP {last_code}: {text[:300]}"
+            status = last_code
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            breaker.record(True)
+            last_err = f"REQ ERR: {e}"
+        delay, reason = plan_retry(attempt, max_attempts, status=status, headers=last_headers if status else None,
+                                   body=text, deadline_at=deadline_at, policy=policy)
+        if delay is None:
+            _emit(on_event, "give_up", url=url, attempt=attempt, status=status, reason=reason, error=last_err)
+            break
+        _emit(on_event, "retry", url=url, attempt=attempt, status=status, delay=round(delay, 3), reason=reason)
+        await asyncio.sleep(delay)
+    return False, None, last_err or "exhausted", last_code, last_headers
+
+
+async def _call_async(provider: str, method: str, url: str, *, json_body=None, params=None, headers=None):
+    left = [k for k in ranked_keys(provider) if k] or [""]
+    last_err = ""; last_code = 0; last_headers = {}
+    while left:
+        # soonest-available key; the reservation wait is a coroutine sleep, not a blocked thread
+        k, wait = rate_limiter.reserve(provider, left) if left[0] else ("", 0.0)
+        left.remove(k)
+        if wait > 0: await asyncio.sleep(wait)
+        h, p = with_key(provider, k, headers, params)
+        t0 = time.monotonic()
+        ok, data, err, code, resp_headers = await request_json_async(method, url, headers=h, params=p, json_body=json_body)
+        report_outcome(provider, k, code, time.monotonic() - t0, resp_headers, err)
+        if ok: return ok, data, code, resp_headers
+        last_err, last_code, last_headers = err, code, resp_headers
+        if code == 429: continue
+        if code in (401, 403): continue
+        break
+    return failure(last_err, last_code, last_headers)
+
+
+async def labs_call_async(method: str, url: str, *, json_body=None, params=None, headers=None):
+    return await _call_async('labs', method, url, json_body=json_body, params=params, headers=headers)
+
+
+async def google_call_async(method: str, url: str, *, json_body=None, params=None, headers=None):
+    return await _call_async('google', method, url, json_body=json_body, params=params, headers=headers)
+
+
+async def openai_call_async(method: str, url: str, *, json_body=None, params=None, headers=None):
+    return await _call_async('openai', method, url, json_body=json_body, params=params, headers=headers)
+
+
+async def eleven_call_async(method: str, url: str, *, json_body=None, params=None, headers=None):
+    return await _call_async('elevenlabs', method, url, json_body=json_body, params=params, headers=headers)
+
+
+# ---------------------------------------------------------------------------
+# LabsClient equivalent
+# ---------------------------------------------------------------------------
+class AsyncLabsClient(LabsClient):
+    """
+    LabsClient whose upload/start/check methods are coroutines
+
+    Shares token rotation, events and the start_one fallback plan with LabsClient.
+    """
+
+    async def _post(self, url: str, payload: dict, circuit_wait: Optional[float] = None,
+                    token: Optional[str] = None) -> dict:
+        if aiohttp is None:
+            loop = asyncio.get_running_loop()
+            call = functools.partial(LabsClient._post, self, url, payload, circuit_wait, token)
+            # the executor thread sets its own _LAST_TOKEN; run it in a copy of this task's context
+            ctx = contextvars.copy_context()
+            try:
+                return await loop.run_in_executor(None, ctx.run, call)
+            finally:
+                if ctx.get(_LAST_TOKEN): _LAST_TOKEN.set(ctx.get(_LAST_TOKEN))
+        sess = _session_for(url); breaker = breaker_for(url); policy = policy_for(url)
+        ct = _client_timeout(self.timeout or policy.timeout)
+        last = None
+        body = upload_body.serialize(payload)  # once: every retry resends the same bytes/stream
+        for attempt in range(1, policy.max_attempts+1):
+            status, headers, raw = 0, None, None
+            await _breaker_acquire(breaker, circuit_wait)
+            try:
+                tok = token or self._tok(); _LAST_TOKEN.set(tok); t0 = time.monotonic()
+                async with _Slot('labs') as slot:
+                    if isinstance(body, upload_body.B64JSONBody):
+                        hdrs = {**_headers(tok), "Content-Length": str(len(body))}; data = body.aiter()
+                    else:
+                        hdrs = _headers(tok); data = body
+                    async with sess.post(url, headers=hdrs, data=data, timeout=ct) as r:
+                        raw = await r.read(); status = r.status; headers = dict(r.headers or {})
+                    slot.done(status)
+                breaker.record_status(status)
+                key_manager.report('labs', tok, status, time.monotonic() - t0)
+                if status == 200:
+                    self._emit("http_ok", code=200)
+                    try: return json.loads(raw) if raw else {}
+                    except ValueError: return {}
+                det = ""
+                try: det = json.loads(raw).get("error", {}).get("message", "")[:300]
+                except Exception: det = raw.decode('utf-8', 'replace')[:300]
+                self._emit("http_other_err", code=status, detail=det)
+                raise AsyncHTTPError(status, f"{status} Error: {det} for url: {url}")
+            except Exception as e:
+                if not status: breaker.record(True)
+                last = e
+            delay = self._retry_delay(attempt, status, headers, raw, policy)
+            if delay is None: break
+            await asyncio.sleep(delay)
+        raise last
+
+    async def upload_image_file(self, image_path: str, aspect_hint="IMAGE_ASPECT_RATIO_PORTRAIT",
+                                token: Optional[str] = None) -> Optional[str]:
+        loop = asyncio.get_running_loop()
+        key = await loop.run_in_executor(None, media_cache.key_for, image_path, aspect_hint,
+                                         key_manager._fingerprint(token) if token else None)
+        mid = media_cache.get(key)
+        if mid:
+            self._emit("upload_cached", media_id=mid); return mid
+        payload = await loop.run_in_executor(None, _upload_payload, image_path, aspect_hint)
+        data = await self._post(UPLOAD_IMAGE_URL, payload, token=token) or {}
+        mid = _media_id_of(data); media_cache.put(key, mid)
+        return mid
+
+    async def _run_plan(self, plan):
+        result, error = None, None
+        while True:
+            try:
+                step = plan.throw(error) if error is not None else plan.send(result)
+            except StopIteration as stop:
+                return stop.value
+            result, error = None, None
+            try:
+                if step[0] == "sleep": await asyncio.sleep(step[1])
+                elif step[0] == "post":
+                    result = await self._post(step[1], step[2], token=step[3] if len(step) > 3 else None)
+                    _learn(step)
+                elif step[0] == "upload":
+                    result = await self.upload_image_file(step[1], token=step[2] if len(step) > 2 else None)
+            except Exception as e:
+                error = e
+
+    async def start_one(self, job: Dict, model_key: str, aspect_ratio: str, prompt_text: str, copies: int = 1,
+                        project_id: Optional[str] = DEFAULT_PROJECT_ID) -> int:
+        return await self._run_plan(_start_plan(job, model_key, aspect_ratio, prompt_text, copies, project_id,
+                                                self.tokens))
+
+    async def start_many(self, jobs: List[Dict], model_key: str, aspect_ratio: str, copies: int = 1,
+                         project_id: Optional[str] = DEFAULT_PROJECT_ID, max_batch: Optional[int] = None) -> int:
+        return await self._run_plan(_start_many_plan(jobs, model_key, aspect_ratio, copies, project_id,
+                                                     max_batch or _max_start_batch(), self.tokens))
+
+    async def probe_models(self, model_key: str, aspect_ratio: str, media_id: Optional[str] = None,
+                           project_id: Optional[str] = DEFAULT_PROJECT_ID, prompt: str = "A calm ocean at sunrise") -> Dict:
+        return await self._run_plan(_probe_plan(self.tokens, model_key, aspect_ratio, media_id, project_id, prompt))
+
+    async def batch_check_operations(self, op_names: List[str]) -> Dict[str, Dict]:
+        if not op_names: return {}
+        groups = token_dispatch.group(op_names, self.tokens)
+        res = await asyncio.gather(*(self._post(BATCH_CHECK_URL, self._wrap_ops(names), circuit_wait=0, token=tok)
+                                     for tok, names in groups.items()), return_exceptions=True)
+        out: Dict[str, Dict] = {}
+        for r in res:
+            if not isinstance(r, BaseException): out.update(_parse_batch_check(r or {}))
+        if not out:
+            errs = [r for r in res if isinstance(r, BaseException)]
+            if errs: raise errs[0]
+        return _checked(out)
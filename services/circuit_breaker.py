@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Per-endpoint circuit breakers - fail fast while a provider endpoint is down
+Keyed by (provider, endpoint path) so a Labs batch-check outage doesn't block uploads and
+each Gemini model is tracked separately. States: closed -> open (error rate over threshold)
+-> half-open (one probe request) -> closed on success / open again with a longer cooldown.
+Callers that queue work block in acquire() until the endpoint recovers instead of spinning.
+"""
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+_DEFAULTS = {
+    'window_sec': 60.0,       # outcomes older than this are forgotten
+    'min_calls': 5,           # don't judge an endpoint on fewer calls than this
+    'error_rate': 0.5,        # open when failures/calls reaches this
+    'cooldown_sec': 15.0,     # first open period; doubles on each failed probe
+    'max_cooldown_sec': 240.0,
+    'max_wait_sec': 120.0,    # default time a queued caller waits for recovery
+}
+
+
+class CircuitOpenError(Exception):
+    """Endpoint circuit is open; retry_in is the seconds until the next probe is allowed"""
+    def __init__(self, key: Tuple[str, str], retry_in: float):
+        super().__init__(f"CIRCUIT OPEN {key[0]}:{key[1]} (thử lại sau {retry_in:.0f}s)")
+        self.key = key
+        self.retry_in = retry_in
+
+
+def _settings() -> dict:
+    try:
+        from services.core.config import load as load_config
+        return {**_DEFAULTS, **((load_config().get('resilience') or {}).get('circuit') or {})}
+    except Exception:
+        return dict(_DEFAULTS)
+
+
+def is_failure(status: int) -> Optional[bool]:
+    """Outcome of a response for breaker purposes: network error/5xx fail, 429 is not judged (None)"""
+    if status == 429:
+        return None
+    return status == 0 or status >= 500
+
+
+class CircuitBreaker:
+    def __init__(self, key: Tuple[str, str], settings: Optional[dict] = None):
+        s = settings or _settings()
+        self.key = key
+        self.window_sec = float(s['window_sec'])
+        self.min_calls = int(s['min_calls'])
+        self.error_rate = float(s['error_rate'])
+        self.base_cooldown = float(s['cooldown_sec'])
+        self.max_cooldown = float(s['max_cooldown_sec'])
+        self.max_wait = float(s['max_wait_sec'])
+        self._cond = threading.Condition()
+        self._outcomes = deque()  # (monotonic ts, failed)
+        self._state = CLOSED
+        self._cooldown = self.base_cooldown
+        self._open_until = 0.0
+        self._probe_out = False
+        self._watchers: List[Callable[[], None]] = []
+
+    @property
+    def state(self) -> str:
+        with self._cond:
+            self._tick(time.monotonic())
+            return self._state
+
+    def _tick(self, now: float):
+        if self._state == OPEN and now >= self._open_until:
+            self._state = HALF_OPEN
+            self._probe_out = False
+
+    def try_acquire(self) -> Tuple[bool, float]:
+        """Non-blocking: (allowed, seconds to wait before asking again)"""
+        with self._cond:
+            now = time.monotonic()
+            self._tick(now)
+            if self._state == CLOSED:
+                return True, 0.0
+            if self._state == HALF_OPEN:
+                if not self._probe_out:
+                    self._probe_out = True
+                    return True, 0.0
+                return False, 1.0
+            return False, max(0.05, self._open_until - now)
+
+    def acquire(self, wait: Optional[float] = None):
+        """
+        Block until a request may go out (closed, or this caller is the half-open probe)
+
+        Args:
+            wait: Max seconds to wait for recovery (default resilience.circuit.max_wait_sec; 0 = fail fast)
+
+        Raises:
+            CircuitOpenError: still open after `wait`
+        """
+        wait = self.max_wait if wait is None else wait
+        give_up_at = time.monotonic() + max(0.0, wait)
+        while True:
+            ok, retry_in = self.try_acquire()
+            if ok:
+                return
+            left = give_up_at - time.monotonic()
+            if left <= 0:
+                raise CircuitOpenError(self.key, retry_in)
+            with self._cond:
+                self._cond.wait(min(left, retry_in))
+
+    def add_watcher(self, fn: Callable[[], None]):
+        """Call fn (from the reporting thread; it must not block) when a waiting caller may proceed"""
+        with self._cond:
+            self._watchers.append(fn)
+
+    def remove_watcher(self, fn: Callable[[], None]):
+        with self._cond:
+            if fn in self._watchers:
+                self._watchers.remove(fn)
+
+    def record(self, failed: Optional[bool]):
+        """Report the outcome of an acquired request (None = not judged, e.g. 429)"""
+        with self._cond:
+            now = time.monotonic()
+            if self._state == HALF_OPEN:
+                if failed is None:
+                    self._probe_out = False
+                elif failed:
+                    self._trip(now, escalate=True)
+                else:
+                    self._state = CLOSED
+                    self._cooldown = self.base_cooldown
+                    self._outcomes.clear()
+                self._cond.notify_all()
+                for fn in list(self._watchers):
+                    try: fn()
+                    except Exception: pass
+                return
+            if failed is None or self._state != CLOSED:
+                return
+            self._outcomes.append((now, failed))
+            while self._outcomes and now - self._outcomes[0][0] > self.window_sec:
+                self._outcomes.popleft()
+            calls = len(self._outcomes)
+            fails = sum(1 for _, f in self._outcomes if f)
+            if calls >= self.min_calls and fails / calls >= self.error_rate:
+                self._trip(now, escalate=False)
+
+    def record_status(self, status: int):
+        self.record(is_failure(status))
+
+    def _trip(self, now: float, escalate: bool):
+        if escalate:
+            self._cooldown = min(self._cooldown * 2, self.max_cooldown)
+        self._state = OPEN
+        self._open_until = now + self._cooldown
+        self._probe_out = False
+        self._outcomes.clear()
+
+    def stats(self) -> dict:
+        with self._cond:
+            now = time.monotonic()
+            self._tick(now)
+            calls = len(self._outcomes)
+            fails = sum(1 for _, f in self._outcomes if f)
+            return {'key': self.key, 'state': self._state, 'calls': calls, 'failures': fails,
+                    'open_for': max(0.0, self._open_until - now) if self._state == OPEN else 0.0}
+
+
+_BREAKERS: Dict[Tuple[str, str], CircuitBreaker] = {}
+_LOCK = threading.Lock()
+
+
+def endpoint_key(url: str) -> Tuple[str, str]:
+    """(provider or host, path) - query strings (API keys) are dropped"""
+    from services.transport import provider_of
+    parts = urlsplit(url)
+    return (provider_of(url) or (parts.hostname or ''), parts.path or '/')
+
+
+def breaker_for(url: str) -> CircuitBreaker:
+    key = endpoint_key(url)
+    br = _BREAKERS.get(key)
+    if br is None:
+        with _LOCK:
+            br = _BREAKERS.get(key)
+            if br is None:
+                br = CircuitBreaker(key)
+                _BREAKERS[key] = br
+    return br
+
+
+def all_stats():
+    """Snapshot of every breaker (for diagnostics views)"""
+    return [br.stats() for br in list(_BREAKERS.values())]
@@ -2,77 +2,55 @@
 """
 Unified Configuration Loader - Single source for all configuration loading
 Replaces all duplicate _cfg() implementations across services
+
+Shares one immutable snapshot with utils.config: the file is re-parsed only when
+its mtime changes, and subscribe() callbacks fire on every change.
 """
-import json
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any
+
+from utils import config as _store
+from utils.config import subscribe, unsubscribe, thaw, version  # noqa: F401  (re-exported)
 
-CFG_PATH = Path.home() / ".veo_image2video_cfg.json"
-_CACHE: Optional[Dict[str, Any]] = None
+CFG_PATH = Path(_store.CFG_PATH)
+
+# Defaults when no config file exists yet
+_DEFAULTS = _store._freeze({
+    "google_api_keys": [],
+    "labs_tokens": [],
+    "download_root": str(Path.home() / "Downloads")
+})
 
 
 def load(force_reload: bool = False) -> Dict[str, Any]:
     """
-    Load configuration from file (cached for performance)
-    
+    Load configuration (read-only snapshot, re-read only when the file changes)
+
     Args:
-        force_reload: If True, bypass cache and reload from disk
-        
+        force_reload: If True, re-read the file even if its mtime is unchanged
+
     Returns:
-        Configuration dictionary
+        Configuration mapping (use thaw() for a mutable copy)
     """
-    global _CACHE
-    
-    if _CACHE is not None and not force_reload:
-        return _CACHE
-    
-    if CFG_PATH.exists():
-        try:
-            with open(CFG_PATH, "r", encoding="utf-8") as f:
-                _CACHE = json.load(f)
-                return _CACHE
-        except Exception:
-            # If file is corrupted, return default config
-            pass
-    
-    # Default configuration
-    _CACHE = {
-        "google_api_keys": [],
-        "labs_tokens": [],
-        "download_root": str(Path.home() / "Downloads")
-    }
-    return _CACHE
+    if force_reload:
+        _store.reset()
+    snap = _store.snapshot()
+    return snap if snap is not None else _DEFAULTS
 
 
 def save(cfg: Dict[str, Any]) -> bool:
     """
     Save configuration to file (atomic write)
-    
+
     Args:
         cfg: Configuration dictionary to save
-        
+
     Returns:
         True if successful, False otherwise
     """
-    global _CACHE
-    
-    try:
-        # Atomic write using temporary file
-        temp_path = CFG_PATH.with_suffix('.tmp')
-        with open(temp_path, "w", encoding="utf-8") as f:
-            json.dump(cfg, f, indent=2, ensure_ascii=False)
-        
-        # Rename is atomic on most filesystems
-        temp_path.replace(CFG_PATH)
-        
-        # Update cache
-        _CACHE = cfg
-        return True
-    except Exception:
-        return False
+    return _store.write(cfg)
 
 
 def clear_cache():
     """Clear the configuration cache (useful for testing)"""
-    global _CACHE
-    _CACHE = None
+    _store.reset()
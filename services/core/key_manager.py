@@ -3,39 +3,169 @@
 Unified API Key Management - Single source for all key rotation and management
 Replaces all duplicate key management implementations across services
 """
-from typing import List
+from typing import Dict, List, Optional
+import atexit
+import hashlib
+import json
+import random
 import threading
-from services.core.config import load as load_config
+import time
+from pathlib import Path
+from services.core.config import load as load_config, subscribe, version as config_version
+
+HEALTH_PATH = Path.home() / ".veo_key_health.json"
+_SAVE_INTERVAL = 30.0  # seconds between health snapshots on disk
+
+# Cooldowns (seconds) by status when the caller has no server hint
+COOLDOWNS = {401: 6 * 3600, 403: 3600, 429: 60}
+_ALPHA = 0.2  # EWMA weight of the newest sample
+
+
+def _fingerprint(key: str) -> str:
+    """Stable id for persisting stats without writing the key itself to disk"""
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+
+class KeyHealth:
+    """Rolling health of one key"""
+    __slots__ = ('latency', 'error_rate', 'calls', 'last_401', 'last_403', 'last_429', 'cooldown_until')
+
+    def __init__(self, **kw):
+        self.latency: Optional[float] = kw.get('latency')
+        self.error_rate = float(kw.get('error_rate', 0.0))
+        self.calls = int(kw.get('calls', 0))
+        self.last_401 = float(kw.get('last_401', 0.0))
+        self.last_403 = float(kw.get('last_403', 0.0))
+        self.last_429 = float(kw.get('last_429', 0.0))
+        self.cooldown_until = float(kw.get('cooldown_until', 0.0))
+
+    def to_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def available(self, now: float) -> bool:
+        return self.cooldown_until <= now
+
+    def score(self) -> float:
+        """Selection weight: low error rate and low latency win"""
+        lat = self.latency if self.latency else 1.0
+        return (1.0 - self.error_rate) ** 2 / max(0.05, lat) + 1e-3
 
 
 class KeyPool:
-    """Thread-safe round-robin key pool"""
+    """Thread-safe key pool weighted toward healthy keys"""
     
     def __init__(self):
         self._keys: List[str] = []
-        self._index = 0
+        self._health: Dict[str, KeyHealth] = {}
         self._lock = threading.Lock()
     
     def get_next(self) -> str:
-        """Get next key in rotation"""
+        """Get a key: weighted random among keys out of cooldown, else the one freed soonest"""
         with self._lock:
             if not self._keys:
                 return ""
-            key = self._keys[self._index % len(self._keys)]
-            self._index += 1
-            return key
+            now = time.time()
+            ready = [k for k in self._keys if self._h(k).available(now)]
+            if not ready:
+                return min(self._keys, key=lambda k: self._h(k).cooldown_until)
+            return random.choices(ready, weights=[self._h(k).score() for k in ready])[0]
     
     def set_keys(self, keys: List[str]):
-        """Set the list of keys"""
+        """Set the list of keys (health of keys still present is kept)"""
         with self._lock:
-            self._keys = [k for k in keys if k]
-            self._index = 0
+            self._keys = list(dict.fromkeys(k for k in keys if k))
     
     def get_all(self) -> List[str]:
         """Get all keys (snapshot)"""
         with self._lock:
             return list(self._keys)
 
+    def ranked(self) -> List[str]:
+        """Keys out of cooldown, healthiest first; if all are cooling down, soonest-free first"""
+        with self._lock:
+            now = time.time()
+            ready = sorted((k for k in self._keys if self._h(k).available(now)), key=lambda k: -self._h(k).score())
+            if ready:
+                return ready
+            return sorted(self._keys, key=lambda k: self._h(k).cooldown_until)
+
+    def report(self, key: str, status: int, latency: Optional[float] = None, cooldown: Optional[float] = None):
+        """
+        Record the outcome of a request made with `key`
+
+        Args:
+            key: The key used
+            status: HTTP status (0 = network error)
+            latency: Seconds the call took
+            cooldown: Server-suggested wait for 429 (overrides COOLDOWNS)
+        """
+        if not key:
+            return
+        with self._lock:
+            h = self._h(key)
+            now = time.time()
+            failed = status == 0 or status >= 500 or status in COOLDOWNS
+            h.calls += 1
+            h.error_rate = (1 - _ALPHA) * h.error_rate + _ALPHA * (1.0 if failed else 0.0)
+            if latency is not None and 200 <= status < 300:
+                h.latency = latency if h.latency is None else (1 - _ALPHA) * h.latency + _ALPHA * latency
+            if status in COOLDOWNS:
+                setattr(h, f'last_{status}', now)
+                wait = cooldown if (status == 429 and cooldown is not None) else COOLDOWNS[status]
+                h.cooldown_until = max(h.cooldown_until, now + wait)
+            elif 200 <= status < 300:
+                h.cooldown_until = 0.0
+
+    def stats(self) -> List[dict]:
+        """Per-key health (keys shown as ...suffix)"""
+        with self._lock:
+            return [{'key': f"...{k[-6:]}", **self._h(k).to_dict()} for k in self._keys]
+
+    def _h(self, key: str) -> KeyHealth:
+        h = self._health.get(key)
+        if h is None:
+            h = _STORED.pop(_fingerprint(key), None) or KeyHealth()
+            self._health[key] = h
+        return h
+
+    def _dump(self) -> Dict[str, dict]:
+        with self._lock:
+            return {_fingerprint(k): h.to_dict() for k, h in self._health.items()}
+
+
+def _load_health() -> Dict[str, KeyHealth]:
+    try:
+        with open(HEALTH_PATH, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        return {fp: KeyHealth(**d) for fp, d in raw.items() if isinstance(d, dict)}
+    except Exception:
+        return {}
+
+
+_STORED = _load_health()
+_last_save = 0.0
+_SAVE_LOCK = threading.Lock()
+
+
+def save_health(force: bool = False):
+    """Persist key health (throttled to one write per _SAVE_INTERVAL unless forced)"""
+    global _last_save
+    with _SAVE_LOCK:
+        now = time.monotonic()
+        if not force and now - _last_save < _SAVE_INTERVAL:
+            return
+        _last_save = now
+        data = {fp: h.to_dict() for fp, h in _STORED.items()}
+        for pool in _POOLS.values():
+            data.update(pool._dump())
+        try:
+            tmp = HEALTH_PATH.with_suffix('.tmp')
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            tmp.replace(HEALTH_PATH)
+        except Exception:
+            pass
+
 
 # Global key pools for each provider
 _POOLS = {
@@ -46,9 +176,24 @@ _POOLS = {
 }
 
 
+_BUILT_VERSION = None
+
+
 def refresh():
-    """Refresh all key pools from configuration"""
-    cfg = load_config()
+    """Make sure key pools match the config (pools are rebuilt only when the file changed)"""
+    cfg = load_config()  # mtime check; a changed file notifies _on_config_change
+    if _BUILT_VERSION != config_version():
+        _rebuild(cfg)
+
+
+def _on_config_change(old, new):
+    _rebuild(load_config())
+
+
+def _rebuild(cfg):
+    """Rebuild all key pools from configuration"""
+    global _BUILT_VERSION
+    _BUILT_VERSION = config_version()
     
     # Google keys
     google_keys = []
@@ -77,8 +222,8 @@ def refresh():
             labs_tokens.append(t)
     _POOLS['labs'].set_keys(labs_tokens)
     
-    # OpenAI keys
-    openai_keys = cfg.get('openai_api_keys', [])
+    # OpenAI keys (copy: appending must not mutate the cached config)
+    openai_keys = list(cfg.get('openai_api_keys', []))
     if cfg.get('openai_api_key'):
         openai_keys.append(cfg['openai_api_key'])
     _POOLS['openai'].set_keys(openai_keys)
@@ -98,10 +243,48 @@ def get_key(provider: str) -> str:
     Returns:
         API key or empty string if none available
     """
-    refresh()  # Always refresh to get latest config
+    refresh()  # cheap unless the config file changed
     return _POOLS.get(provider, KeyPool()).get_next()
 
 
+def ranked_keys(provider: str) -> List[str]:
+    """
+    Keys for provider, healthiest first, skipping keys in cooldown
+    
+    Args:
+        provider: Provider name
+        
+    Returns:
+        Keys to try in order (all keys by cooldown end if every key is cooling down)
+    """
+    refresh()
+    return _POOLS.get(provider, KeyPool()).ranked()
+
+
+def report(provider: str, key: str, status: int, latency: Optional[float] = None,
+           cooldown: Optional[float] = None):
+    """Record a request outcome for a key (see KeyPool.report); persisted periodically"""
+    pool = _POOLS.get(provider)
+    if pool is None:
+        return
+    pool.report(key, status, latency, cooldown)
+    save_health()
+
+
+def is_available(provider: str, key: str) -> bool:
+    """False while the key sits in a 401/403/429 cooldown"""
+    pool = _POOLS.get(provider)
+    if pool is None or not key:
+        return True
+    with pool._lock:
+        return pool._h(key).available(time.time())
+
+
+def key_stats(provider: str) -> List[dict]:
+    """Health snapshot for provider keys"""
+    return _POOLS.get(provider, KeyPool()).stats()
+
+
 def get_all_keys(provider: str) -> List[str]:
     """
     Get all keys for provider
@@ -137,3 +320,7 @@ def rotated_list(provider: str, base_list: List[str]) -> List[str]:
     
     # Move key to front
     return [key] + [x for x in base_list if x != key]
+
+
+subscribe(_on_config_change)
+atexit.register(save_health, True)
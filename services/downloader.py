@@ -0,0 +1,458 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming, resumable, parallel video downloads
+Every download path (project panel, headless runner, text2video panel, sales pipeline) used to
+read a whole MP4 into memory with one GET, one file at a time, and start again from byte zero
+after any failure. download_file() streams into "<dest>.part" in chunks; after a dropped
+connection, a short read or a 5xx it continues with an HTTP Range request from the bytes already
+on disk (retries follow the 'download' retry policy, and an attempt that made progress does not
+count against it). Files of split_min_mb or more on servers that honour Range are fetched as
+`parts` parallel ranges into one preallocated .part whose progress is kept in "<dest>.part.json",
+so an interrupted split download resumes as well. The finished file is renamed onto dest and
+added to the artifact store (services.artifact_store); a file the store already holds under one
+of the download's keys is linked into place without touching the network.
+
+At most `concurrency` files transfer at once in the process (submit() queues the rest on a shared
+pool), and every transfer draws from one bandwidth budget (max_kbps, 0 = unlimited).
+
+Config (optional)::
+
+    "download": {"concurrency": 4, "chunk_kb": 256, "split_min_mb": 16, "parts": 4, "max_kbps": 0}
+"""
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+import requests
+
+from services import artifact_store, transport
+from services.core.config import load as load_config
+from services.http_retry import RETRY_STATUS, plan_retry
+from services.retry_policy import policy_for
+
+_DEFAULTS = {'concurrency': 4, 'chunk_kb': 256, 'split_min_mb': 16, 'parts': 4, 'max_kbps': 0}
+_CONTENT_RANGE = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+|\*)', re.I)
+_STAR_RANGE = re.compile(r'bytes\s+\*/(\d+)', re.I)
+STATE_SAVE_SEC = 1.0
+
+ProgressFn = Callable[[int, Optional[int]], None]
+
+
+def _settings() -> dict:
+    return {**_DEFAULTS, **(load_config().get('download') or {})}
+
+
+class DownloadError(RuntimeError):
+    """A download that retrying won't fix (HTTP status, attempts exhausted, stopped)"""
+
+    def __init__(self, msg: str, status: int = 0):
+        super().__init__(msg)
+        self.status = status
+
+
+class _NoRange(DownloadError):
+    """The server answered a range request with the whole file"""
+
+
+class _Retry(Exception):
+    """Transient failure of one attempt (retryable status or a short read)"""
+
+    def __init__(self, status: int = 0, headers=None):
+        super().__init__(f"HTTP {status}" if status else "short read")
+        self.status, self.headers = status, headers
+
+
+class Bandwidth:
+    """Token bucket shared by every transfer (bytes/s, 0 = unlimited, bursts up to one second)"""
+
+    def __init__(self, rate: float = 0.0):
+        self.rate = max(0.0, float(rate))
+        self._tokens = 0.0
+        self._t = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self.rate = max(0.0, float(rate))
+
+    def take(self, n: int):
+        """Account for n bytes; sleeps while the budget is overdrawn"""
+        with self._lock:
+            if self.rate <= 0:
+                return
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._t) * self.rate)
+            self._t = now
+            self._tokens -= n
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class _Gate:
+    """Process-wide cap on files transferring at once (the limit follows the config)"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.active = 0
+
+    def __enter__(self):
+        with self._cond:
+            while self.active >= concurrency():
+                self._cond.wait(1.0)
+            self.active += 1
+        return self
+
+    def __exit__(self, *exc):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+
+_BANDWIDTH = Bandwidth()
+_GATE = _Gate()
+_POOL: Optional[ThreadPoolExecutor] = None
+_INFLIGHT: Dict[str, Future] = {}
+_DESTS: Dict[str, list] = {}   # abs dest -> [lock, users]: one transfer per .part at a time
+_LOCK = threading.Lock()
+
+
+@contextmanager
+def _dest_lock(dest: str):
+    key = os.path.abspath(dest)
+    with _LOCK:
+        e = _DESTS.setdefault(key, [threading.Lock(), 0]); e[1] += 1
+    try:
+        with e[0]:
+            yield
+    finally:
+        with _LOCK:
+            e[1] -= 1
+            if not e[1]: _DESTS.pop(key, None)
+
+
+def _get(url: str, start: int, end: Optional[int], timeout):
+    headers = {'Accept-Encoding': 'identity'}
+    if start or end is not None:
+        headers['Range'] = f"bytes={start}-{'' if end is None else end}"
+    return transport.get(url, headers=headers, stream=True, timeout=timeout, allow_redirects=True)
+
+
+def _check(r, start: int):
+    """Raise for statuses that can't carry the requested bytes"""
+    if r.status_code in RETRY_STATUS or r.status_code == 408:
+        raise _Retry(r.status_code, r.headers)
+    if r.status_code not in (200, 206):
+        raise DownloadError(f"HTTP {r.status_code}", r.status_code)
+    if r.status_code == 206:
+        m = _CONTENT_RANGE.match(r.headers.get('Content-Range') or '')
+        if not m or int(m.group(1)) != start:
+            raise _Retry()
+
+
+def _total(r) -> Optional[int]:
+    cr = r.headers.get('Content-Range') or ''
+    m = _CONTENT_RANGE.match(cr) or _STAR_RANGE.match(cr)
+    if m and m.groups()[-1] != '*':
+        return int(m.groups()[-1])
+    if r.status_code == 200 and r.headers.get('Content-Length'):
+        return int(r.headers['Content-Length'])
+    return None
+
+
+def _pump(r, f, pos: int, end: Optional[int], chunk: int, on_bytes: Callable[[int], None],
+          should_stop: Optional[Callable[[], bool]]) -> int:
+    """Copy the response body into f from offset pos (up to end inclusive); returns the new offset"""
+    for data in r.iter_content(chunk):
+        if not data:
+            continue
+        if end is not None:
+            data = data[:end + 1 - pos]
+        _BANDWIDTH.take(len(data))
+        f.write(data)
+        pos += len(data)
+        on_bytes(len(data))
+        if should_stop and should_stop():
+            raise DownloadError("Đã dừng tải")
+        if end is not None and pos > end:
+            break
+    return pos
+
+
+def _retrying(url: str, attempt_fn: Callable[[], object], progress: Callable[[], int],
+              should_stop: Optional[Callable[[], bool]]):
+    """Run attempt_fn until it returns; attempts that moved bytes reset the attempt count"""
+    pol = policy_for(url, endpoint='download')
+    attempt = 0
+    while True:
+        before = progress()
+        try:
+            return attempt_fn()
+        except _Retry as e:
+            status, headers, err = e.status, e.headers, e
+        except requests.RequestException as e:
+            status, headers, err = 0, None, e
+        attempt = 1 if progress() > before else attempt + 1
+        delay, _ = plan_retry(attempt, status=status, headers=headers, policy=pol)
+        if delay is None:
+            raise DownloadError(f"Tải thất bại sau {attempt} lần thử: {err}", status)
+        end = time.monotonic() + delay
+        while time.monotonic() < end:
+            if should_stop and should_stop():
+                raise DownloadError("Đã dừng tải")
+            time.sleep(min(0.25, max(0.0, end - time.monotonic())))
+
+
+class _Job:
+    """One file: destination, progress counter and the caller's hooks"""
+
+    def __init__(self, url: str, dest: str, s: dict, on_progress: Optional[ProgressFn],
+                 should_stop: Optional[Callable[[], bool]]):
+        self.url, self.dest, self.part, self.state_path = url, dest, dest + ".part", dest + ".part.json"
+        self.chunk = max(16, int(s['chunk_kb'])) * 1024
+        self.split_min = float(s['split_min_mb']) * 1024 * 1024
+        self.parts = max(1, int(s['parts']))
+        self.timeout = policy_for(url, endpoint='download').timeout
+        self.on_progress, self.should_stop = on_progress, should_stop
+        self.done = 0
+        self.total: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def add(self, n: int):
+        with self._lock:
+            self.done += n
+        if self.on_progress:
+            try: self.on_progress(self.done, self.total)
+            except Exception: pass
+
+    # ---- single stream ------------------------------------------------------
+    def single(self):
+        _retrying(self.url, self._single_attempt, lambda: self.done, self.should_stop)
+
+    def _single_attempt(self):
+        offset = self.done = os.path.getsize(self.part) if os.path.exists(self.part) else 0
+        with _get(self.url, offset, None, self.timeout) as r:
+            if r.status_code == 416:
+                total = _total(r)
+                if total is not None and offset == total:
+                    self.total = total
+                    return
+                open(self.part, "wb").close()   # stale .part larger than the file
+                self.done = 0
+                raise _Retry()
+            _check(r, offset)
+            if r.status_code == 200:
+                offset = self.done = 0          # server ignored Range: start over
+            self.total = _total(r)
+            with open(self.part, "ab" if offset else "wb") as f:
+                pos = _pump(r, f, offset, None, self.chunk, self.add, self.should_stop)
+        if self.total is not None and pos < self.total:
+            raise _Retry()
+
+    # ---- parallel ranges ----------------------------------------------------
+    def probe(self) -> Optional[int]:
+        """Total size when the server serves ranges and the file is worth splitting"""
+        try:
+            with _get(self.url, 0, 0, self.timeout) as r:
+                if r.status_code != 206:
+                    return None
+                total = _total(r)
+        except requests.RequestException:
+            return None
+        return total if total and total >= self.split_min else None
+
+    def _load_state(self) -> Optional[dict]:
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                st = json.load(f)
+            if os.path.getsize(self.part) == st['total'] and st.get('segments'):
+                return st
+        except Exception:
+            pass
+        return None
+
+    def _save_state(self, st: dict):
+        try:
+            tmp = self.state_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(st, f)
+            os.replace(tmp, self.state_path)
+        except OSError:
+            pass
+
+    def split(self, st: Optional[dict] = None):
+        """Fetch the file as parallel ranges (new, or resuming a saved state)"""
+        if st is None:
+            total = self.total
+            n = min(self.parts, max(1, total // (1024 * 1024)))
+            step = -(-total // n)
+            st = {'total': total, 'segments': [[a, min(a + step, total) - 1, 0] for a in range(0, total, step)]}
+            with open(self.part, "wb") as f:
+                f.truncate(total)
+            self._save_state(st)
+        self.total = st['total']
+        self.done = sum(seg[2] for seg in st['segments'])
+        state_lock = threading.Lock()
+        saved = [time.monotonic()]
+
+        def note(seg, n):
+            with state_lock:
+                seg[2] += n
+                due = time.monotonic() - saved[0] >= STATE_SAVE_SEC
+                if due: saved[0] = time.monotonic()
+            if due: self._save_state(st)
+            self.add(n)
+
+        def run(seg):
+            def attempt():
+                start = seg[0] + seg[2]
+                if start > seg[1]:
+                    return
+                with _get(self.url, start, seg[1], self.timeout) as r:
+                    if r.status_code == 200:
+                        raise _NoRange("Máy chủ bỏ qua Range")
+                    _check(r, start)
+                    with open(self.part, "r+b") as f:
+                        f.seek(start)
+                        pos = _pump(r, f, start, seg[1], self.chunk, lambda n: note(seg, n), self.should_stop)
+                if pos <= seg[1]:
+                    raise _Retry()
+            _retrying(self.url, attempt, lambda: seg[2], self.should_stop)
+
+        todo = [seg for seg in st['segments'] if seg[0] + seg[2] <= seg[1]]
+        try:
+            if len(todo) == 1:
+                run(todo[0])
+            elif todo:
+                with ThreadPoolExecutor(len(todo), thread_name_prefix="download-part") as pool:
+                    for fut in [pool.submit(run, seg) for seg in todo]:
+                        fut.result()
+        finally:
+            self._save_state(st)
+
+
+def download_file(url: str, dest: str, on_progress: Optional[ProgressFn] = None,
+                  should_stop: Optional[Callable[[], bool]] = None, keys: Iterable[str] = ()) -> str:
+    """
+    Download url to dest (streamed, resumable, split into ranges when large)
+
+    Args:
+        url: File URL (signed video URLs included)
+        dest: Local path; bytes land in dest + ".part" until the file is complete
+        on_progress: Called with (bytes so far, total or None) from the transferring threads
+        should_stop: Polled between chunks and retry waits
+        keys: Artifact store keys for the content (e.g. artifact_store.op_key(op)); the URL's
+            own key is always added
+
+    Returns:
+        dest
+
+    Raises:
+        DownloadError: non-retryable HTTP status, retries exhausted, or stopped (the .part is
+        kept, so a later call resumes)
+    """
+    keys = [*keys, artifact_store.url_key(url)]
+    # callers that bypass submit() for the same dest wait here instead of sharing the .part
+    with _dest_lock(dest):
+        return _download(url, dest, on_progress, should_stop, keys)
+
+
+def _download(url: str, dest: str, on_progress: Optional[ProgressFn], should_stop: Optional[Callable[[], bool]],
+              keys: List[str]) -> str:
+    if artifact_store.fetch_cached(keys, dest):
+        return dest
+    s = _settings()
+    _BANDWIDTH.set_rate(float(s['max_kbps'] or 0) * 1024)
+    os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+    job = _Job(url, dest, s, on_progress, should_stop)
+    with _GATE:
+        st = job._load_state() if os.path.exists(job.state_path) else None
+        if st is None and os.path.exists(job.state_path):
+            # split progress that doesn't match the .part: nothing in it can be trusted
+            for p in (job.part, job.state_path):
+                try: os.remove(p)
+                except OSError: pass
+        try:
+            total = None if st is not None or job.parts < 2 or os.path.exists(job.part) else job.probe()
+            if st is not None or total:
+                job.total = total
+                job.split(st)
+            else:
+                job.single()
+        except _NoRange:
+            # the server stopped serving ranges halfway: fetch the whole file in one stream
+            for p in (job.part, job.state_path):
+                try: os.remove(p)
+                except OSError: pass
+            job.single()
+    os.replace(job.part, dest)
+    try: os.remove(job.state_path)
+    except OSError: pass
+    artifact_store.ingest(dest, keys)
+    return dest
+
+
+def concurrency() -> int:
+    """Files transferred at once (download.concurrency)"""
+    return max(1, int(_settings()['concurrency']))
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _POOL
+    with _LOCK:
+        if _POOL is None:
+            _POOL = ThreadPoolExecutor(concurrency(), thread_name_prefix="download")
+        return _POOL
+
+
+def submit(url: str, dest: str, on_done: Optional[Callable[[str, Optional[BaseException]], None]] = None,
+           on_progress: Optional[ProgressFn] = None, should_stop: Optional[Callable[[], bool]] = None,
+           keys: Iterable[str] = ()) -> Future:
+    """
+    Queue a download on the shared pool
+
+    A dest already queued or transferring returns the same future (on_done is then not attached).
+
+    Args:
+        on_done: Called on the worker thread with (dest, None) or (dest, error)
+
+    Returns:
+        Future resolving to dest (or raising DownloadError / OSError)
+    """
+    key = os.path.abspath(dest)
+    with _LOCK:
+        fut = _INFLIGHT.get(key)
+        if fut is not None:
+            return fut
+
+    def work():
+        err = None
+        try:
+            return download_file(url, dest, on_progress, should_stop, keys)
+        except BaseException as e:
+            err = e
+            raise
+        finally:
+            with _LOCK:
+                _INFLIGHT.pop(key, None)
+            if on_done:
+                try: on_done(dest, err)
+                except Exception: pass
+
+    pool = _pool()
+    with _LOCK:
+        fut = _INFLIGHT.get(key)
+        if fut is None:
+            fut = _INFLIGHT[key] = pool.submit(work)
+    return fut
+
+
+def pending() -> List[str]:
+    """Destinations queued or transferring"""
+    with _LOCK:
+        return list(_INFLIGHT)
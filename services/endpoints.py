@@ -1,5 +1,23 @@
-LABS_BASE='https://aisandbox-pa.googleapis.com'
+# Labs/Flow endpoints. Both bases can point at a local stand-in (tools/labs_standin.py) for testing;
+# they are read once at import, so changing them needs a restart.
+#
+# Config (optional): "labs": {"base_url": "https://aisandbox-pa.googleapis.com", "flow_base_url": "https://labs.google/fx"}
+from urllib.parse import urlsplit
+
+try:
+    from services.core.config import load as _load_config
+    _labs_cfg = _load_config().get('labs') or {}
+except Exception:  # pragma: no cover
+    _labs_cfg = {}
+
+LABS_BASE=(_labs_cfg.get('base_url') or 'https://aisandbox-pa.googleapis.com').rstrip('/')
+FLOW_BASE=(_labs_cfg.get('flow_base_url') or 'https://labs.google/fx').rstrip('/')
 UPLOAD_IMAGE_URL=f"{LABS_BASE}/v1:uploadUserImage"
 T2V_URL=f"{LABS_BASE}/v1/video:batchAsyncGenerateVideoText"
 I2V_URL=f"{LABS_BASE}/v1/video:batchAsyncGenerateVideoStartImage"
 BATCH_CHECK_URL=f"{LABS_BASE}/v1/video:batchCheckAsyncVideoGenerationStatus"
+PROJECT_CREATE_URL=f"{FLOW_BASE}/api/trpc/project.createProject"
+PROJECT_GET_URL=f"{FLOW_BASE}/api/trpc/project.getProject"
+
+# hosts served as the 'labs' provider (limits, pools, retry policy) when the bases are overridden
+LABS_HOSTS=frozenset(h for h in ((urlsplit(LABS_BASE).hostname or '').lower(), (urlsplit(FLOW_BASE).hostname or '').lower()) if h)
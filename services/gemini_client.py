@@ -2,7 +2,11 @@
 import requests, time, random
 from typing import List, Optional
 from services.core.config import load as load_config
-from services.core.key_manager import get_all_keys, refresh
+from services import transport
+from services import rate_limiter
+from services.circuit_breaker import breaker_for
+from services.api_clients import report_outcome
+from services.core.key_manager import get_all_keys, ranked_keys, refresh
 from services.core.api_config import GEMINI_TEXT_MODEL, gemini_text_endpoint
 
 class MissingAPIKey(Exception): pass
@@ -13,22 +17,35 @@ class GeminiClient:
         if api_key: keys = [api_key] + [k for k in keys if k != api_key]
         self.keys = list(dict.fromkeys(keys))
         if not self.keys: raise MissingAPIKey("Chưa nhập Google API Key trong Cài đặt.")
-        random.shuffle(self.keys); self.rr=0; self.model=model or GEMINI_TEXT_MODEL
-    def _next_key(self): k=self.keys[self.rr%len(self.keys)]; self.rr+=1; return k
+        random.shuffle(self.keys); self.model=model or GEMINI_TEXT_MODEL
+    def _next_key(self, tokens: int = 0):
+        healthy=set(ranked_keys('google'))  # keys in cooldown (401/403/429) are skipped
+        return rate_limiter.acquire_key('google', [k for k in self.keys if k in healthy] or self.keys, tokens)
     def _endpoint(self, key): return gemini_text_endpoint(key) if self.model == GEMINI_TEXT_MODEL else f"https://generativelanguage.googleapis.com/v1beta/models/{self.model}:generateContent?key={key}"
     def generate(self, system_text: str, user_text: str, timeout: int = 180)->str:
         last=None
+        tokens=(len(system_text)+len(user_text))//4  # rough estimate for tokens/min buckets
         for i in range(5):
-            key=self._next_key()
+            key=self._next_key(tokens)
             try:
                 body={"system_instruction":{"parts":[{"text":system_text}]},
                       "contents":[{"role":"user","parts":[{"text":user_text}]}]}
-                r=requests.post(self._endpoint(key), json=body, timeout=timeout)
+                url=self._endpoint(key); breaker=breaker_for(url)
+                breaker.acquire()  # CircuitOpenError propagates: model endpoint is down
+                t0=time.monotonic()
+                try:
+                    r=transport.post(url, json=body, timeout=timeout)
+                except requests.RequestException:
+                    breaker.record(True); report_outcome('google', key, 0); raise
+                breaker.record_status(r.status_code)
+                report_outcome('google', key, r.status_code, time.monotonic()-t0, r.headers, r.text)
                 if r.status_code in (429,408) or r.status_code>=500: raise requests.HTTPError(str(r.status_code), response=r)
                 r.raise_for_status()
                 data=r.json()
                 return data["candidates"][0]["content"]["parts"][0]["text"]
             except requests.RequestException as e:
-                last=e; time.sleep(1.5*(i+1)); continue
+                last=e
+                if len(self.keys)==1: time.sleep(1.5*(i+1))  # several keys: the limiter picks a fresh one
+                continue
         if last: raise last
         raise RuntimeError("Gemini không phản hồi")
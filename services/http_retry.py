@@ -1,59 +1,207 @@
 # -*- coding: utf-8 -*-
-import time, random, requests
-from typing import Dict, Any, Tuple
-
-
-# Optional overrides from user config (non-breaking)
-try:
-    from utils import config as _cfg_mod  # type: ignore
-    _cfg = getattr(_cfg_mod, "load", lambda: {})() if hasattr(_cfg_mod, "load") else {}
-    _res = _cfg.get("resilience", {}) if isinstance(_cfg, dict) else {}
-    RESILIENCE_OVERRIDES = {
-        "max_retries": _res.get("max_retries"),
-        "base_sleep": _res.get("base_sleep"),
-        "backoff_factor": _res.get("backoff_factor"),
-        "jitter": _res.get("jitter"),
-        "timeout": _res.get("timeout"),
-    }
-except Exception:
-    RESILIENCE_OVERRIDES = {}
-
-
-def _knob(name:str, default):
-    from services.core.config import load as load_config
-    c = load_config()
-    return c.get('resilience', {}).get(name, default)
+import time, random, re, json, requests
+from contextlib import nullcontext
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Tuple, Optional, Callable, List
+from services.transport import session_for, provider_of
+from services.resilience import acquire
+from services.circuit_breaker import breaker_for, CircuitOpenError
+from services.retry_policy import RetryPolicy, policy_for
+
 
 RETRY_STATUS = {429, 500, 502, 503, 504}
 
-def _sleep(i:int):
-    # base_backoff_sec with full jitter; capped
-    base = min((_knob('base_backoff_sec', 1.2) ** i), _knob('max_backoff_sec', 30.0))
-    time.sleep(random.random() * base)
+# Process-wide listeners for retry decisions (diagnostics panels, logs)
+_LISTENERS: List[Callable[[dict], None]] = []
+
+def add_listener(fn:Callable[[dict], None]):
+    if fn not in _LISTENERS: _LISTENERS.append(fn)
+
+def remove_listener(fn:Callable[[dict], None]):
+    if fn in _LISTENERS: _LISTENERS.remove(fn)
+
+def _emit(on_event, kind:str, **kw):
+    ev = {"kind": kind, **kw}
+    for fn in ([on_event] if on_event else []) + list(_LISTENERS):
+        try: fn(ev)
+        except Exception: pass
+
+def backoff_delay(i:int, policy:Optional[RetryPolicy]=None)->float:
+    # policy backoff (default: base_backoff_sec with full jitter; capped)
+    return (policy or policy_for()).backoff(i)
+
+# --- server hints -----------------------------------------------------------
+_DURATION_PART = re.compile(r'([0-9]*\.?[0-9]+)(ms|h|m|s)')
+_RETRY_IN_TEXT = re.compile(r'retry in ([0-9]*\.?[0-9]+)\s*(ms|s)', re.I)
+
+def _header(headers, name:str) -> Optional[str]:
+    if not headers: return None
+    lname = name.lower()
+    for k, v in headers.items():
+        if str(k).lower() == lname: return v
+    return None
+
+def _parse_duration(value:str) -> Optional[float]:
+    """'1s', '6m0s', '20ms', '1h2m3.5s', '30.5s' or bare seconds -> seconds"""
+    v = (value or '').strip().lower()
+    if not v: return None
+    try:
+        return max(0.0, float(v))
+    except ValueError:
+        pass
+    total = 0.0; matched = False
+    for num, unit in _DURATION_PART.findall(v):
+        matched = True
+        total += float(num) * {'ms': 0.001, 's': 1.0, 'm': 60.0, 'h': 3600.0}[unit]
+    return total if matched else None
+
+def _parse_retry_after(value:str) -> Optional[float]:
+    v = (value or '').strip()
+    if not v: return None
+    try:
+        return max(0.0, float(v))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(v).timestamp() - time.time())
+    except Exception:
+        return None
+
+def _openai_reset(headers) -> Optional[float]:
+    resets = []
+    for kind in ('requests', 'tokens'):
+        reset = _parse_duration(_header(headers, f'x-ratelimit-reset-{kind}') or '')
+        if reset is None: continue
+        remaining = _header(headers, f'x-ratelimit-remaining-{kind}')
+        resets.append((str(remaining).strip() == '0', reset))
+    if not resets: return None
+    exhausted = [r for hit, r in resets if hit]
+    return max(exhausted or [r for _, r in resets])
+
+def _google_retry_info(body:Any) -> Optional[float]:
+    if isinstance(body, (str, bytes)):
+        text = body.decode('utf-8', 'replace') if isinstance(body, bytes) else body
+        try:
+            body = json.loads(text)
+        except Exception:
+            m = _RETRY_IN_TEXT.search(text)
+            return _parse_duration(m.group(1) + m.group(2)) if m else None
+    err = (body or {}).get('error') if isinstance(body, dict) else None
+    if not isinstance(err, dict): return None
+    for d in err.get('details') or []:
+        if isinstance(d, dict) and str(d.get('@type', '')).endswith('google.rpc.RetryInfo'):
+            delay = _parse_duration(str(d.get('retryDelay', '')))
+            if delay is not None: return delay
+    m = _RETRY_IN_TEXT.search(str(err.get('message', '')))
+    return _parse_duration(m.group(1) + m.group(2)) if m else None
+
+def retry_hint(status:int, headers=None, body:Any=None) -> Tuple[Optional[float], str]:
+    """
+    Server-suggested wait before retrying
+
+    Args:
+        status: HTTP status code
+        headers: Response headers (any mapping)
+        body: Response body (text, bytes or parsed JSON)
+
+    Returns:
+        (seconds or None, source) where source is retry_after / ratelimit_reset / retry_info
+    """
+    ra = _parse_retry_after(_header(headers, 'Retry-After') or '')
+    if ra is not None: return ra, 'retry_after'
+    if status == 429:
+        reset = _openai_reset(headers)
+        if reset is not None: return reset, 'ratelimit_reset'
+    if status in RETRY_STATUS:
+        info = _google_retry_info(body)
+        if info is not None: return info, 'retry_info'
+    return None, ''
+
+def plan_retry(attempt:int, max_attempts:Optional[int]=None, *, status:int=0, headers=None, body:Any=None,
+               deadline_at:Optional[float]=None, policy:Optional[RetryPolicy]=None) -> Tuple[Optional[float], str]:
+    """
+    Retry decision shared by request_json, its async twin and LabsClient
+
+    max_attempts defaults to policy.max_attempts; policy supplies backoff and the hint cap.
+
+    Returns:
+        (delay, reason): delay is None when the call should give up
+        (attempts exhausted, or the wait would overrun the deadline budget)
+    """
+    policy = policy or policy_for()
+    if attempt >= (max_attempts or policy.max_attempts): return None, 'exhausted'
+    hint, source = retry_hint(status, headers, body) if status else (None, '')
+    if hint is not None:
+        # small positive jitter so clients released by the same reset don't stampede
+        delay = min(hint, float(policy.max_retry_after_sec)) * (1.0 + 0.1 * random.random())
+        reason = source
+    else:
+        delay, reason = policy.backoff(attempt), 'backoff'
+    if deadline_at is not None and time.monotonic() + delay >= deadline_at:
+        return None, 'deadline'
+    return delay, reason
+
+def _attempt_timeout(timeout, deadline_at:Optional[float]):
+    if deadline_at is None: return timeout
+    left = max(0.5, deadline_at - time.monotonic())
+    if isinstance(timeout, (tuple, list)): return (min(timeout[0], left), min(timeout[1], left))
+    return min(timeout, left)
 
 def request_json(method:str, url:str, *, headers:Dict[str,str]=None, params:Dict[str,Any]=None,
-                 json_body:Any=None, data:Any=None, timeout=None) -> Tuple[bool, Any, str, int, Dict[str,str]]:
-    sess = requests.Session()
-    max_attempts = int(_knob('max_attempts', 5))
-    timeout = timeout or (_knob('conn_timeout', 15), _knob('read_timeout', 60))
+                 json_body:Any=None, data:Any=None, timeout=None, deadline:Optional[float]=None,
+                 on_event:Optional[Callable[[dict], None]]=None,
+                 circuit_wait:Optional[float]=None,
+                 policy:Optional[RetryPolicy]=None) -> Tuple[bool, Any, str, int, Dict[str,str]]:
+    """
+    HTTP call with JSON decoding and server-hint aware retries
+
+    deadline: total seconds budget for the call including sleeps (default policy.deadline_sec)
+    on_event: receives {"kind": "retry"|"give_up", ...} decision events
+    circuit_wait: max seconds to wait for the endpoint's open circuit to recover (0 = fail fast)
+    policy: retry policy (default: policy_for(url) - provider/endpoint policy from config)
+    """
+    sess = session_for(url)
+    breaker = breaker_for(url)
+    policy = policy or policy_for(url)
+    max_attempts = policy.max_attempts
+    timeout = timeout or policy.timeout
+    deadline = deadline if deadline is not None else policy.deadline_sec
+    deadline_at = (time.monotonic() + float(deadline)) if deadline else None
+    provider = provider_of(url)
     last_err, last_code, last_headers = "", 0, {}
     for attempt in range(1, max_attempts+1):
+        status, body = 0, None
+        try:
+            breaker.acquire(circuit_wait)
+        except CircuitOpenError as e:
+            last_err = str(e)
+            _emit(on_event, "give_up", url=url, attempt=attempt, status=0, reason="circuit_open", error=last_err)
+            break
         try:
-            r = sess.request(method=method, url=url, headers=headers, params=params, json=json_body,
-                             data=data, timeout=timeout)
+            # adaptive provider slot is held only while the request is on the wire
+            with (acquire(provider) if provider else nullcontext()) as slot:
+                r = sess.request(method=method, url=url, headers=headers, params=params, json=json_body,
+                                 data=data, timeout=_attempt_timeout(timeout, deadline_at))
+                if slot: slot.done(r.status_code)
+            breaker.record_status(r.status_code)
             last_code = r.status_code; last_headers = dict(r.headers or {})
             if 200 <= r.status_code < 300:
                 try:
                     return True, (r.json() if r.content else {}), "", r.status_code, last_headers
                 except Exception:
                     return True, r.text, "", r.status_code, last_headers
-            if r.status_code in RETRY_STATUS:
-                last_err = f"HTTP {r.status_code}: {r.text[:300]}"
-                _sleep(attempt)
-                continue
-            return False, None, f"HTTP {r.status_code}: {r.text[:500]}", r.status_code, last_headers
+            if r.status_code not in RETRY_STATUS:
+                return False, None, f"HTTP {r.status_code}: {r.text[:500]}", r.status_code, last_headers
+            last_err = f"HTTP {r.status_code}: {r.text[:300]}"
+            status, body = r.status_code, r.text
         except requests.RequestException as e:
+            breaker.record(True)
             last_err = f"REQ ERR: {e}"
-            _sleep(attempt)
-            continue
+        delay, reason = plan_retry(attempt, max_attempts, status=status, headers=last_headers if status else None,
+                                   body=body, deadline_at=deadline_at, policy=policy)
+        if delay is None:
+            _emit(on_event, "give_up", url=url, attempt=attempt, status=status, reason=reason, error=last_err)
+            break
+        _emit(on_event, "retry", url=url, attempt=attempt, status=status, delay=round(delay, 3), reason=reason)
+        time.sleep(delay)
     return False, None, last_err or "exhausted", last_code, last_headers
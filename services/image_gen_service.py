@@ -2,12 +2,24 @@
 import os, base64, json, requests, mimetypes, uuid, time
 from typing import Optional, Dict, Any
 from services.core.api_config import GEMINI_IMAGE_MODEL, gemini_image_endpoint, IMAGE_GEN_TIMEOUT
-from services.core.key_manager import get_all_keys, refresh
+from services.core.key_manager import ranked_keys, refresh
+from services.api_clients import report_outcome
+from services import transport
+from services.http_retry import retry_hint, backoff_delay
+from services import rate_limiter
 
 
 class ImageGenError(Exception):
-    """Image generation error"""
-    pass
+    """Image generation error (retry_after: server-suggested wait in seconds, if any)"""
+    def __init__(self, message: str = "", retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _wait_hint(response, default: float) -> float:
+    """Retry-After / Google RetryInfo from a 429 response, else `default`"""
+    hint, _ = retry_hint(response.status_code, response.headers, response.text)
+    return default if hint is None else hint
 
 
 def generate_image_gemini(prompt: str, timeout: int = None, retry_delay: float = 2.5, log_callback=None) -> bytes:
@@ -32,15 +44,18 @@ def generate_image_gemini(prompt: str, timeout: int = None, retry_delay: float =
     
     timeout = timeout or IMAGE_GEN_TIMEOUT
     refresh()  # Refresh key pool
-    keys = get_all_keys('google')
+    keys = ranked_keys('google')  # healthiest first, keys in cooldown skipped
     if not keys:
         raise ImageGenError("No Google API keys available")
     
     log(f"[DEBUG] Tìm thấy {len(keys)} Google API keys")
     
-    # Try each key with retry logic
+    # Try each key with retry logic; the rate limiter hands out the soonest-available key
     last_error = None
-    for key_idx, api_key in enumerate(keys):
+    untried = list(keys)
+    for key_idx in range(len(keys)):
+        api_key = rate_limiter.acquire_key('google', untried, on_wait=lambda k, w: log(f"[INFO] Chờ {w:.1f}s cho quota key..."))
+        untried.remove(api_key)
         try:
             key_preview = f"...{api_key[-6:]}" if len(api_key) > 6 else "***"
             log(f"[INFO] Key {key_preview} (lần {key_idx + 1})")
@@ -59,7 +74,14 @@ def generate_image_gemini(prompt: str, timeout: int = None, retry_delay: float =
                 }
             }
             
-            response = requests.post(url, json=payload, timeout=timeout)
+            t0 = time.monotonic()
+            try:
+                response = transport.post(url, json=payload, timeout=timeout)
+            except requests.RequestException:
+                report_outcome('google', api_key, 0)
+                raise
+            # Server hint (Retry-After header or RetryInfo in the error body) keeps a 429'd key out of rotation
+            report_outcome('google', api_key, response.status_code, time.monotonic() - t0, response.headers, response.text)
             
             log(f"[DEBUG] HTTP {response.status_code}")
             
@@ -72,20 +94,19 @@ def generate_image_gemini(prompt: str, timeout: int = None, retry_delay: float =
                     continue  # Try next key now!
                 else:
                     log("[ERROR] All API keys are rate limited!")
-                    # Get retry-after for last key
-                    try:
-                        retry_after = int(response.headers.get('Retry-After', 60))
-                    except (ValueError, TypeError):
-                        retry_after = 60  # Fallback if header is invalid
-                    log(f"[INFO] Waiting {retry_after}s before final retry...")
-                    time.sleep(retry_after)
-                    # One final retry with first key
-                    response = requests.post(gemini_image_endpoint(keys[0]), json=payload, timeout=timeout)
+                    log(f"[INFO] Waiting {rate_limiter.next_available_in('google', keys):.1f}s before final retry...")
+                    # One final retry with whichever key frees up first
+                    final_key = rate_limiter.acquire_key('google', keys)
+                    t0 = time.monotonic()
+                    response = transport.post(gemini_image_endpoint(final_key), json=payload, timeout=timeout)
+                    report_outcome('google', final_key, response.status_code, time.monotonic() - t0,
+                                   response.headers, response.text)
                     if response.status_code == 200:
                         # Success after wait - continue to image extraction below
                         log("[SUCCESS] Final retry succeeded")
                     else:
-                        raise ImageGenError("All API keys exhausted quota")
+                        raise ImageGenError("All API keys exhausted quota",
+                                            retry_after=_wait_hint(response, None) if response.status_code == 429 else None)
             
             # Parse error responses
             if response.status_code != 200:
@@ -129,14 +150,14 @@ def generate_image_gemini(prompt: str, timeout: int = None, retry_delay: float =
     raise ImageGenError("Image generation failed with all keys")
 
 
-def generate_image_with_rate_limit(prompt: str, delay: float = 8.0, log_callback=None) -> Optional[bytes]:
+def generate_image_with_rate_limit(prompt: str, delay: float = 0.0, log_callback=None) -> Optional[bytes]:
     """
-    Generate image with automatic rate limiting delay
+    Generate image with automatic rate limiting
     
     Args:
         prompt: Text prompt
-        delay: Delay in seconds before generation (default 8.0s for 15 req/min limit)
-               Safe delay: 60s / 15 requests = 4s min, use 8s to be safe
+        delay: Extra fixed delay in seconds before generation (default 0; per-key
+               token buckets in services.rate_limiter pace requests)
         log_callback: Optional callback function for logging
         
     Returns:
@@ -150,10 +171,14 @@ def generate_image_with_rate_limit(prompt: str, delay: float = 8.0, log_callback
         return generate_image_gemini(prompt, log_callback=log_callback)
     except Exception as e:
         # Check if rate limited
-        if '429' in str(e) or 'rate limit' in str(e).lower():
+        if '429' in str(e) or 'rate limit' in str(e).lower() or 'quota' in str(e).lower():
+            # Wait only as long as the server asked; blind backoff when it gave no hint
+            wait = getattr(e, 'retry_after', None)
+            if wait is None:
+                wait = backoff_delay(3)
             if log_callback:
-                log_callback(f"[WARNING] Rate limited, waiting 60s...")
-            time.sleep(60)  # Wait 1 minute before retry
+                log_callback(f"[WARNING] Rate limited, waiting {wait:.1f}s...")
+            time.sleep(wait)
             try:
                 return generate_image_gemini(prompt, log_callback=log_callback)
             except Exception as retry_error:
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Image preprocessing before upload - auto-orient, downsize, re-encode
+Labs and Whisk uploads used to send the original file bytes as base64 JSON, so a 6 MB phone
+photo became an 8 MB request body. Images are now EXIF-rotated, fitted inside the largest
+frame the target model renders (never upscaled) and re-encoded as JPEG or WebP at a set
+quality. The original bytes are kept when re-encoding would not make them smaller.
+
+Results are cached on disk per (source sha256, target profile), and prefetch() prepares a
+batch on a small worker pool so scene i+1 is encoded while scene i uploads. Without Pillow
+(or with image_prep.enabled false) the original bytes are sent as before.
+
+Config (optional)::
+
+    "image_prep": {"enabled": true, "format": "JPEG", "quality": 88, "workers": 2,
+                   "labs": {"max_long": 1920, "max_short": 1080},
+                   "whisk": {"max_long": 1536, "max_short": 1536},
+                   "cache_dir": "~/.veo_image_prep"}
+"""
+import hashlib
+import io
+import mimetypes
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+from services.core.config import load as load_config
+from services.media_cache import file_hash
+
+try:
+    from PIL import Image, ImageOps
+except Exception:  # pragma: no cover - Pillow is optional at runtime
+    Image = ImageOps = None
+
+# Largest frame each target uses: Veo renders at most 1080p, Whisk works on ~1.5k squares
+_TARGETS = {'labs': {'max_long': 1920, 'max_short': 1080}, 'whisk': {'max_long': 1536, 'max_short': 1536}}
+_DEFAULTS = {'enabled': True, 'format': 'JPEG', 'quality': 88, 'workers': 2,
+             'cache_dir': os.path.join(os.path.expanduser("~"), ".veo_image_prep")}
+_MIME = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp'}
+# cached outputs (an original that was already smallest is cached as-is)
+_CACHE_EXT = {'image/jpeg': '.jpg', 'image/webp': '.webp', 'image/png': '.png'}
+
+_INFLIGHT: Dict[str, Future] = {}
+_LOCK = threading.Lock()
+_POOL: Optional[ThreadPoolExecutor] = None
+
+
+def _settings() -> dict:
+    return {**_DEFAULTS, **(load_config().get('image_prep') or {})}
+
+
+def profile(target: str = 'labs') -> dict:
+    """Output profile for a target: bounding box (long/short side), format, quality"""
+    s = _settings()
+    box = {**_TARGETS.get(target, _TARGETS['labs']), **(s.get(target) or {})}
+    fmt = str(s.get('format') or 'JPEG').upper()
+    if fmt not in _MIME: fmt = 'JPEG'
+    return {'max_long': int(box['max_long']), 'max_short': int(box['max_short']), 'format': fmt,
+            'quality': int(s.get('quality') or 88)}
+
+
+def _profile_key(p: dict) -> str:
+    return hashlib.sha1(repr(sorted(p.items())).encode('utf-8')).hexdigest()[:10]
+
+
+def _guess_mime(path: str) -> str:
+    return mimetypes.guess_type(path)[0] or "image/jpeg"
+
+
+def _original(path: str) -> Tuple[bytes, str]:
+    with open(path, "rb") as f:
+        return f.read(), _guess_mime(path)
+
+
+def _fit(size: Tuple[int, int], p: dict) -> Tuple[int, int]:
+    w, h = size
+    # the box follows the image's own orientation; a square image fits the short side
+    bw, bh = (p['max_long'], p['max_short']) if w >= h else (p['max_short'], p['max_long'])
+    scale = min(1.0, bw / float(w), bh / float(h))
+    return max(1, int(round(w * scale))), max(1, int(round(h * scale)))
+
+
+def _encode(path: str, p: dict) -> Tuple[bytes, str]:
+    raw, mime = _original(path)
+    with Image.open(io.BytesIO(raw)) as im:
+        oriented = im.getexif().get(0x0112, 1) not in (0, 1)
+        rotated = ImageOps.exif_transpose(im)
+        size = _fit(rotated.size, p)
+        changed = size != rotated.size or oriented
+        if size != rotated.size:
+            rotated = rotated.resize(size, Image.LANCZOS)
+        if p['format'] == 'JPEG' and rotated.mode not in ('RGB', 'L'):
+            if rotated.mode in ('RGBA', 'LA', 'P'):
+                rgba = rotated.convert('RGBA')
+                bg = Image.new('RGB', rgba.size, (255, 255, 255)); bg.paste(rgba, mask=rgba.split()[-1])
+                rotated = bg
+            else:
+                rotated = rotated.convert('RGB')
+        out = io.BytesIO()
+        kw = {'quality': p['quality']}
+        if p['format'] == 'JPEG': kw.update(optimize=True, progressive=True)
+        else: kw.update(method=4)
+        rotated.save(out, p['format'], **kw)
+    data = out.getvalue()
+    if not changed and len(data) >= len(raw):
+        return raw, mime
+    return data, _MIME[p['format']]
+
+
+def _cache_base(h: str, p: dict) -> str:
+    return os.path.join(os.path.expanduser(_settings()['cache_dir']), f"{h}_{_profile_key(p)}")
+
+
+def _cached_file(base: str) -> Optional[Tuple[str, str]]:
+    for mime, ext in _CACHE_EXT.items():
+        if os.path.exists(base + ext):
+            return base + ext, mime
+    return None
+
+
+def _cached_or_encode(path: str, p: dict, h: str) -> Tuple[bytes, str]:
+    base = _cache_base(h, p)
+    hit = _cached_file(base)
+    if hit:
+        with open(hit[0], "rb") as f:
+            return f.read(), hit[1]
+    data, mime = _encode(path, p)
+    ext = _CACHE_EXT.get(mime)
+    if ext:
+        try:
+            os.makedirs(os.path.dirname(base), exist_ok=True)
+            tmp = base + '.tmp'
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, base + ext)
+        except OSError:
+            pass
+    return data, mime
+
+
+def prepare(path: str, target: str = 'labs') -> Tuple[bytes, str]:
+    """
+    Upload-ready bytes for an image
+
+    Args:
+        path: Source image file
+        target: 'labs' or 'whisk' (selects the bounding box; it follows the image's orientation)
+
+    Returns:
+        (bytes, mime type) - the preprocessed image, or the original file when Pillow is
+        missing, preprocessing is disabled, or the file can't be decoded
+    """
+    if Image is None or not _settings().get('enabled', True):
+        return _original(path)
+    h = file_hash(path)
+    if not h:
+        return _original(path)
+    p = profile(target)
+    key = f"{h}_{_profile_key(p)}"
+    with _LOCK:
+        fut = _INFLIGHT.get(key)
+        owner = fut is None
+        if owner:
+            fut = _INFLIGHT[key] = Future()
+    if not owner:
+        return fut.result()
+    try:
+        res = _cached_or_encode(path, p, h)
+    except Exception:
+        res = _original(path)
+    fut.set_result(res)
+    with _LOCK:
+        _INFLIGHT.pop(key, None)
+    return res
+
+
+def prepared_file(path: str, target: str = 'labs') -> Tuple[Union[str, bytes], str]:
+    """
+    Like prepare(), but the prepared image as a file path to stream from (the cache entry, or the
+    source itself when preprocessing is off); bytes only if the cache entry couldn't be written
+    """
+    if Image is None or not _settings().get('enabled', True):
+        return path, _guess_mime(path)
+    h = file_hash(path)
+    if not h:
+        return path, _guess_mime(path)
+    hit = _cached_file(_cache_base(h, profile(target)))
+    if hit:
+        return hit
+    data, mime = prepare(path, target)
+    hit = _cached_file(_cache_base(h, profile(target)))
+    return hit if hit else (data, mime)
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _POOL
+    with _LOCK:
+        if _POOL is None:
+            _POOL = ThreadPoolExecutor(max(1, int(_settings()['workers'])), thread_name_prefix='image-prep')
+        return _POOL
+
+
+def prefetch(paths: Iterable[str], target: str = 'labs'):
+    """Prepare images in the background so later uploads find them in the cache"""
+    if Image is None or not _settings().get('enabled', True):
+        return
+    pool = _pool()
+    for p in dict.fromkeys(x for x in paths if x):
+        pool.submit(prepare, p, target)
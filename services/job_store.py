@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent job/operation store (SQLite) for crash-safe resume
+Scene jobs and their Labs operations are written as they change - submission, operation
+names, render results, downloads - so a crash or close mid-run doesn't orphan renders that
+were already paid for. Writes go through one background thread that commits in batches,
+so callers (the UI thread included) only enqueue. Reads use their own short-lived
+connection; WAL mode keeps them from blocking the writer, and writes still in the queue are
+merged into what they return, so reads don't wait for the queue to drain either. A batch
+that fails to commit is logged and retried one write at a time, so one bad row doesn't cost
+the rest.
+
+Config (optional)::
+
+    "job_store": {"path": "~/.veo_jobs.sqlite3"}
+"""
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Dict, List, Optional, Tuple
+
+from services.core.config import load as load_config
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".veo_jobs.sqlite3")
+_BATCH = 500
+
+_log = logging.getLogger(__name__)
+
+# op status values that need no more polling
+_TERMINAL = ("COMPLETED", "DONE", "DONE_NO_URL", "FAILED", "ERROR")
+# job keys that are UI-only or rebuilt on load
+_SKIP_KEYS = ("thumb_icons",)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    project    TEXT NOT NULL,
+    scene_id   TEXT NOT NULL,
+    seq        INTEGER NOT NULL,
+    data       TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (project, scene_id)
+);
+CREATE TABLE IF NOT EXISTS ops (
+    op_name      TEXT PRIMARY KEY,
+    project      TEXT NOT NULL,
+    scene_id     TEXT NOT NULL,
+    copy_idx     INTEGER NOT NULL,
+    model        TEXT,
+    aspect       TEXT,
+    submitted_at REAL,
+    status       TEXT,
+    video_url    TEXT,
+    downloaded   INTEGER NOT NULL DEFAULT 0,
+    updated_at   REAL NOT NULL,
+    token_fp     TEXT,
+    project_id   TEXT
+);
+CREATE INDEX IF NOT EXISTS ops_project ON ops (project);
+CREATE INDEX IF NOT EXISTS ops_open ON ops (downloaded, status);
+"""
+
+
+def _encode_job(job: Dict) -> str:
+    def conv(v):
+        if isinstance(v, set): return sorted(v)
+        return v
+    return json.dumps({k: conv(v) for k, v in job.items() if k not in _SKIP_KEYS}, ensure_ascii=False, default=str)
+
+
+def _decode_job(data: str) -> Dict:
+    job = json.loads(data)
+    job["downloaded_idx"] = set(job.get("downloaded_idx") or [])
+    job["thumb_icons"] = {}
+    job["op_index_map"] = {k: int(v) for k, v in (job.get("op_index_map") or {}).items()}
+    return job
+
+
+def _op_rows(project: str, job: Dict, now: float) -> List[tuple]:
+    sid = str(job.get("scene_id", ""))
+    vids = job.get("video_by_idx") or []
+    done = job.get("downloaded_idx") or ()
+    meta = job.get("op_meta") or {}
+    st = job.get("op_status") or {}
+    rows = []
+    for nm in job.get("operation_names") or []:
+        ci = int((job.get("op_index_map") or {}).get(nm, 0))
+        m = meta.get(nm) or {}
+        url = vids[ci] if ci < len(vids) else None
+        rows.append((nm, project, sid, ci, m.get("model"), m.get("aspect"), m.get("submitted_at"),
+                     st.get(nm) or ("COMPLETED" if url else "PENDING"), url, 1 if (ci + 1) in done else 0, now,
+                     m.get("token_fp"), m.get("project_id")))
+    return rows
+
+
+class JobStore:
+    """SQLite job/op store with a single batching writer thread"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = os.path.expanduser(path or DEFAULT_PATH)
+        d = os.path.dirname(self.path)
+        if d: os.makedirs(d, exist_ok=True)
+        with closing(self._connect()) as con:
+            con.executescript(_SCHEMA)
+            # stores created before ops carried their account/project context
+            have = {r[1] for r in con.execute("PRAGMA table_info(ops)")}
+            for col in ("token_fp", "project_id"):
+                if col not in have: con.execute(f"ALTER TABLE ops ADD COLUMN {col} TEXT")
+        self._q: "queue.Queue[tuple]" = queue.Queue()
+        self._pending = 0
+        self._cond = threading.Condition()
+        # writes not committed yet, newest per scene / per deleted project (merged into reads)
+        self._unwritten: Dict[Tuple[str, str], tuple] = {}
+        self._dropped: Dict[str, tuple] = {}
+        self.errors = 0
+        self._thread = threading.Thread(target=self._writer, name="job-store", daemon=True)
+        self._thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.path, timeout=30)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        return con
+
+    # -- writes (queued) --
+
+    def save_job(self, project: str, job: Dict, seq: Optional[int] = None):
+        """Upsert a scene job and its operations (snapshot taken now, written in the background)"""
+        now = time.time()
+        self._put(("job", project, str(job.get("scene_id", "")), seq, _encode_job(job), _op_rows(project, job, now), now))
+
+    def delete_job(self, project: str, scene_id: str):
+        self._put(("del_job", project, str(scene_id)))
+
+    def delete_project(self, project: str):
+        self._put(("del_project", project))
+
+    def _put(self, item: tuple):
+        with self._cond:
+            self._pending += 1
+            if item[0] == "del_project":
+                self._dropped[item[1]] = item
+                for k in [k for k in self._unwritten if k[0] == item[1]]: del self._unwritten[k]
+            else:
+                self._unwritten[(item[1], item[2])] = item
+        self._q.put(item)
+
+    def flush(self, timeout: Optional[float] = 5.0) -> bool:
+        """Wait until queued writes are committed"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending == 0, timeout)
+
+    def _writer(self):
+        con = self._connect()
+        while True:
+            batch = [self._q.get()]
+            # everything that queued up meanwhile goes into the same transaction
+            while len(batch) < _BATCH:
+                try: batch.append(self._q.get_nowait())
+                except queue.Empty: break
+            try:
+                with con:
+                    for item in batch:
+                        self._apply(con, item)
+            except Exception:
+                _log.exception("job store: batch of %d writes failed; retrying one by one", len(batch))
+                con = self._retry_each(con, batch)
+            self._written(batch)
+
+    def _retry_each(self, con: sqlite3.Connection, batch: List[tuple]) -> sqlite3.Connection:
+        try:
+            con.close()
+            con = self._connect()
+        except Exception:
+            _log.exception("job store: reconnect failed")
+        for item in batch:
+            try:
+                with con:
+                    self._apply(con, item)
+            except Exception:
+                self.errors += 1
+                _log.exception("job store: dropped %s write for %s", item[0], "/".join(map(str, item[1:3])))
+        return con
+
+    def _written(self, batch: List[tuple]):
+        # committed (or given up): reads stop merging these items
+        with self._cond:
+            for item in batch:
+                if item[0] == "del_project":
+                    if self._dropped.get(item[1]) is item: del self._dropped[item[1]]
+                elif self._unwritten.get((item[1], item[2])) is item:
+                    del self._unwritten[(item[1], item[2])]
+            self._pending -= len(batch)
+            self._cond.notify_all()
+
+    def _queued(self, project: Optional[str]) -> Tuple[List[tuple], set]:
+        """
+        Uncommitted scene writes and deleted projects
+
+        Readers take this before reading the database: an item leaves it only after its commit,
+        so a scene is never read older than it was at this point (a newer committed row loses
+        to the queued item, which was current when the read started).
+        """
+        with self._cond:
+            items = [it for (p, _), it in self._unwritten.items() if project is None or p == project]
+            dropped = {p for p in self._dropped if project is None or p == project}
+        return items, dropped
+
+    @staticmethod
+    def _apply(con: sqlite3.Connection, item: tuple):
+        kind = item[0]
+        if kind == "job":
+            _, project, sid, seq, data, ops, now = item
+            con.execute(
+                "INSERT INTO jobs (project, scene_id, seq, data, updated_at) VALUES (?, ?, "
+                "COALESCE(?, (SELECT seq FROM jobs WHERE project=? AND scene_id=?), "
+                "(SELECT COALESCE(MAX(seq), -1) + 1 FROM jobs WHERE project=?)), ?, ?) "
+                "ON CONFLICT (project, scene_id) DO UPDATE SET seq=excluded.seq, data=excluded.data, "
+                "updated_at=excluded.updated_at",
+                (project, sid, seq, project, sid, project, data, now))
+            con.executemany(
+                "INSERT OR REPLACE INTO ops (op_name, project, scene_id, copy_idx, model, aspect, submitted_at, "
+                "status, video_url, downloaded, updated_at, token_fp, project_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", ops)
+        elif kind == "del_job":
+            con.execute("DELETE FROM jobs WHERE project=? AND scene_id=?", item[1:])
+            con.execute("DELETE FROM ops WHERE project=? AND scene_id=?", item[1:])
+        elif kind == "del_project":
+            con.execute("DELETE FROM jobs WHERE project=?", item[1:])
+            con.execute("DELETE FROM ops WHERE project=?", item[1:])
+
+    # -- reads --
+
+    def load_jobs(self, project: str) -> List[Dict]:
+        """Jobs of a project in their original order (queued writes included; doesn't wait for the writer)"""
+        items, dropped = self._queued(project)
+        with closing(self._connect()) as con:
+            rows = [] if dropped else \
+                con.execute("SELECT scene_id, seq, data FROM jobs WHERE project=? ORDER BY seq", (project,)).fetchall()
+        scenes = {sid: (seq, data) for sid, seq, data in rows}
+        end = max([seq for seq, _ in scenes.values()] + [-1]) + 1
+        for it in items:
+            if it[0] == "del_job":
+                scenes.pop(it[2], None)
+            else:
+                _, _, sid, seq, data, _, _ = it
+                if seq is None:
+                    seq = scenes[sid][0] if sid in scenes else end
+                    end = max(end, seq + 1)
+                scenes[sid] = (seq, data)
+        return [_decode_job(data) for _, data in sorted(scenes.values(), key=lambda v: v[0])]
+
+    def outstanding(self, project: Optional[str] = None) -> List[Dict]:
+        """Operations still rendering, or finished with a video that isn't downloaded yet (queued writes included)"""
+        q = ("SELECT op_name, project, scene_id, copy_idx, model, aspect, submitted_at, status, video_url, "
+             "token_fp, project_id "
+             "FROM ops WHERE (status NOT IN (%s) OR (video_url IS NOT NULL AND downloaded=0))"
+             % ",".join("?" * len(_TERMINAL)))
+        args: list = list(_TERMINAL)
+        if project is not None:
+            q += " AND project=?"; args.append(project)
+        cols = ("op_name", "project", "scene_id", "copy_idx", "model", "aspect", "submitted_at", "status", "video_url",
+                "token_fp", "project_id")
+        items, dropped = self._queued(project)
+        with closing(self._connect()) as con:
+            ops = {r[0]: dict(zip(cols, r)) for r in con.execute(q, args).fetchall()}
+        if not items and not dropped:
+            return list(ops.values())
+        deleted = {(it[1], it[2]) for it in items if it[0] == "del_job"}
+        ops = {n: o for n, o in ops.items() if o["project"] not in dropped and (o["project"], o["scene_id"]) not in deleted}
+        for it in items:
+            if it[0] != "job": continue
+            for (nm, prj, sid, ci, model, aspect, sub, status, url, downloaded, _, fp, pid) in it[5]:
+                if status not in _TERMINAL or (url is not None and not downloaded):
+                    ops[nm] = dict(zip(cols, (nm, prj, sid, ci, model, aspect, sub, status, url, fp, pid)))
+                else:
+                    ops.pop(nm, None)
+        return list(ops.values())
+
+    def token_fps(self, op_names: List[str]) -> Dict[str, str]:
+        """{op_name: token fingerprint} for stored operations that recorded one"""
+        out: Dict[str, str] = {}
+        with closing(self._connect()) as con:
+            for i in range(0, len(op_names), 500):
+                chunk = op_names[i:i+500]
+                q = "SELECT op_name, token_fp FROM ops WHERE token_fp IS NOT NULL AND op_name IN (%s)" % ",".join("?" * len(chunk))
+                out.update(con.execute(q, chunk).fetchall())
+        return out
+
+    def projects(self, outstanding_only: bool = False) -> List[str]:
+        """Stored project names (optionally only those with outstanding operations), oldest first"""
+        if outstanding_only:
+            names = []
+            for r in self.outstanding():
+                if r["project"] not in names: names.append(r["project"])
+            return names
+        items, dropped = self._queued(None)
+        with closing(self._connect()) as con:
+            names = [r[0] for r in con.execute("SELECT project FROM jobs GROUP BY project ORDER BY MIN(updated_at)")]
+        queued = [it[1] for it in items if it[0] == "job"]
+        names = [n for n in names if n not in dropped or n in queued]
+        for n in queued:
+            if n not in names: names.append(n)
+        return names
+
+
+_STORE: Optional[JobStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_store() -> JobStore:
+    """Process-wide store at job_store.path"""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = JobStore((load_config().get("job_store") or {}).get("path"))
+        return _STORE
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import requests, datetime
 from typing import Tuple
+from services import transport
 
 # Constants
 MIN_JWT_TOKEN_LENGTH = 50  # Minimum expected length for JWT session tokens
@@ -23,22 +24,22 @@ def check(kind: str, key: str) -> Tuple[bool, str]:
         if kind in ('labs','google_labs','google labs'):
             url='https://aisandbox-pa.googleapis.com/v1/video:batchCheck'
             h={'authorization': f'Bearer {k}', 'content-type':'application/json'}
-            r=requests.post(url, json={}, headers=h, timeout=(10,20))
+            r=transport.post(url, json={}, headers=h, timeout=(10,20))
             if r.status_code in (200,400): return True, f'OK @ {_ts()}'
             if r.status_code in (401,403): return False, _fmt_err('Unauthorized', r)
             return False, _fmt_err('HTTP', r)
         if kind in ('google','gemini','google_api'):
-            r=requests.get('https://generativelanguage.googleapis.com/v1/models', params={'key':k}, timeout=(10,20))
+            r=transport.get('https://generativelanguage.googleapis.com/v1/models', params={'key':k}, timeout=(10,20))
             if r.status_code==200: return True, f'OK @ {_ts()}'
             if r.status_code in (401,403): return False, _fmt_err('Unauthorized', r)
             return False, _fmt_err('HTTP', r)
         if kind in ('eleven','elevenlabs'):
-            r=requests.get('https://api.elevenlabs.io/v1/user', headers={'xi-api-key':k}, timeout=(10,20))
+            r=transport.get('https://api.elevenlabs.io/v1/user', headers={'xi-api-key':k}, timeout=(10,20))
             if r.status_code==200: return True, f'OK @ {_ts()}'
             if r.status_code in (401,403): return False, _fmt_err('Unauthorized', r)
             return False, _fmt_err('HTTP', r)
         if kind in ('openai',):
-            r=requests.get('https://api.openai.com/v1/models', headers={'authorization': f'Bearer {k}'}, timeout=(10,20))
+            r=transport.get('https://api.openai.com/v1/models', headers={'authorization': f'Bearer {k}'}, timeout=(10,20))
             if r.status_code==200: return True, f'OK @ {_ts()}'
             if r.status_code in (401,403): return False, _fmt_err('Unauthorized', r)
             return False, _fmt_err('HTTP', r)
@@ -1,5 +1,14 @@
-import base64, mimetypes, json, time, requests, os, re
+import json, time, requests, os, re
+from contextvars import ContextVar
 from typing import List, Dict, Optional, Tuple, Callable, Any
+from services import transport
+from services.http_retry import plan_retry
+from services.retry_policy import RetryPolicy, policy_for
+from services.circuit_breaker import breaker_for
+from services.resilience import acquire
+from services import image_prep, media_cache, model_ladder, project_ids, token_dispatch, upload_body
+from services.core import key_manager
+from services.core.config import load as load_config
 
 
 # Optional default_project_id from user config (non-breaking)
@@ -32,13 +41,6 @@ def _headers(bearer: str) -> dict:
         "user-agent": "Mozilla/5.0"
     }
 
-def _encode_image_file(path: str):
-    with open(path, "rb") as f:
-        raw = f.read()
-    b64 = base64.b64encode(raw).decode("utf-8")
-    mime = mimetypes.guess_type(path)[0] or "image/jpeg"
-    return b64, mime
-
 _URL_PAT = re.compile(r'^(https?://|gs://)', re.I)
 def _collect_urls_any(obj: Any) -> List[str]:
     urls=set(); KEYS={"gcsUrl","gcsUri","signedUrl","signedUri","downloadUrl","downloadUri","videoUrl","url","uri","fileUri"}
@@ -95,13 +97,316 @@ def _trim_prompt_text(prompt_text: Any)->str:
     except Exception:
         return str(obj)[:1800]
 
+# IMPORTANT: choose fallbacks based on whether we're doing I2V (has start image) or T2V (no image)
+FALLBACKS_I2V={
+    "VIDEO_ASPECT_RATIO_PORTRAIT":[
+        "veo_3_1_i2v_s_fast_portrait_ultra","veo_3_1_i2v_s_fast_portrait","veo_3_1_i2v_s_portrait","veo_3_1_i2v_s"
+    ],
+    "VIDEO_ASPECT_RATIO_LANDSCAPE":[
+        "veo_3_1_i2v_s_fast_ultra","veo_3_1_i2v_s_fast","veo_3_1_i2v_s"
+    ],
+    "VIDEO_ASPECT_RATIO_SQUARE":[
+        "veo_3_1_i2v_s_fast","veo_3_1_i2v_s"
+    ]
+}
+FALLBACKS_T2V={
+    "VIDEO_ASPECT_RATIO_PORTRAIT":[
+        "veo_3_1_t2v_fast_ultra","veo_3_1_t2v"
+    ],
+    "VIDEO_ASPECT_RATIO_LANDSCAPE":[
+        "veo_3_1_t2v_fast_ultra","veo_3_1_t2v"
+    ],
+    "VIDEO_ASPECT_RATIO_SQUARE":[
+        "veo_3_1_t2v_fast_ultra","veo_3_1_t2v"
+    ]
+}
+
+def _model_ladder(model_key: str, aspect_ratio: str, has_image: bool)->List[str]:
+    """User's chosen model first, then same-family fallbacks for the aspect."""
+    fallbacks = FALLBACKS_I2V if has_image else FALLBACKS_T2V
+    return [model_key]+[m for m in fallbacks.get(aspect_ratio, []) if m!=model_key]
+
+def _is_invalid(e: Exception)->bool:
+    s=str(e).lower()
+    return ("400" in str(e)) or ("invalid json" in s) or ("invalid argument" in s)
+
+# A 400 within this many seconds of the upload may just mean the image isn't indexed yet
+INDEX_GRACE_SEC=1.0
+INDEX_WINDOW_SEC=10.0
+
+def _maybe_not_indexed(job: Dict)->bool:
+    t=job.get("uploaded_at")
+    return bool(job.get("media_id") and t and time.time()-t < INDEX_WINDOW_SEC)
+
+def _op_name(op: dict)->str:
+    return (op.get("operation") or {}).get("name") or op.get("name") or ""
+
+def _upload_payload(image_path: str, aspect_hint: str)->upload_body.B64JSONBody:
+    # streamed: base64 of the (prepared, memory-mapped) file is produced chunk by chunk while sending
+    src,mime=image_prep.prepared_file(image_path, "labs")
+    return upload_body.labs_upload(src, mime, aspect_hint, f"{int(time.time()*1000)}")
+
+def _media_id_of(data: dict)->Optional[str]:
+    return ((data or {}).get("mediaGenerationId") or {}).get("mediaGenerationId")
+
+def _wrap_ops(op_names: List[str])->dict:
+    uniq=[]; seen=set()
+    for s in op_names or []:
+        if s and s not in seen: seen.add(s); uniq.append(s)
+    return {"operations":[{"operation":{"name":s}} for s in uniq]}
+
+def _parse_batch_check(data: dict)->Dict[str,Dict]:
+    out={}
+    def _dedup(xs):
+        seen=set(); r=[]
+        for x in xs:
+            if x not in seen: seen.add(x); r.append(x)
+        return r
+    for item in (data or {}).get("operations",[]):
+        key=_op_name(item)
+        st=_normalize_status(item)
+        urls=_collect_urls_any(item.get("response",{})) or _collect_urls_any(item)
+        vurls=[u for u in urls if "/video/" in u]; iurls=[u for u in urls if "/image/" in u]
+        out[key or "unknown"]={"status": ("COMPLETED" if st=="DONE" and vurls else ("DONE_NO_URL" if st=="DONE" else st)),
+                               "video_urls": _dedup(vurls), "image_urls": _dedup(iurls), "raw": item}
+    return out
+
+def _claim_token(tokens: List[str], n: int, pinned: Optional[str]=None):
+    """Plan helper: reserve the least-loaded token (or the pinned one) for n new operations,
+    sleeping while every account is at its concurrent-render cap. None when there are no tokens."""
+    if not tokens: return None
+    deadline=time.monotonic()+token_dispatch.wait_sec()
+    while True:
+        tok=token_dispatch.reserve(tokens, n, pinned)
+        if tok: return tok
+        if time.monotonic()>=deadline: raise RuntimeError("Mọi tài khoản Labs đã đạt giới hạn render đồng thời")
+        yield ("sleep", 1.0)
+
+def _start_plan(job: Dict, model_key: str, aspect_ratio: str, prompt_text: Any, copies: int, project_id: Optional[str], tokens: List[str]=()):
+    """
+    Scene start logic shared by the blocking and asyncio clients.
+    Generator yielding I/O steps ("sleep", sec) / ("post", url, body, token) / ("upload", image_path, token);
+    the driver sends back each step's result (or throws its exception) and gets the op count on return.
+    tokens: the client's tokens. The scene runs on one of them (the one its image was uploaded with,
+    else the least-loaded, see services.token_dispatch); its learned model ladder orders the fallbacks
+    and its project id (services.project_ids, default project_id) goes into clientContext.
+    """
+    copies=max(1,int(copies))
+    tok=yield from _claim_token(tokens, copies, job.get("token_fp"))
+    if tok: job["token_fp"]=key_manager._fingerprint(tok)
+    project_id=project_ids.project_for(tok, project_id)
+    before=set(job.get("operation_names") or [])
+    try:
+        return (yield from _start_plan_on(job, model_key, aspect_ratio, prompt_text, copies, project_id, tok, tokens))
+    finally:
+        token_dispatch.settle(tok, copies, [n for n in job.get("operation_names") or [] if n not in before])
+
+def _start_plan_on(job: Dict, model_key: str, aspect_ratio: str, prompt_text: Any, copies: int, project_id: Optional[str], tok: Optional[str], tokens: List[str]):
+    base_seed=int(job.get("seed",0)) if str(job.get("seed","")).isdigit() else 0
+    mid=job.get("media_id")
+
+    models=model_ladder.order(_model_ladder(model_key, aspect_ratio, bool(mid)), [tok] if tok else tokens, aspect_ratio)
+
+    # compose prompt text (trim if huge/complex)
+    prompt=_trim_prompt_text(prompt_text)
+
+    def _make_body(use_model, mid_val, copies_n):
+        reqs=[]
+        for k in range(copies_n):
+            seed=base_seed+k
+            item={"aspectRatio":aspect_ratio,"seed":seed,"videoModelKey":use_model,"textInput":{"prompt":prompt}}
+            if mid_val: item["startImage"]={"mediaId":mid_val}
+            reqs.append(item)
+        body={"requests":reqs}
+        if project_id: body["clientContext"]={"projectId":project_id}
+        return body
+
+    def _url():
+        return I2V_URL if mid else T2V_URL
+
+    # 1) Try batch with model fallbacks
+    data=None; last_err=None; used_model=model_key
+    # rejections only say something about the model once the image is surely indexed
+    rejected=[] if not _maybe_not_indexed(job) else None
+    for mkey in models:
+        try:
+            data=(yield ("post", _url(), _make_body(mkey, mid, copies), tok)) or {}
+            last_err=None; used_model=mkey; break
+        except Exception as e:
+            last_err=e
+            if _is_invalid(e) and _maybe_not_indexed(job):
+                # backend may not have indexed a just-uploaded image yet: wait once, same model again
+                job.pop("uploaded_at", None)
+                yield ("sleep", INDEX_GRACE_SEC)
+                try:
+                    data=(yield ("post", _url(), _make_body(mkey, mid, copies), tok)) or {}
+                    last_err=None; used_model=mkey; break
+                except Exception as e1:
+                    last_err=e1
+            if not _is_invalid(last_err): break
+            if rejected is not None: rejected.append(mkey)
+    if data is not None and rejected: _learn_rejections(tok, aspect_ratio, rejected, used_model)
+
+    # 2) If invalid and have image -> reupload once then retry ladder (I2V only)
+    if last_err and _is_invalid(last_err) and mid and job.get("image_path"):
+        try:
+            media_cache.invalidate(mid)  # the cached id may be what the server rejected
+            new_mid=yield ("upload", job["image_path"], tok)
+            if new_mid:
+                job["media_id"]=new_mid; mid=new_mid
+                yield ("sleep", INDEX_GRACE_SEC)
+                for mkey in models:
+                    try:
+                        data=(yield ("post", _url(), _make_body(mkey, mid, copies), tok)) or {}; last_err=None; used_model=mkey; break
+                    except Exception as e2:
+                        last_err=e2
+                        if not _is_invalid(e2): break
+        except Exception as e3:
+            last_err=e3
+
+    # 3) Per-copy fallback (still invalid)
+    job.setdefault("operation_names",[]); job.setdefault("video_by_idx", [None]*copies); job.setdefault("thumb_by_idx", [None]*copies); job.setdefault("op_index_map", {})
+    # model/aspect/submit time per op: the op poller schedules checks from render-time history
+    op_meta=job.setdefault("op_meta", {})
+    def _meta(mkey): return {"model": mkey, "aspect": aspect_ratio, "submitted_at": time.time(), "token_fp": job.get("token_fp"), "project_id": project_id}
+    if data is None and last_err is not None:
+        for k in range(copies):
+            for mkey in models:
+                try:
+                    dat=(yield ("post", _url(), _make_body(mkey, mid, 1), tok)) or {}
+                    ops=dat.get("operations",[]) if isinstance(dat,dict) else []
+                    if ops:
+                        nm=_op_name(ops[0])
+                        if nm: job["operation_names"].append(nm); job["op_index_map"][nm]=k; op_meta[nm]=_meta(mkey); break
+                except Exception: continue
+        return len(job.get("operation_names",[]))
+
+    # 4) Batch success
+    ops=data.get("operations",[]) if isinstance(data,dict) else []
+    for ci,op in enumerate(ops):
+        nm=_op_name(op)
+        if nm: job["operation_names"].append(nm); job["op_index_map"][nm]=ci; op_meta[nm]=_meta(used_model)
+    if job.get("operation_names"): job["status"]="PENDING"
+    return len(job.get("operation_names",[]))
+
+# requests per batchAsyncGenerateVideo* call when packing several scenes (config: labs.max_start_batch)
+MAX_START_BATCH=16
+
+def _max_start_batch()->int:
+    return max(1, int((load_config().get("labs") or {}).get("max_start_batch") or MAX_START_BATCH))
+
+def _start_many_plan(jobs: List[Dict], model_key: str, aspect_ratio: str, copies: int, project_id: Optional[str], max_batch: int, tokens: List[str]=()):
+    """
+    Multi-scene start: packs several scenes' requests (own prompt/seed/start image, shared model and
+    aspect) into one call per chunk of at most max_batch requests. Operations come back in request
+    order and are mapped to (scene, copy) like _start_plan does. A chunk that fails, or scenes it
+    returned no operation for, go through _start_plan one by one (model ladder, reupload, per-copy).
+    Same step protocol as _start_plan; returns the number of operations started.
+    """
+    copies=max(1,int(copies)); per_call=max(1, max_batch//copies)
+    total=0
+    # scenes pinned to a token (their image was uploaded with it) are only packed with each other
+    groups: Dict[tuple, List[Dict]]={}
+    for j in jobs: groups.setdefault((bool(j.get("media_id")), j.get("token_fp") or ""), []).append(j)
+    for (has_image, pinned), group in sorted(groups.items(), key=lambda kv: kv[0][0]):
+        for c in range(0, len(group), per_call):
+            chunk=group[c:c+per_call]
+            if len(chunk)==1:
+                total+=yield from _start_plan(chunk[0], model_key, aspect_ratio, chunk[0].get("prompt",""), copies, project_id, tokens)
+                continue
+            need=len(chunk)*copies
+            tok=yield from _claim_token(tokens, need, pinned or None)
+            fp=key_manager._fingerprint(tok) if tok else None; pid=project_ids.project_for(tok, project_id)
+            model=model_ladder.order(_model_ladder(model_key, aspect_ratio, has_image), [tok] if tok else tokens, aspect_ratio)[0]
+            reqs=[]; slots=[]
+            for j in chunk:
+                base_seed=int(j.get("seed",0)) if str(j.get("seed","")).isdigit() else 0
+                prompt=_trim_prompt_text(j.get("prompt",""))
+                for k in range(copies):
+                    item={"aspectRatio":aspect_ratio,"seed":base_seed+k,"videoModelKey":model,"textInput":{"prompt":prompt}}
+                    if has_image: item["startImage"]={"mediaId":j["media_id"]}
+                    reqs.append(item); slots.append((j,k))
+            body={"requests":reqs}
+            if pid: body["clientContext"]={"projectId":pid}
+            try:
+                data=(yield ("post", I2V_URL if has_image else T2V_URL, body, tok)) or {}
+            except Exception:
+                data=None
+            ops=(data.get("operations") or []) if isinstance(data,dict) else []
+            got=set(); started=[]
+            for (j,k),op in zip(slots, ops):
+                nm=_op_name(op)
+                if not nm: continue
+                j.setdefault("operation_names",[]); j.setdefault("video_by_idx",[None]*copies); j.setdefault("thumb_by_idx",[None]*copies)
+                j["operation_names"].append(nm); j.setdefault("op_index_map",{})[nm]=k
+                j.setdefault("op_meta",{})[nm]={"model": model, "aspect": aspect_ratio, "submitted_at": time.time(), "token_fp": fp, "project_id": pid}
+                if fp: j["token_fp"]=fp
+                j["status"]="PENDING"; got.add(id(j)); started.append(nm); total+=1
+            token_dispatch.settle(tok, need, started)
+            for j in chunk:
+                if id(j) not in got:
+                    total+=yield from _start_plan(j, model_key, aspect_ratio, j.get("prompt",""), copies, project_id, tokens)
+    return total
+
+def _probe_plan(tokens: List[str], model_key: str, aspect_ratio: str, media_id: Optional[str], project_id: Optional[str], prompt: str):
+    """
+    Capability probe: per token, walk the ladder with single requests pinned to that token
+    ("post", url, body, token) until one model is accepted. Accepted probes are real renders,
+    so at most one operation per token is started; rejections are recorded as definitive.
+    """
+    ladder=_model_ladder(model_key, aspect_ratio, bool(media_id))
+    found={}; ops=[]
+    for tok in tokens:
+        for m in model_ladder.order(ladder, [tok], aspect_ratio):
+            item={"aspectRatio":aspect_ratio,"seed":0,"videoModelKey":m,"textInput":{"prompt":prompt}}
+            if media_id: item["startImage"]={"mediaId":media_id}
+            body={"requests":[item]}
+            if project_id: body["clientContext"]={"projectId":project_id}
+            try:
+                data=(yield ("post", I2V_URL if media_id else T2V_URL, body, tok)) or {}
+            except Exception as e:
+                if not _is_invalid(e): break  # auth/quota trouble, not the model
+                model_ladder.record(tok, aspect_ratio, m, False, definitive=True)
+                continue
+            found[key_manager._fingerprint(tok)]=m
+            ops+=[n for n in (_op_name(o) for o in (data.get("operations") or [])) if n]
+            break
+    return {"models": found, "operation_names": ops}
+
+# token that served the last _post in this thread / asyncio task (model-ladder learning)
+_LAST_TOKEN: ContextVar[Optional[str]] = ContextVar("labs_last_token", default=None)
+
+def _learn(step: tuple):
+    """Feed an accepted start request into the per-token model-ladder record.
+    Rejections are not learned here: a 400 may be the prompt, a policy block or an image that isn't
+    indexed yet. _start_plan_on records them once another model accepted the same body."""
+    if step[0]!="post" or step[1] not in (T2V_URL, I2V_URL): return
+    reqs=(step[2] or {}).get("requests") or []
+    if not reqs: return
+    model_ladder.record(_LAST_TOKEN.get(), reqs[0].get("aspectRatio",""), reqs[0].get("videoModelKey",""), True)
+
+def _learn_rejections(tok: Optional[str], aspect_ratio: str, rejected: List[str], accepted: str):
+    """Models rejected as invalid with a body another model then accepted: the rejection was about the model."""
+    for m in rejected:
+        if m!=accepted: model_ladder.record(tok, aspect_ratio, m, False, definitive=True)
+
+def _checked(results: Dict[str,Dict])->Dict[str,Dict]:
+    """Finished operations stop counting against their token."""
+    token_dispatch.release([n for n, r in results.items() if r.get("status") in ("COMPLETED","DONE_NO_URL","FAILED")])
+    return results
+
 class LabsClient:
-    def __init__(self, bearers: List[str], timeout: Tuple[int,int]=(20,180), on_event: Optional[Callable[[dict], None]]=None):
+    def __init__(self, bearers: List[str], timeout: Optional[Tuple[int,int]]=None, on_event: Optional[Callable[[dict], None]]=None):
+        # timeout=None: per-endpoint RetryPolicy timeouts (submit 20/180s, upload longer, batch check short)
         self.tokens=[t.strip() for t in (bearers or []) if t.strip()]
         if not self.tokens: raise ValueError("No Labs tokens provided")
         self._idx=0; self.timeout=timeout; self.on_event=on_event
 
     def _tok(self)->str:
+        # round-robin, skipping tokens in a 401/403/429 cooldown (all cooling -> plain rotation)
+        for _ in range(len(self.tokens)):
+            t=self.tokens[self._idx % len(self.tokens)]; self._idx+=1
+            if key_manager.is_available('labs', t): return t
         t=self.tokens[self._idx % len(self.tokens)]; self._idx+=1; return t
 
     def _emit(self, kind: str, **kw):
@@ -109,155 +414,97 @@ class LabsClient:
             try: self.on_event({"kind":kind, **kw})
             except Exception: pass
 
-    def _post(self, url: str, payload: dict) -> dict:
-        last=None
-        for attempt in range(3):
+    def _retry_delay(self, attempt: int, status: int, headers, body, policy: RetryPolicy)->Optional[float]:
+        """Server hint (Retry-After / RetryInfo) when present, else the endpoint policy's backoff; None = give up."""
+        delay, reason=plan_retry(attempt, status=status, headers=headers, body=body, policy=policy)
+        if delay is None:
+            self._emit("give_up", attempt=attempt, code=status, reason=reason); return None
+        self._emit("retry", attempt=attempt, code=status, delay=round(delay,3), reason=reason)
+        return delay
+
+    def _post(self, url: str, payload: dict, circuit_wait: Optional[float]=None, token: Optional[str]=None) -> dict:
+        """POST with retries; waits up to circuit_wait (default config) for an open endpoint circuit, then raises CircuitOpenError. token pins every attempt to one token."""
+        last=None; breaker=breaker_for(url); policy=policy_for(url); timeout=self.timeout or policy.timeout
+        body=upload_body.serialize(payload)  # once: every retry resends the same bytes/stream
+        for attempt in range(1, policy.max_attempts+1):
+            status, headers, raw = 0, None, None
+            breaker.acquire(circuit_wait)
             try:
-                r=requests.post(url, headers=_headers(self._tok()), json=payload, timeout=self.timeout)
+                tok=token or self._tok(); _LAST_TOKEN.set(tok); t0=time.monotonic()
+                with acquire('labs') as slot:
+                    r=transport.post(url, headers=_headers(tok), data=body, timeout=timeout)
+                    slot.done(r.status_code)
+                breaker.record_status(r.status_code)
+                key_manager.report('labs', tok, r.status_code, time.monotonic()-t0)
                 if r.status_code==200:
                     self._emit("http_ok", code=200)
                     try: return r.json()
                     except Exception: return {}
+                status, headers, raw = r.status_code, r.headers, r.text
                 det=""
                 try: det=r.json().get("error",{}).get("message","")[:300]
                 except Exception: det=(r.text or "")[:300]
                 self._emit("http_other_err", code=r.status_code, detail=det); r.raise_for_status()
             except Exception as e:
-                last=e; time.sleep(0.7*(attempt+1))
+                if not status: breaker.record(True)
+                last=e
+            delay=self._retry_delay(attempt, status, headers, raw, policy)
+            if delay is None: break
+            time.sleep(delay)
         raise last
 
-    def upload_image_file(self, image_path: str, aspect_hint="IMAGE_ASPECT_RATIO_PORTRAIT")->Optional[str]:
-        b64,mime=_encode_image_file(image_path)
-        payload={"imageInput":{"rawImageBytes":b64,"mimeType":mime,"isUserUploaded":True,"aspectRatio":aspect_hint},
-                 "clientContext":{"sessionId":f"{int(time.time()*1000)}"}}
-        data=self._post(UPLOAD_IMAGE_URL,payload) or {}
-        mid=(data.get("mediaGenerationId") or {}).get("mediaGenerationId")
-        return mid
-
-    def start_one(self, job: Dict, model_key: str, aspect_ratio: str, prompt_text: str, copies:int=1, project_id: Optional[str]=DEFAULT_PROJECT_ID)->int:
-        """Start a scene with robust fallbacks: delay-after-upload, model ladder (I2V vs T2V), reupload-on-400, per-copy fallback, prompt trimming."""
-        copies=max(1,int(copies)); base_seed=int(job.get("seed",0)) if str(job.get("seed","")).isdigit() else 0
-        mid=job.get("media_id")
-
-        # Give backend a moment to index the uploaded image (avoids 400/500 immediately after upload)
-        time.sleep(1.0)
-
-        # IMPORTANT: choose fallbacks based on whether we're doing I2V (has start image) or T2V (no image)
-        FALLBACKS_I2V={
-            "VIDEO_ASPECT_RATIO_PORTRAIT":[
-                "veo_3_1_i2v_s_fast_portrait_ultra","veo_3_1_i2v_s_fast_portrait","veo_3_1_i2v_s_portrait","veo_3_1_i2v_s"
-            ],
-            "VIDEO_ASPECT_RATIO_LANDSCAPE":[
-                "veo_3_1_i2v_s_fast_ultra","veo_3_1_i2v_s_fast","veo_3_1_i2v_s"
-            ],
-            "VIDEO_ASPECT_RATIO_SQUARE":[
-                "veo_3_1_i2v_s_fast","veo_3_1_i2v_s"
-            ]
-        }
-        FALLBACKS_T2V={
-            "VIDEO_ASPECT_RATIO_PORTRAIT":[
-                "veo_3_1_t2v_fast_ultra","veo_3_1_t2v"
-            ],
-            "VIDEO_ASPECT_RATIO_LANDSCAPE":[
-                "veo_3_1_t2v_fast_ultra","veo_3_1_t2v"
-            ],
-            "VIDEO_ASPECT_RATIO_SQUARE":[
-                "veo_3_1_t2v_fast_ultra","veo_3_1_t2v"
-            ]
-        }
-        fallbacks = FALLBACKS_I2V if mid else FALLBACKS_T2V
-        # start with the user's chosen model, then ladder through same-family models for the aspect
-        models=[model_key]+[m for m in fallbacks.get(aspect_ratio, []) if m!=model_key]
-
-        # compose prompt text (trim if huge/complex)
-        prompt=_trim_prompt_text(prompt_text)
-
-        def _make_body(use_model, mid_val, copies_n):
-            reqs=[]
-            for k in range(copies_n):
-                seed=base_seed+k
-                item={"aspectRatio":aspect_ratio,"seed":seed,"videoModelKey":use_model,"textInput":{"prompt":prompt}}
-                if mid_val: item["startImage"]={"mediaId":mid_val}
-                reqs.append(item)
-            body={"requests":reqs}
-            if project_id: body["clientContext"]={"projectId":project_id}
-            return body
+    def job_token(self, job: Dict)->str:
+        """Token for a scene's upload and start: the one it is pinned to, else the least-loaded (the scene is pinned to it)."""
+        tok=token_dispatch.pick(self.tokens, job.get("token_fp")) or self._tok()
+        job["token_fp"]=key_manager._fingerprint(tok); return tok
 
-        def _try(body):
-            url=I2V_URL if mid else T2V_URL
-            return self._post(url, body) or {}
-
-        def _is_invalid(e: Exception)->bool:
-            s=str(e).lower()
-            return ("400" in str(e)) or ("invalid json" in s) or ("invalid argument" in s)
+    def upload_image_file(self, image_path: str, aspect_hint="IMAGE_ASPECT_RATIO_PORTRAIT", token: Optional[str]=None)->Optional[str]:
+        """Upload an image (with `token` when given), or reuse the mediaId cached for identical bytes + aspect hint (+ account)."""
+        key=media_cache.key_for(image_path, aspect_hint, key_manager._fingerprint(token) if token else None); mid=media_cache.get(key)
+        if mid:
+            self._emit("upload_cached", media_id=mid); return mid
+        data=self._post(UPLOAD_IMAGE_URL,_upload_payload(image_path, aspect_hint), token=token) or {}
+        mid=_media_id_of(data); media_cache.put(key, mid)
+        return mid
 
-        # 1) Try batch with model fallbacks
-        data=None; last_err=None
-        for mkey in models:
+    def _run_plan(self, plan):
+        result, error = None, None
+        while True:
+            try:
+                step = plan.throw(error) if error is not None else plan.send(result)
+            except StopIteration as stop:
+                return stop.value
+            result, error = None, None
             try:
-                data=_try(_make_body(mkey, mid, copies))
-                last_err=None; break
+                if step[0]=="sleep": time.sleep(step[1])
+                elif step[0]=="post": result=self._post(step[1], step[2], token=step[3] if len(step)>3 else None); _learn(step)
+                elif step[0]=="upload": result=self.upload_image_file(step[1], token=step[2] if len(step)>2 else None)
             except Exception as e:
-                last_err=e
-                if not _is_invalid(e): break
+                error = e
 
-        # 2) If invalid and have image -> reupload once then retry ladder (I2V only)
-        if last_err and _is_invalid(last_err) and mid and job.get("image_path"):
-            try:
-                new_mid=self.upload_image_file(job["image_path"])
-                if new_mid:
-                    job["media_id"]=new_mid; mid=new_mid
-                    for mkey in models:
-                        try:
-                            data=_try(_make_body(mkey, mid, copies)); last_err=None; break
-                        except Exception as e2:
-                            last_err=e2
-                            if not _is_invalid(e2): break
-            except Exception as e3:
-                last_err=e3
-
-        # 3) Per-copy fallback (still invalid)
-        job.setdefault("operation_names",[]); job.setdefault("video_by_idx", [None]*copies); job.setdefault("thumb_by_idx", [None]*copies); job.setdefault("op_index_map", {})
-        if data is None and last_err is not None:
-            for k in range(copies):
-                for mkey in models:
-                    try:
-                        dat=_try(_make_body(mkey, mid, 1))
-                        ops=dat.get("operations",[]) if isinstance(dat,dict) else []
-                        if ops:
-                            nm=(ops[0].get("operation") or {}).get("name") or ops[0].get("name") or ""
-                            if nm: job["operation_names"].append(nm); job["op_index_map"][nm]=k; break
-                    except Exception: continue
-            return len(job.get("operation_names",[]))
-
-        # 4) Batch success
-        ops=data.get("operations",[]) if isinstance(data,dict) else []
-        for ci,op in enumerate(ops):
-            nm=(op.get("operation") or {}).get("name") or op.get("name") or ""
-            if nm: job["operation_names"].append(nm); job["op_index_map"][nm]=ci
-        if job.get("operation_names"): job["status"]="PENDING"
-        return len(job.get("operation_names",[]))
+    def start_one(self, job: Dict, model_key: str, aspect_ratio: str, prompt_text: str, copies:int=1, project_id: Optional[str]=DEFAULT_PROJECT_ID)->int:
+        """Start a scene with robust fallbacks: retry-after-indexing for fresh uploads, model ladder (I2V vs T2V), reupload-on-400, per-copy fallback, prompt trimming."""
+        return self._run_plan(_start_plan(job, model_key, aspect_ratio, prompt_text, copies, project_id, self.tokens))
+
+    def start_many(self, jobs: List[Dict], model_key: str, aspect_ratio: str, copies:int=1, project_id: Optional[str]=DEFAULT_PROJECT_ID, max_batch: Optional[int]=None)->int:
+        """Start several scenes (job["prompt"] each) in as few calls as the batch limit allows; ops are recorded per job like start_one."""
+        return self._run_plan(_start_many_plan(jobs, model_key, aspect_ratio, copies, project_id, max_batch or _max_start_batch(), self.tokens))
+
+    def probe_models(self, model_key: str, aspect_ratio: str, media_id: Optional[str]=None, project_id: Optional[str]=DEFAULT_PROJECT_ID, prompt: str="A calm ocean at sunrise")->Dict:
+        """Warm the model-ladder record: which model each token can use for this aspect (I2V when media_id is given).
+        Starts one real render per token; returns {"models": {token fingerprint: model}, "operation_names": [...]}."""
+        return self._run_plan(_probe_plan(self.tokens, model_key, aspect_ratio, media_id, project_id, prompt))
 
     def _wrap_ops(self, op_names: List[str])->dict:
-        uniq=[]; seen=set()
-        for s in op_names or []:
-            if s and s not in seen: seen.add(s); uniq.append(s)
-        return {"operations":[{"operation":{"name":s}} for s in uniq]}
+        return _wrap_ops(op_names)
 
     def batch_check_operations(self, op_names: List[str])->Dict[str,Dict]:
+        """Status of operations; each is checked with the token that created it (unknown ones with any token)."""
         if not op_names: return {}
-        data=self._post(BATCH_CHECK_URL, self._wrap_ops(op_names)) or {}
-        out={}
-        def _dedup(xs):
-            seen=set(); r=[]
-            for x in xs:
-                if x not in seen: seen.add(x); r.append(x)
-            return r
-        for item in data.get("operations",[]):
-            key=(item.get("operation") or {}).get("name") or item.get("name") or ""
-            st=_normalize_status(item)
-            urls=_collect_urls_any(item.get("response",{})) or _collect_urls_any(item)
-            vurls=[u for u in urls if "/video/" in u]; iurls=[u for u in urls if "/image/" in u]
-            out[key or "unknown"]={"status": ("COMPLETED" if st=="DONE" and vurls else ("DONE_NO_URL" if st=="DONE" else st)),
-                                   "video_urls": _dedup(vurls), "image_urls": _dedup(iurls), "raw": item}
-        return out
+        out={}; last=None; groups=token_dispatch.group(op_names, self.tokens)
+        for tok, names in groups.items():
+            # status polls fail fast while the endpoint is down; the next tick tries again
+            try: out.update(_parse_batch_check(self._post(BATCH_CHECK_URL, self._wrap_ops(names), circuit_wait=0, token=tok) or {}))
+            except Exception as e: last=e
+        if last is not None and not out: raise last
+        return _checked(out)
@@ -1,6 +1,7 @@
 
 import os, json, requests
 from services.core.key_manager import get_key
+from services import transport
 
 def _load_keys():
     """Load keys using unified key manager"""
@@ -95,7 +96,7 @@ def _call_openai(prompt, api_key, model="gpt-5"):
         "response_format":{"type":"json_object"},
         "temperature":0.9
     }
-    r=requests.post(url,headers=headers,json=data,timeout=240); r.raise_for_status()
+    r=transport.post(url,headers=headers,json=data,timeout=240); r.raise_for_status()
     txt=r.json()["choices"][0]["message"]["content"]
     return json.loads(txt)
 
@@ -107,7 +108,7 @@ def _call_gemini(prompt, api_key, model="gemini-2.5-flash"):
         "contents":[{"role":"user","parts":[{"text":prompt}]}],
         "generationConfig":{"temperature":0.9,"response_mime_type":"application/json"}
     }
-    r=requests.post(url,headers=headers,json=data,timeout=240); r.raise_for_status()
+    r=transport.post(url,headers=headers,json=data,timeout=240); r.raise_for_status()
     out=r.json()
     txt=out["candidates"][0]["content"]["parts"][0]["text"]
     return json.loads(txt)
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent mediaId cache for Labs image uploads
+Keyed by sha256 of the image bytes + aspect hint, so re-runs, retries and scenes sharing
+a product photo reuse the mediaGenerationId instead of uploading again. Entries expire
+after labs.media_cache_ttl_sec (default 7 days) and are dropped when the server rejects
+the id (reupload-on-400 path calls invalidate()).
+"""
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from services.core.config import load as load_config
+
+CACHE_PATH = Path.home() / ".veo_media_cache.json"
+DEFAULT_TTL_SEC = 7 * 24 * 3600
+_SAVE_INTERVAL = 10.0
+
+_ENTRIES: Dict[str, dict] = {}          # key -> {"media_id", "at"}
+_HASHES: Dict[Tuple[str, int, int], str] = {}  # (path, mtime_ns, size) -> sha256
+_LOCK = threading.Lock()
+_dirty = False
+_last_save = 0.0
+
+
+def _ttl() -> float:
+    return float((load_config().get("labs") or {}).get("media_cache_ttl_sec") or DEFAULT_TTL_SEC)
+
+
+def _load():
+    try:
+        with open(CACHE_PATH, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        for k, v in (raw or {}).items():
+            if isinstance(v, dict) and v.get("media_id"):
+                _ENTRIES[k] = {"media_id": v["media_id"], "at": float(v.get("at") or 0)}
+    except Exception:
+        pass
+
+
+def save(force: bool = False):
+    """Persist entries (throttled unless forced)"""
+    global _dirty, _last_save
+    with _LOCK:
+        now = time.monotonic()
+        if not _dirty or (not force and now - _last_save < _SAVE_INTERVAL):
+            return
+        data = dict(_ENTRIES)
+        _dirty = False; _last_save = now
+    try:
+        tmp = CACHE_PATH.with_suffix('.tmp')
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        tmp.replace(CACHE_PATH)
+    except Exception:
+        pass
+
+
+def file_hash(path: str) -> Optional[str]:
+    """sha256 of a file's bytes, memoized per (path, mtime, size); None if unreadable"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    memo = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    h = _HASHES.get(memo)
+    if h is None:
+        d = hashlib.sha256()
+        try:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    d.update(chunk)
+        except OSError:
+            return None
+        h = _HASHES[memo] = d.hexdigest()
+    return h
+
+
+def key_for(image_path: str, aspect_hint: str, account: Optional[str] = None) -> Optional[str]:
+    """Cache key for image bytes + aspect hint (+ token fingerprint when the upload is pinned to an account)"""
+    h = file_hash(image_path)
+    if not h:
+        return None
+    return f"{h}|{aspect_hint}|{account}" if account else f"{h}|{aspect_hint}"
+
+
+def get(key: Optional[str]) -> Optional[str]:
+    """Cached mediaId for a key, None when missing or older than the TTL"""
+    global _dirty
+    if not key:
+        return None
+    with _LOCK:
+        e = _ENTRIES.get(key)
+        if e is None:
+            return None
+        if time.time() - e["at"] > _ttl():
+            del _ENTRIES[key]; _dirty = True
+            return None
+        return e["media_id"]
+
+
+def put(key: Optional[str], media_id: Optional[str]):
+    global _dirty
+    if not key or not media_id:
+        return
+    with _LOCK:
+        _ENTRIES[key] = {"media_id": media_id, "at": time.time()}
+        _dirty = True
+    save()
+
+
+def invalidate(media_id: Optional[str]):
+    """Forget every entry pointing at a mediaId the server rejected"""
+    global _dirty
+    if not media_id:
+        return
+    with _LOCK:
+        for k in [k for k, e in _ENTRIES.items() if e["media_id"] == media_id]:
+            del _ENTRIES[k]; _dirty = True
+    save(True)
+
+
+def clear():
+    global _dirty
+    with _LOCK:
+        _ENTRIES.clear(); _dirty = True
+    save(True)
+
+
+_load()
+atexit.register(save, True)
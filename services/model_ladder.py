@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Learned model-ladder record per (Labs token, aspect ratio, video model key)
+start_one used to walk the hardcoded FALLBACKS_* ladders from the top for every scene;
+with this record a model the account rejects is pruned for a while and models that recently
+worked move to the front. A 400 alone proves nothing about the model (the prompt, a policy
+block or a not-yet-indexed image get one too), so a rejection only counts when another model
+accepted the same body or a capability probe confirmed it. A client with several tokens
+prunes a model only when every token has rejected it.
+
+Config (optional)::
+
+    "labs": {"model_ladder": {"strikes": 2, "ttl_sec": 86400}}
+"""
+import atexit
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+from services.core.config import load as load_config
+from services.core.key_manager import _fingerprint
+
+LADDER_PATH = Path.home() / ".veo_model_ladder.json"
+_DEFAULTS = {'strikes': 2, 'ttl_sec': 24 * 3600}
+_SAVE_INTERVAL = 10.0
+
+_RECORDS: Dict[str, dict] = {}   # "token_fp|aspect|model" -> {"ok": ts, "bad": ts, "strikes": n}
+_LOCK = threading.Lock()
+_dirty = False
+_last_save = 0.0
+
+
+def _settings() -> dict:
+    return {**_DEFAULTS, **((load_config().get('labs') or {}).get('model_ladder') or {})}
+
+
+def _key(token: str, aspect: str, model: str) -> str:
+    return f"{_fingerprint(token)}|{aspect}|{model}"
+
+
+def _load():
+    try:
+        with open(LADDER_PATH, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        for k, v in (raw or {}).items():
+            if isinstance(v, dict):
+                _RECORDS[k] = {'ok': float(v.get('ok') or 0), 'bad': float(v.get('bad') or 0),
+                               'strikes': int(v.get('strikes') or 0)}
+    except Exception:
+        pass
+
+
+def save(force: bool = False):
+    """Persist records (throttled unless forced)"""
+    global _dirty, _last_save
+    with _LOCK:
+        now = time.monotonic()
+        if not _dirty or (not force and now - _last_save < _SAVE_INTERVAL):
+            return
+        data = {k: dict(v) for k, v in _RECORDS.items()}
+        _dirty = False; _last_save = now
+    try:
+        tmp = LADDER_PATH.with_suffix('.tmp')
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        tmp.replace(LADDER_PATH)
+    except Exception:
+        pass
+
+
+def record(token: str, aspect: str, model: str, ok: bool, definitive: bool = False):
+    """Note that `token` had `model` accepted (ok) or rejected as invalid for `aspect`
+    (definitive: a probe rejection, prunes immediately)"""
+    global _dirty
+    if not token or not model:
+        return
+    with _LOCK:
+        r = _RECORDS.setdefault(_key(token, aspect, model), {'ok': 0.0, 'bad': 0.0, 'strikes': 0})
+        if ok:
+            r['ok'] = time.time(); r['strikes'] = 0
+        else:
+            r['bad'] = time.time(); r['strikes'] += 1
+            if definitive:
+                r['strikes'] = max(r['strikes'], int(_settings()['strikes']))
+        _dirty = True
+    save()
+
+
+def _state(token: str, aspect: str, model: str, s: dict) -> str:
+    """'ok' | 'bad' | 'unknown' for one token, with expiry"""
+    r = _RECORDS.get(_key(token, aspect, model))
+    if r is None:
+        return 'unknown'
+    now = time.time()
+    if r['strikes'] >= s['strikes'] and now - r['bad'] < s['ttl_sec']:
+        return 'bad'
+    if r['ok'] and now - r['ok'] < s['ttl_sec']:
+        return 'ok'
+    return 'unknown'
+
+
+def order(ladder: List[str], tokens: Iterable[str], aspect: str) -> List[str]:
+    """
+    Reorder/prune a model ladder from what the tokens have learned
+
+    Args:
+        ladder: Candidate model keys, preferred first
+        tokens: The client's Labs tokens
+        aspect: Aspect ratio
+
+    Returns:
+        The user's model (ladder[0]) stays first unless every token rejected it; among the
+        fallbacks, models known to work come before untested ones. Models every token
+        rejected are dropped (the original ladder if that would leave nothing)
+    """
+    toks = [t for t in tokens if t]
+    if not toks:
+        return list(ladder)
+    s = _settings()
+    head, good, unknown = [], [], []
+    with _LOCK:
+        for i, m in enumerate(ladder):
+            states = {_state(t, aspect, m, s) for t in toks}
+            if states == {'bad'}:
+                continue
+            (head if i == 0 else good if 'ok' in states else unknown).append(m)
+    return (head + good + unknown) or list(ladder)
+
+
+def snapshot() -> Dict[str, dict]:
+    """Raw records for diagnostics (token fingerprints, not tokens)"""
+    with _LOCK:
+        return {k: dict(v) for k, v in _RECORDS.items()}
+
+
+def clear():
+    global _dirty
+    with _LOCK:
+        _RECORDS.clear(); _dirty = True
+    save(True)
+
+
+_load()
+atexit.register(save, True)
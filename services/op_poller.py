@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+"""
+Central Labs operation poller - one scheduler for every outstanding video operation
+Panels and pipelines register operation names with watch(); a single background thread
+merges all of them into batchCheckAsyncVideoGenerationStatus calls of at most max_batch
+names and fans each result back to the subscribers watching that operation. Request
+volume scales with the number of batches, not the number of open projects.
+
+Each operation carries its own next-check time from services.render_stats (model/aspect
+render-time history): only operations that are due are sent in a poll. Operations whose batch
+check failed are retried with exponential backoff from the poll interval (up to
+max_backoff_sec), or after the server's Retry-After / RetryInfo hint when it gave one.
+
+Config (optional)::
+
+    "poller": {"interval_sec": 5, "max_batch": 50, "max_delay_sec": 60, "max_backoff_sec": 300}
+"""
+import itertools
+import queue
+import random
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from services import render_stats, token_dispatch
+from services.circuit_breaker import CircuitOpenError
+from services.core.config import load as load_config
+from services.http_retry import retry_hint
+
+TERMINAL = frozenset({"COMPLETED", "DONE", "DONE_NO_URL", "FAILED", "ERROR"})
+
+_DEFAULTS = {'interval_sec': 5.0, 'max_batch': 50, 'max_delay_sec': 60.0, 'max_backoff_sec': 300.0}
+
+
+def _settings() -> dict:
+    return {**_DEFAULTS, **(load_config().get('poller') or {})}
+
+
+def is_terminal(info: dict) -> bool:
+    return (info or {}).get("status") in TERMINAL
+
+
+def error_hint(exc: BaseException) -> Optional[float]:
+    """Seconds the server asked us to wait before checking again (None: no hint)"""
+    if isinstance(exc, CircuitOpenError):
+        return max(0.0, float(exc.retry_in))
+    r = getattr(exc, 'response', None)
+    if r is None or not getattr(r, 'status_code', 0):
+        return None
+    return retry_hint(r.status_code, r.headers, getattr(r, 'text', None))[0]
+
+
+class _OpState:
+    """Scheduling info for one operation: model/aspect for render stats, submit time, next check"""
+    __slots__ = ('model', 'aspect', 'submitted_at', 'due', 'failures')
+
+    def __init__(self, meta: Optional[dict]):
+        meta = meta or {}
+        self.model = meta.get('model') or ''
+        self.aspect = meta.get('aspect') or ''
+        self.submitted_at = float(meta.get('submitted_at') or time.time())
+        self.due = 0.0  # monotonic; 0 = check on the next poll
+        self.failures = 0  # consecutive failed checks
+
+    def age(self) -> float:
+        return max(0.0, time.time() - self.submitted_at)
+
+
+class _Watch:
+    __slots__ = ('wid', 'client', 'names', 'callback')
+
+    def __init__(self, wid: int, client, names: Iterable[str], callback: Callable[[Dict[str, dict]], None]):
+        self.wid = wid
+        self.client = client
+        self.names = set(n for n in names if n)
+        self.callback = callback
+
+
+class OperationPoller:
+    """Registry of outstanding operations polled in merged batches on one daemon thread"""
+
+    def __init__(self, interval_sec: Optional[float] = None, max_batch: Optional[int] = None):
+        self._interval = interval_sec
+        self._max_batch = max_batch
+        self._watches: Dict[int, _Watch] = {}
+        self._ops: Dict[str, _OpState] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {'polls': 0, 'batches': 0, 'ops_checked': 0, 'errors': 0}
+
+    @property
+    def interval(self) -> float:
+        return float(self._interval or _settings()['interval_sec'])
+
+    @property
+    def max_batch(self) -> int:
+        return max(1, int(self._max_batch or _settings()['max_batch']))
+
+    def watch(self, client, op_names: Iterable[str], callback: Callable[[Dict[str, dict]], None],
+              meta: Optional[Dict[str, dict]] = None) -> int:
+        """
+        Subscribe to status updates for operations
+
+        Args:
+            client: LabsClient whose tokens may check these operations (clients with the same
+                    tokens share batches)
+            op_names: Operation names to follow
+            callback: Called on the poller thread with {op_name: check result} for this watch's
+                      operations present in each poll; terminal operations are reported once
+                      and then dropped
+            meta: {op_name: {"model", "aspect", "submitted_at"}} for predictive scheduling
+                  (operations without it are polled every interval)
+
+        Returns:
+            Watch id for unwatch()
+        """
+        wid = next(self._ids)
+        w = _Watch(wid, client, op_names, callback)
+        if not w.names:
+            return wid
+        with self._lock:
+            self._watches[wid] = w
+            self._track(w.names, meta)
+        self._ensure_thread()
+        self._wake.set()
+        return wid
+
+    def add(self, wid: int, op_names: Iterable[str], meta: Optional[Dict[str, dict]] = None):
+        """Add more operations to an existing watch"""
+        names = [n for n in op_names if n]
+        with self._lock:
+            w = self._watches.get(wid)
+            if w is not None:
+                w.names.update(names)
+                self._track(names, meta)
+        self._wake.set()
+
+    def _track(self, names: Iterable[str], meta: Optional[Dict[str, dict]]):
+        for n in names:
+            if n not in self._ops:
+                m = (meta or {}).get(n)
+                self._ops[n] = _OpState(m)
+                # operations restored after a restart count against (and are checked with) their token again
+                token_dispatch.pin(n, (m or {}).get('token_fp'))
+
+    def unwatch(self, wid: int):
+        with self._lock:
+            self._watches.pop(wid, None)
+            self._gc()
+
+    def _gc(self):
+        live = set().union(*(w.names for w in self._watches.values())) if self._watches else set()
+        for n in [n for n in self._ops if n not in live]:
+            del self._ops[n]
+
+    def pending(self) -> int:
+        """Distinct operations still being polled"""
+        with self._lock:
+            return len(set().union(*(w.names for w in self._watches.values()))) if self._watches else 0
+
+    def poll_now(self):
+        """Check every watched operation now, regardless of its schedule"""
+        with self._lock:
+            for st in self._ops.values(): st.due = 0.0
+        self._wake.set()
+
+    def _next_wake(self) -> float:
+        with self._lock:
+            if not self._ops:
+                return self.interval
+            soonest = min(st.due for st in self._ops.values())
+        return min(float(_settings()['max_delay_sec']), max(0.2, soonest - time.monotonic()))
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='op-poller', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self._next_wake())
+            self._wake.clear()
+            try:
+                self.poll_once()
+            except Exception:
+                self.stats['errors'] += 1
+
+    def _groups(self) -> List[tuple]:
+        # (client, sorted due names) per token set; clients with identical tokens share one group
+        groups: Dict[tuple, tuple] = {}
+        now = time.monotonic()
+        with self._lock:
+            for w in self._watches.values():
+                due = [n for n in w.names if n in self._ops and self._ops[n].due <= now]
+                if not due:
+                    continue
+                key = tuple(getattr(w.client, 'tokens', ()) or ()) or (id(w.client),)
+                client, names = groups.get(key, (w.client, set()))
+                names.update(due)
+                groups[key] = (client, names)
+        return [(c, sorted(n)) for c, n in groups.values() if n]
+
+    def poll_once(self) -> Dict[str, dict]:
+        """One merged poll of every watched operation; returns the combined results"""
+        results: Dict[str, dict] = {}
+        groups = self._groups()
+        if not groups:
+            return results
+        self.stats['polls'] += 1
+        size = self.max_batch
+        checked: List[str] = []
+        for client, names in groups:
+            for i in range(0, len(names), size):
+                chunk = names[i:i+size]
+                try:
+                    results.update(client.batch_check_operations(chunk) or {})
+                except Exception as e:
+                    self.stats['errors'] += 1
+                    self._backoff(chunk, error_hint(e))
+                    continue
+                self.stats['batches'] += 1
+                self.stats['ops_checked'] += len(chunk)
+                checked.extend(chunk)
+        self._reschedule(checked, results)
+        self._fan_out(results)
+        return results
+
+    def _backoff(self, names: List[str], hint: Optional[float]):
+        # failed chunk: wait interval x 2^(failures-1) (jittered), or the server's hint when longer
+        cfg = _settings()
+        cap = float(cfg['max_backoff_sec'])
+        now = time.monotonic()
+        with self._lock:
+            for n in names:
+                st = self._ops.get(n)
+                if st is None:
+                    continue
+                st.failures += 1
+                delay = min(cap, self.interval * 2 ** min(st.failures - 1, 16)) * (0.5 + 0.5 * random.random())
+                if hint is not None:
+                    delay = max(delay, min(hint, cap))
+                st.due = now + delay
+
+    def _reschedule(self, checked: List[str], results: Dict[str, dict]):
+        base = self.interval
+        max_delay = float(_settings()['max_delay_sec'])
+        now = time.monotonic()
+        with self._lock:
+            for n in checked:
+                st = self._ops.get(n)
+                if st is None:
+                    continue
+                st.failures = 0
+                info = results.get(n)
+                if info is not None and is_terminal(info):
+                    if info.get("status") in ("COMPLETED", "DONE", "DONE_NO_URL") and st.model:
+                        render_stats.record(st.model, st.aspect, st.age())
+                    st.due = float('inf')
+                else:
+                    st.due = now + render_stats.next_check_delay(st.model, st.aspect, st.age(), base, max_delay)
+
+    def _fan_out(self, results: Dict[str, dict]):
+        deliveries = []
+        with self._lock:
+            for wid, w in list(self._watches.items()):
+                sub = {n: results[n] for n in w.names if n in results}
+                if not sub:
+                    continue
+                w.names.difference_update(n for n, v in sub.items() if is_terminal(v))
+                if not w.names:
+                    del self._watches[wid]
+                deliveries.append((w.callback, sub))
+            self._gc()
+        for cb, sub in deliveries:
+            try:
+                cb(sub)
+            except Exception:
+                pass
+
+
+_POLLER: Optional[OperationPoller] = None
+_POLLER_LOCK = threading.Lock()
+
+
+def get_poller() -> OperationPoller:
+    """The process-wide poller shared by all panels and pipelines"""
+    global _POLLER
+    with _POLLER_LOCK:
+        if _POLLER is None:
+            _POLLER = OperationPoller()
+        return _POLLER
+
+
+def wait_for(client, op_names: Iterable[str], on_update: Optional[Callable[[Dict[str, dict]], None]] = None,
+             timeout: Optional[float] = None, should_stop: Optional[Callable[[], bool]] = None,
+             meta: Optional[Dict[str, dict]] = None) -> Dict[str, dict]:
+    """
+    Block a worker thread until the operations finish, using the shared poller
+
+    Args:
+        client: LabsClient for the operations
+        op_names: Operation names
+        on_update: Called (on this thread) with each batch of results for these operations
+        timeout: Give up after this many seconds
+        should_stop: Polled about once a second; True aborts the wait
+        meta: Per-operation model/aspect/submit time for predictive scheduling (see watch())
+
+    Returns:
+        {op_name: last result} for every operation that reported (terminal or not)
+    """
+    names = set(n for n in op_names if n)
+    last: Dict[str, dict] = {}
+    if not names:
+        return last
+    inbox: "queue.Queue[Dict[str, dict]]" = queue.Queue()
+    poller = get_poller()
+    wid = poller.watch(client, names, inbox.put, meta)
+    end = (time.monotonic() + timeout) if timeout else None
+    try:
+        while names:
+            if should_stop and should_stop():
+                break
+            left = (end - time.monotonic()) if end else 1.0
+            if left <= 0:
+                break
+            try:
+                sub = inbox.get(timeout=min(1.0, left))
+            except queue.Empty:
+                continue
+            last.update(sub)
+            names.difference_update(n for n, v in sub.items() if is_terminal(v))
+            if on_update:
+                on_update(sub)
+    finally:
+        poller.unwatch(wid)
+    return last
@@ -0,0 +1,492 @@
+# -*- coding: utf-8 -*-
+"""
+Qt-free project orchestration: prepare jobs, submit, poll, download, post-process
+The Qt panels (ui.project_panel) and the headless CLI (main_cli.py) drive the same
+functions; panels only translate the event dicts into signals.
+
+Events (on_event) are dicts like the clients' {"kind": ...}:
+    {"kind": "log", "level": "INFO"|"HTTP"|"WARN"|"ERR", "msg"}
+    {"kind": "progress", "percent", "text"}
+    {"kind": "job_update", "index", "job"}
+    plus the SubmissionEngine scene_* events during submit
+"""
+import datetime
+import json
+import os
+import re
+import shutil
+import threading
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait as wait_futures
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from services import token_dispatch
+from services.artifact_store import op_key
+from services.downloader import DownloadError, concurrency as download_concurrency, download_file, \
+    submit as submit_download
+from services.job_store import get_store
+from services.op_poller import TERMINAL, get_poller, wait_for
+from services.signed_url import EXPIRED_STATUS, expires_at, is_stale
+from services.submission_engine import SubmissionEngine
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".webp", ".bmp")
+
+
+def safe_name(s: str) -> str:
+    s = s or ""
+    s = s.lower().strip()
+    s = re.sub(r"\s+", "_", s)
+    s = re.sub(r"[^a-z0-9._-]+", "_", s)
+    s = re.sub(r"_+", "_", s).strip("_")
+    return s or "project"
+
+
+def parse_prompt_any(obj: Any) -> List[str]:
+    """Scene prompt texts from a prompt JSON (list, {"scenes": [...]}, {"prompt": ...} or anything else)"""
+    scenes = []
+    def _to_text(p):
+        if isinstance(p, str):
+            return p
+        try:
+            return json.dumps(p, ensure_ascii=False)
+        except Exception:
+            return str(p)
+    if isinstance(obj, list):
+        for it in obj:
+            if isinstance(it, dict) and "prompt" in it:
+                scenes.append(_to_text(it["prompt"]))
+            else:
+                scenes.append(_to_text(it))
+    elif isinstance(obj, dict):
+        if "scenes" in obj and isinstance(obj["scenes"], list):
+            for it in obj["scenes"]:
+                if isinstance(it, dict) and "prompt" in it:
+                    scenes.append(_to_text(it["prompt"]))
+                else:
+                    scenes.append(_to_text(it))
+        elif "prompt" in obj:
+            scenes.append(_to_text(obj["prompt"]))
+        else:
+            scenes.append(_to_text(obj))
+    return scenes
+
+
+def parse_prompt_file(path: str) -> List[str]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            obj = json.load(f)
+    except Exception:
+        return []
+    return parse_prompt_any(obj)
+
+
+def list_images(folder: str) -> List[str]:
+    """Image files of a folder, sorted by name"""
+    try:
+        names = sorted(os.listdir(folder))
+    except OSError:
+        return []
+    return [os.path.join(folder, n) for n in names if os.path.splitext(n)[1].lower() in IMAGE_EXTS]
+
+
+def project_paths(cfg: Dict, project_name: str) -> Dict[str, str]:
+    """Project folder layout under download_root (created if missing)"""
+    root = cfg.get("download_root") or os.path.join(os.path.expanduser("~"), "Downloads", "VeoProjects")
+    proj_dir = os.path.join(root, project_name)
+    dirs = {
+        "root": root,
+        "project": proj_dir,
+        "prompts": os.path.join(proj_dir, "Prompt video"),
+        "images": os.path.join(proj_dir, "Ảnh tham chiếu"),
+        "videos": os.path.join(proj_dir, "Video"),
+    }
+    for d in dirs.values():
+        os.makedirs(d, exist_ok=True)
+    return dirs
+
+
+def build_jobs(project_name: str, scenes: List[str], images: List[str], copies: int, is_t2v: bool,
+               paths: Dict[str, str]) -> Tuple[List[Dict], List[str]]:
+    """
+    Scene jobs for a project; saves each prompt and copies each image into the project folder
+
+    Returns:
+        (jobs, warnings)
+    """
+    warnings = []
+    if not scenes:
+        return [], ["Chưa có kịch bản (JSON)."]
+    if not is_t2v and not images:
+        return [], ["Chưa có ảnh tham chiếu."]
+    if is_t2v:
+        n = len(scenes)
+    else:
+        n = min(len(scenes), len(images))
+        if len(images) < len(scenes):
+            warnings.append(f"Số ảnh ({len(images)}) ít hơn số cảnh ({len(scenes)}); chỉ tạo {n} cảnh đầu.")
+    jobs = []
+    for i in range(n):
+        scene_id = i + 1
+        prompt_text = scenes[i]
+        prompt_filename = f"{safe_name(project_name)}_canh_{scene_id}_prompt.json"
+        try:
+            obj = json.loads(prompt_text)
+            with open(os.path.join(paths["prompts"], prompt_filename), "w", encoding="utf-8") as f:
+                f.write(json.dumps(obj, ensure_ascii=False, indent=2))
+        except Exception:
+            with open(os.path.join(paths["prompts"], prompt_filename.replace(".json", ".txt")), "w", encoding="utf-8") as f:
+                f.write(prompt_text)
+        dst = None
+        if not is_t2v:
+            src = images[i]
+            ext = os.path.splitext(src)[1].lower() or ".jpg"
+            dst = os.path.join(paths["images"], f"{safe_name(project_name)}_canh_{scene_id}_anh{ext}")
+            try:
+                if os.path.abspath(src) != os.path.abspath(dst):
+                    shutil.copy2(src, dst)
+            except Exception as e:
+                warnings.append(f"Không thể copy ảnh: {e}")
+                dst = src
+        jobs.append({"scene_id": f"{scene_id}", "prompt": prompt_text, "image_path": dst,
+                     "image_name": os.path.basename(dst) if dst else "",
+                     "media_id": None, "operation_names": [], "status": "NEW",
+                     "video_by_idx": [None] * copies, "thumb_by_idx": [None] * copies, "op_index_map": {},
+                     "downloaded_idx": set(), "thumb_icons": {}, "completed_at": ""})
+    if n == 0:
+        warnings.append("Không có cặp (prompt, ảnh) nào.")
+    return jobs, warnings
+
+
+def _set_url(job: Dict, ci: int, url: str):
+    """Keep the newest signed URL of a copy (0-based ci) and its expiry"""
+    job["video_by_idx"][ci] = url
+    exps = job.setdefault("url_exp_by_idx", [])
+    while len(exps) < len(job["video_by_idx"]): exps.append(None)
+    exps[ci] = expires_at(url)
+
+
+def url_expiry(job: Dict, copy_no: int) -> Optional[float]:
+    """Expiry of a copy's (1-based copy_no) signed URL; None when unknown"""
+    exps = job.get("url_exp_by_idx") or []
+    if copy_no - 1 < len(exps) and exps[copy_no - 1] is not None:
+        return exps[copy_no - 1]
+    vids = job.get("video_by_idx") or []
+    return expires_at(vids[copy_no - 1]) if copy_no - 1 < len(vids) else None
+
+
+def refresh_urls(client, jobs: List[Dict], items: Optional[Iterable[Tuple[int, int]]] = None,
+                 margin_sec: Optional[float] = None, force: bool = False, lock=None) -> List[Tuple[int, int]]:
+    """
+    Re-check finished operations in bulk to get freshly signed URLs before downloading
+
+    Args:
+        client: LabsClient (None: nothing is refreshed)
+        jobs: Project jobs
+        items: (job index, 1-based copy) pairs to consider; default every copy not yet downloaded
+        margin_sec: Refresh URLs expiring within this many seconds (default download.url_refresh_margin_sec)
+        force: Refresh the items regardless of expiry (a download was refused)
+        lock: Held while the new URLs are written into jobs (not during the status checks)
+
+    Returns:
+        (job index, copy) pairs whose URL changed
+    """
+    if client is None:
+        return []
+    if items is None:
+        items = [(idx, i) for idx, j in enumerate(jobs) for i, u in enumerate(j.get("video_by_idx") or [], start=1)
+                 if u and i not in j.get("downloaded_idx", set())]
+    by_op: Dict[str, Tuple[int, int]] = {}
+    for idx, i in items:
+        j = jobs[idx]
+        if not force and not is_stale(url_expiry(j, i), margin_sec):
+            continue
+        for op, ci in (j.get("op_index_map") or {}).items():
+            if ci == i - 1:
+                by_op[op] = (idx, i)
+                # terminal operations were released from their token; check them with it again
+                token_dispatch.pin(op, ((j.get("op_meta") or {}).get(op) or {}).get("token_fp"))
+    names = list(by_op); changed = []
+    size = get_poller().max_batch
+    for k in range(0, len(names), size):
+        try: rs = client.batch_check_operations(names[k:k+size]) or {}
+        except Exception: continue
+        with lock or nullcontext():
+            for op, v in rs.items():
+                if op not in by_op or not v.get("video_urls"): continue
+                idx, i = by_op[op]; j = jobs[idx]
+                if j["video_by_idx"][i - 1] != v["video_urls"][0]:
+                    _set_url(j, i - 1, v["video_urls"][0]); changed.append((idx, i))
+    return changed
+
+
+def apply_check_results(jobs: List[Dict], rs: Dict[str, dict]) -> List[int]:
+    """Merge batch-check results into jobs; returns indexes of jobs that were touched"""
+    touched = []
+    for idx, j in enumerate(jobs):
+        found = False
+        for nm in j.get("operation_names", []):
+            if nm in rs:
+                v = rs[nm]; found = True
+                if v.get("video_urls"):
+                    vids = v["video_urls"]; ci = j.get("op_index_map", {}).get(nm, 0)
+                    while len(j["video_by_idx"]) <= ci: j["video_by_idx"].append(None); j["thumb_by_idx"].append(None)
+                    _set_url(j, ci, vids[0])
+                    if v.get("image_urls"): j["thumb_by_idx"][ci] = v["image_urls"][0]
+                j.setdefault("op_status", {})[nm] = v.get("status", "PROCESSING")
+                j["status"] = v.get("status", "PROCESSING")
+        if not found and j.get("status") == "PENDING": j["status"] = "PROCESSING"
+        if found: touched.append(idx)
+    return touched
+
+
+def video_path(outdir: str, project_name: str, job: Dict, copy_no: int) -> str:
+    return os.path.join(outdir, f"{safe_name(project_name)}_canh_{job.get('scene_id', '')}_video_{copy_no}.mp4")
+
+
+def _mark_downloaded(job: Dict, copy_no: int, dest: str, expected_copies: int, lock=None):
+    with lock or nullcontext():
+        job.setdefault("downloaded_idx", set()).add(copy_no)
+        job.setdefault("local_paths", []).append(dest); job["status"] = "DOWNLOADED"
+        if len(job["downloaded_idx"]) >= min(expected_copies, len(job.get("video_by_idx") or [])):
+            job["completed_at"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _copy_keys(job: Dict, copy_no: int) -> List[str]:
+    """Artifact store keys of a copy: the operation that rendered it"""
+    return [op_key(op) for op, ci in (job.get("op_index_map") or {}).items() if ci == copy_no - 1]
+
+
+def download_video(job: Dict, copy_no: int, url: str, outdir: str, project_name: str, expected_copies: int,
+                   lock=None) -> str:
+    """Download one finished copy (1-based copy_no) and mark it on the job (under lock); returns the local path"""
+    dest = download_file(url, video_path(outdir, project_name, job, copy_no), keys=_copy_keys(job, copy_no))
+    _mark_downloaded(job, copy_no, dest, expected_copies, lock)
+    return dest
+
+
+def download_jobs(jobs: List[Dict], outdir: str, project_name: str, expected_copies: int = 1,
+                  only_missing: bool = True, on_event: Optional[Callable[[dict], None]] = None,
+                  client=None, lock=None) -> Tuple[int, int, bool]:
+    """
+    Download every finished video of the jobs (concurrently, through services.downloader)
+
+    Copies go out soonest-expiring URL first, a few more than the downloader runs at once. With a
+    client, URLs about to expire are refreshed in bulk just before their copies are queued, and a
+    copy refused as expired is refreshed and retried once. Jobs are only modified while holding
+    lock, so other threads can snapshot them (e.g. for the job store) under the same lock.
+
+    Returns:
+        (downloaded, attempted, all_success)
+    """
+    emit = _emitter(on_event)
+    os.makedirs(outdir, exist_ok=True)
+    all_success = True
+    todo: List[Tuple[int, int]] = []
+    left: Dict[int, int] = {}
+    for idx, j in enumerate(jobs):
+        vids = j.get("video_by_idx") or []
+        if not vids:
+            all_success = False; continue
+        with lock or nullcontext(): j.setdefault("downloaded_idx", set())
+        for i, u in enumerate(vids, start=1):
+            if not u: continue
+            if only_missing and (i in j["downloaded_idx"]): continue
+            todo.append((idx, i)); left[idx] = left.get(idx, 0) + 1
+    todo.sort(key=lambda t: url_expiry(jobs[t[0]], t[1]) or float("inf"))
+    attempts = len(todo); ok = 0; done = 0
+    window = 2 * download_concurrency()
+    retried = set(); inflight = {}
+    while todo or inflight:
+        if todo and len(inflight) < window:
+            batch, todo = todo[:window - len(inflight)], todo[window - len(inflight):]
+            if client is not None and any(is_stale(url_expiry(jobs[idx], i)) for idx, i in batch):
+                n = len(refresh_urls(client, jobs, batch + todo, lock=lock))
+                if n: emit("log", level="HTTP", msg=f"Làm mới {n} link tải sắp hết hạn")
+            for idx, i in batch:
+                j = jobs[idx]; u = j["video_by_idx"][i - 1]
+                inflight[submit_download(u, video_path(outdir, project_name, j, i), keys=_copy_keys(j, i))] = (idx, i, u)
+        finished, _ = wait_futures(inflight, return_when=FIRST_COMPLETED)
+        for fut in finished:
+            idx, i, u = inflight.pop(fut); j = jobs[idx]
+            try:
+                dest = fut.result()
+                _mark_downloaded(j, i, dest, expected_copies, lock); ok += 1
+                emit("log", level="HTTP", msg=f"Tải OK -> {dest}")
+            except DownloadError as e:
+                if e.status in EXPIRED_STATUS and (idx, i) not in retried and refresh_urls(client, jobs, [(idx, i)], force=True, lock=lock):
+                    retried.add((idx, i)); todo.insert(0, (idx, i))
+                    emit("log", level="WARN", msg=f"Link hết hạn, tải lại với link mới: cảnh {j.get('scene_id', '')} bản {i}")
+                    continue
+                emit("log", level="ERR", msg=f"Tải thất bại: {u} ({e})")
+                all_success = False
+            except Exception as e:
+                emit("log", level="ERR", msg=f"Tải thất bại: {u} ({e})")
+                all_success = False
+            done += 1; left[idx] -= 1
+            if not left[idx]:
+                # listeners may copy the job (Qt signals do): not while another thread changes it
+                with lock or nullcontext(): emit("job_update", index=idx, job=j)
+            emit("progress", percent=int(done*100/attempts), text=f"Đã tải {ok}/{attempts}")
+    if not attempts:
+        emit("progress", percent=100, text="Đã tải 0/0")
+    return ok, attempts, all_success
+
+
+def _emitter(on_event: Optional[Callable[[dict], None]]):
+    def emit(kind: str, **kw):
+        if on_event:
+            try: on_event({"kind": kind, **kw})
+            except Exception: pass
+    return emit
+
+
+class ProjectRunner:
+    """
+    One project end to end without Qt: submit (pipelined, batched), follow operations through the
+    shared poller, download each video as soon as it is ready, optional post-processing.
+    Every job change is saved to the job store so an interrupted run can be resumed.
+    """
+
+    def __init__(self, project_name: str, client, model: str, aspect: str, copies: int, project_id: Optional[str],
+                 outdir: str, on_event: Optional[Callable[[dict], None]] = None,
+                 concurrency: Optional[int] = None, upload_concurrency: Optional[int] = None,
+                 download_concurrency: int = 4, post_process: Optional[Callable[[str, Dict, int], None]] = None,
+                 should_stop: Optional[Callable[[], bool]] = None, persist: bool = True):
+        self.project_name = project_name
+        self.client = client
+        self.model, self.aspect, self.copies, self.project_id = model, aspect, int(copies), project_id
+        self.outdir = outdir
+        self.concurrency, self.upload_concurrency = concurrency, upload_concurrency
+        self.download_concurrency = max(1, int(download_concurrency))
+        self.post_process = post_process
+        self.should_stop = should_stop
+        self.persist = persist
+        self.jobs: List[Dict] = []
+        self._emit = _emitter(on_event)
+        self._on_event = on_event
+        self._lock = threading.Lock()
+
+    def save(self, idx: int):
+        if self.persist and 0 <= idx < len(self.jobs):
+            try:
+                # download workers change jobs under the same lock
+                with self._lock: get_store().save_job(self.project_name, self.jobs[idx], seq=idx)
+            except Exception as e: self._emit("log", level="WARN", msg=f"Không lưu được trạng thái: {e}")
+
+    def set_jobs(self, jobs: List[Dict], replace_saved: bool = True):
+        self.jobs = jobs
+        if self.persist and replace_saved:
+            get_store().delete_project(self.project_name)
+        for i in range(len(jobs)): self.save(i)
+
+    def resume(self) -> int:
+        """Load the project's saved jobs; returns how many"""
+        self.jobs = get_store().load_jobs(self.project_name)
+        return len(self.jobs)
+
+    def submit(self) -> int:
+        """Upload + start every job that has no operation yet; returns scenes started"""
+        todo = [i for i, j in enumerate(self.jobs) if not j.get("operation_names")]
+        if not todo:
+            return 0
+        sub = [self.jobs[i] for i in todo]
+
+        def on_event(ev):
+            i = todo[ev.get("index", 0)] if ev.get("index") is not None else None
+            if i is not None:
+                ev = {**ev, "index": i}
+                if ev.get("kind") != "scene_uploaded":
+                    self.save(i)
+            if self._on_event:
+                try: self._on_event(ev)
+                except Exception: pass
+
+        eng = SubmissionEngine(self.client, self.model, self.aspect, self.copies, self.project_id,
+                               concurrency=self.concurrency, upload_concurrency=self.upload_concurrency,
+                               on_event=on_event, should_stop=self.should_stop)
+        self._emit("log", level="INFO", msg=f"Gửi {len(sub)} cảnh (tối đa {eng.concurrency} start, {eng.upload_concurrency} upload)…")
+        return eng.run(sub)
+
+    def follow(self, timeout: Optional[float] = None) -> Tuple[int, int]:
+        """
+        Poll every open operation and download videos as they finish
+
+        Returns:
+            (videos downloaded, videos that failed to render or download)
+        """
+        names = [n for j in self.jobs for n in j.get("operation_names", [])
+                 if (j.get("op_status") or {}).get(n) not in TERMINAL]
+        meta = {n: m for j in self.jobs for n, m in (j.get("op_meta") or {}).items()}
+        counts = {"ok": 0, "failed": 0}
+        queued = set()   # (idx, copy) queued or downloading: later poll updates must not queue them again
+        pool = ThreadPoolExecutor(self.download_concurrency, thread_name_prefix="download")
+
+        def fetch(idx: int, copy_no: int):
+            j = self.jobs[idx]
+            url = ""
+            try:
+                with self._lock:
+                    if copy_no in j.get("downloaded_idx", set()): return
+                    url = j["video_by_idx"][copy_no - 1]   # the newest URL, refreshed since queueing
+                try:
+                    dest = download_video(j, copy_no, url, self.outdir, self.project_name, self.copies, self._lock)
+                except DownloadError as e:
+                    if e.status not in EXPIRED_STATUS: raise
+                    if not refresh_urls(self.client, self.jobs, [(idx, copy_no)], force=True, lock=self._lock): raise
+                    with self._lock: url = j["video_by_idx"][copy_no - 1]
+                    dest = download_video(j, copy_no, url, self.outdir, self.project_name, self.copies, self._lock)
+                self._emit("log", level="HTTP", msg=f"Tải OK -> {dest}")
+                if self.post_process:
+                    self.post_process(dest, j, copy_no)
+                with self._lock: counts["ok"] += 1
+            except Exception as e:
+                self._emit("log", level="ERR", msg=f"Tải thất bại: {url} ({e})")
+                with self._lock: counts["failed"] += 1
+            finally:
+                with self._lock: queued.discard((idx, copy_no))
+            self.save(idx); self._emit("job_update", index=idx, job=j)
+
+        def queue_downloads(indexes):
+            with self._lock:
+                items = [(idx, copy_no) for idx in indexes
+                         for copy_no, url in enumerate(self.jobs[idx].get("video_by_idx") or [], start=1)
+                         if url and copy_no not in self.jobs[idx].get("downloaded_idx", set())
+                         and (idx, copy_no) not in queued]
+                queued.update(items)
+            # soonest-expiring URLs first
+            items.sort(key=lambda t: url_expiry(self.jobs[t[0]], t[1]) or float("inf"))
+            for idx, copy_no in items:
+                pool.submit(fetch, idx, copy_no)
+
+        def on_update(rs):
+            with self._lock:
+                touched = apply_check_results(self.jobs, rs)
+            for idx in touched:
+                self.save(idx); self._emit("job_update", index=idx, job=self.jobs[idx])
+            failed = sum(1 for v in rs.values() if v.get("status") in ("FAILED", "ERROR"))
+            if failed:
+                with self._lock: counts["failed"] += failed
+            queue_downloads(touched)
+
+        os.makedirs(self.outdir, exist_ok=True)
+        try:
+            # finished before a restart but not downloaded: their URLs may be near expiry by now
+            stale = refresh_urls(self.client, self.jobs, lock=self._lock)
+            for idx in sorted({idx for idx, _ in stale}): self.save(idx)
+            queue_downloads(range(len(self.jobs)))
+            if names:
+                self._emit("log", level="INFO", msg=f"Theo dõi {len(names)} operation…")
+                wait_for(self.client, names, on_update=on_update, timeout=timeout,
+                         should_stop=self.should_stop, meta=meta)
+        finally:
+            pool.shutdown(wait=True)
+        return counts["ok"], counts["failed"]
+
+    def run(self, timeout: Optional[float] = None) -> Dict[str, int]:
+        """submit() then follow(); returns a summary"""
+        started = self.submit()
+        ok, failed = self.follow(timeout)
+        summary = {"scenes": len(self.jobs), "started": started, "downloaded": ok, "failed": failed,
+                   "expected": len(self.jobs) * self.copies}
+        self._emit("progress", percent=100, text=f"Đã tải {ok} video, lỗi {failed}")
+        return summary
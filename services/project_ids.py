@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Flow project id per Labs token
+Every start used to go to DEFAULT_PROJECT_ID (or the one default_project_id from config),
+whichever account sent it. Starts now take their clientContext.projectId from:
+
+1. labs.project_ids - explicit {token fingerprint (or token): project id} mapping
+2. projects created for a token with create()/ensure() (kept in ~/.veo_project_ids.json)
+3. labs.project_pool - ids shared by all tokens, sharded across starts (least-used first)
+4. the caller's project_id
+
+The id a start used is recorded with its operations (op_meta / job store ops table).
+create() and validate() talk to the Flow project endpoints (services.endpoints.FLOW_BASE),
+which can point at the local stand-in in tools/labs_standin.py.
+
+Config (optional)::
+
+    "labs": {"project_ids": {"<token fingerprint>": "<project id>"}, "project_pool": ["<id>", "<id>"]}
+"""
+import json
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+from urllib.parse import quote
+
+from services import transport
+from services.core.config import load as load_config
+from services.core.key_manager import _fingerprint
+from services.endpoints import PROJECT_CREATE_URL, PROJECT_GET_URL
+from services.retry_policy import policy_for
+
+PROJECTS_PATH = Path.home() / ".veo_project_ids.json"
+
+_CREATED: Dict[str, str] = {}   # token fp -> project id created for it
+_POOL_USE: Dict[str, int] = {}  # pool project id -> starts sent to it
+_LOCK = threading.Lock()
+
+
+def _labs() -> dict:
+    return load_config().get('labs') or {}
+
+
+def _load():
+    try:
+        with open(PROJECTS_PATH, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        _CREATED.update({str(k): str(v) for k, v in (raw or {}).items() if v})
+    except Exception:
+        pass
+
+
+def _save():
+    with _LOCK:
+        data = dict(_CREATED)
+    try:
+        tmp = PROJECTS_PATH.with_suffix('.tmp')
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        tmp.replace(PROJECTS_PATH)
+    except Exception:
+        pass
+
+
+def mapped(token: str) -> Optional[str]:
+    """Project id configured or created for this token (no pool/fallback)"""
+    if not token:
+        return None
+    fp = _fingerprint(token)
+    m = _labs().get('project_ids') or {}
+    if isinstance(m, dict):
+        pid = m.get(fp) or m.get(token)
+        if pid:
+            return str(pid)
+    with _LOCK:
+        return _CREATED.get(fp)
+
+
+def project_for(token: Optional[str], fallback: Optional[str]) -> Optional[str]:
+    """
+    Project id for a start sent with `token`
+
+    Args:
+        token: Token the start is pinned to (None: only the pool/fallback apply)
+        fallback: The caller's project id
+
+    Returns:
+        Mapped id, else the least-used pool id (counted as used), else fallback
+    """
+    pid = mapped(token) if token else None
+    if pid:
+        return pid
+    pool = [str(p) for p in (_labs().get('project_pool') or []) if p]
+    if not pool:
+        return fallback
+    with _LOCK:
+        pid = min(pool, key=lambda p: _POOL_USE.get(p, 0))
+        _POOL_USE[pid] = _POOL_USE.get(pid, 0) + 1
+    return pid
+
+
+def _headers(token: str) -> dict:
+    from services.labs_flow_service import _headers as labs_headers
+    return labs_headers(token)
+
+
+def _find_project_id(obj) -> Optional[str]:
+    if isinstance(obj, dict):
+        if obj.get('projectId'):
+            return str(obj['projectId'])
+        for v in obj.values():
+            r = _find_project_id(v)
+            if r: return r
+    elif isinstance(obj, list):
+        for v in obj:
+            r = _find_project_id(v)
+            if r: return r
+    return None
+
+
+def create(token: str, title: str = "Veo batch") -> str:
+    """
+    Create a Flow project owned by `token`'s account and map the token to it
+
+    Returns:
+        The new project id
+
+    Raises:
+        RuntimeError: the endpoint answered without a project id
+        requests.HTTPError: non-2xx response
+    """
+    r = transport.post(PROJECT_CREATE_URL, headers=_headers(token),
+                       json={"json": {"projectTitle": title, "toolName": "PINHOLE"}},
+                       timeout=policy_for(PROJECT_CREATE_URL).timeout)
+    r.raise_for_status()
+    pid = _find_project_id(r.json())
+    if not pid:
+        raise RuntimeError("Tạo project không trả về projectId")
+    with _LOCK:
+        _CREATED[_fingerprint(token)] = pid
+    _save()
+    return pid
+
+
+def validate(token: str, project_id: str) -> bool:
+    """True if the project exists for `token`'s account (False on 400/403/404, raises on other errors)"""
+    q = quote(json.dumps({"json": {"projectId": project_id}}, separators=(',', ':')))
+    r = transport.get(f"{PROJECT_GET_URL}?input={q}", headers=_headers(token),
+                      timeout=policy_for(PROJECT_GET_URL).timeout)
+    if r.status_code in (400, 403, 404):
+        return False
+    r.raise_for_status()
+    return True
+
+
+def ensure(tokens: Iterable[str], title: str = "Veo batch", check: bool = True) -> Dict[str, str]:
+    """
+    Give every token a project of its own: keep a mapped id that validates, else create one
+
+    Returns:
+        {token fingerprint: project id}; tokens whose create failed are left out
+    """
+    out = {}
+    for t in [t for t in tokens if t]:
+        pid = mapped(t)
+        try:
+            if pid and (not check or validate(t, pid)):
+                out[_fingerprint(t)] = pid; continue
+            out[_fingerprint(t)] = create(t, title)
+        except Exception:
+            continue
+    return out
+
+
+def forget(token: str):
+    """Drop the project created for a token (config mappings are untouched)"""
+    with _LOCK:
+        _CREATED.pop(_fingerprint(token), None)
+    _save()
+
+
+_load()
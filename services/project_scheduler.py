@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+Global multi-project scheduler - keeps a target number of Labs operations in flight
+Queued projects hand their scene jobs to one scheduler instead of running one after the
+other: whenever operations finish (or are reserved but fail to start) the freed capacity is
+granted to the next project's scenes, so project N+1 starts submitting while project N's
+last scenes are still rendering or downloading.
+
+Projects with a higher priority get capacity first; projects of equal priority share it in
+proportion to their weight (stride scheduling on operations granted). Each grant is a small
+slice of scenes submitted through SubmissionEngine; the started operations are followed on
+the shared op poller until they are terminal.
+
+Config (optional)::
+
+    "scheduler": {"target_inflight": 24, "op_timeout_sec": 1800}
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from services.core.config import load as load_config
+from services.labs_flow_service import _max_start_batch
+from services.op_poller import get_poller, is_terminal
+from services.submission_engine import SubmissionEngine, _settings as _submission_settings
+
+_DEFAULTS = {'target_inflight': 24, 'op_timeout_sec': 1800.0}
+
+
+def _settings() -> dict:
+    return {**_DEFAULTS, **(load_config().get('scheduler') or {})}
+
+
+class _Entry:
+    """One queued project: its jobs, share settings and progress counters"""
+
+    def __init__(self, name: str, client, jobs: List[Dict], model: str, aspect: str, copies: int,
+                 project_id: Optional[str], priority: int, weight: float, indexes: List[int],
+                 on_event: Optional[Callable[[dict], None]], seq: int):
+        self.name = name
+        self.client = client
+        self.jobs = jobs
+        self.model, self.aspect, self.copies, self.project_id = model, aspect, max(1, int(copies)), project_id
+        self.priority = int(priority)
+        self.weight = max(0.01, float(weight))
+        self.pending = list(indexes)     # scene indexes not granted yet
+        self.total = len(indexes)
+        self.granting = 0                # scenes inside running grants
+        self.started = 0                 # scenes that started at least one operation
+        self.failed = 0
+        self.ops: set = set()            # this project's operations still rendering
+        self.vtime = 0.0                 # operations granted / weight (fair share clock)
+        self.cancelled = False
+        self.on_event = on_event
+        self.seq = seq
+
+    @property
+    def state(self) -> str:
+        if self.cancelled:
+            return "cancelled"
+        if self.granting:
+            return "submitting"
+        if self.pending:
+            return "queued"
+        return "rendering" if self.ops else "done"
+
+    def emit(self, ev: dict):
+        if self.on_event:
+            try: self.on_event({"project": self.name, **ev})
+            except Exception: pass
+
+
+class ProjectScheduler:
+    """Admits scenes of all queued projects while in-flight operations are below a target"""
+
+    def __init__(self, target_inflight: Optional[int] = None, grant_workers: Optional[int] = None):
+        self._target = target_inflight
+        self._entries: Dict[str, _Entry] = {}
+        self._live: Dict[str, float] = {}   # op name -> start time (monotonic)
+        self._reserved = 0                  # operations granted but not started yet
+        self._watches: Dict[int, set] = {}  # poller watch id -> its non-terminal op names
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._pool = ThreadPoolExecutor(max(1, int(grant_workers or _submission_settings()['concurrency'])),
+                                        thread_name_prefix='sched-grant')
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def target_inflight(self) -> int:
+        return max(1, int(self._target or _settings()['target_inflight']))
+
+    # -- queue management --
+
+    def enqueue(self, name: str, client, jobs: List[Dict], model: str, aspect: str, copies: int,
+                project_id: Optional[str], priority: int = 0, weight: float = 1.0,
+                indexes: Optional[List[int]] = None, on_event: Optional[Callable[[dict], None]] = None) -> bool:
+        """
+        Queue a project's scenes for submission
+
+        Args:
+            name: Project name (one active entry per name)
+            client: LabsClient used for its uploads, starts and polling
+            jobs: Scene job dicts, updated in place as SubmissionEngine does
+            model, aspect, copies, project_id: As for SubmissionEngine
+            priority: Higher is served first
+            weight: Share of capacity relative to other projects of the same priority
+            indexes: Scenes to submit (default: all)
+            on_event: Called from scheduler threads with the SubmissionEngine scene_* events
+                      (index = position in jobs) and
+                      {"kind": "grant_done", "project", "scenes", "ops"} after each slice,
+                      {"kind": "project_submitted", "project", "started", "failed"} when every
+                      scene has been started, failed or been cancelled
+
+        Returns:
+            False if the project still has scenes waiting or being submitted
+        """
+        with self._cond:
+            old = self._entries.get(name)
+            if old is not None and (old.pending or old.granting):
+                return False
+            self._seq += 1
+            e = _Entry(name, client, jobs, model, aspect, copies, project_id, priority, weight,
+                       list(range(len(jobs))) if indexes is None else list(indexes), on_event, self._seq)
+            if old is not None:
+                e.ops = old.ops
+            # join at the current fair-share clock of its priority so it can't starve the others
+            peers = [x.vtime for x in self._entries.values() if x.pending and x.priority == e.priority]
+            e.vtime = min(peers) if peers else 0.0
+            self._entries[name] = e
+            self._ensure_thread()
+            self._cond.notify_all()
+        if not e.pending:
+            e.emit({"kind": "project_submitted", "started": 0, "failed": 0})
+        return True
+
+    def set_share(self, name: str, priority: Optional[int] = None, weight: Optional[float] = None):
+        """Change a queued project's priority and/or weight"""
+        with self._cond:
+            e = self._entries.get(name)
+            if e is None:
+                return
+            if priority is not None: e.priority = int(priority)
+            if weight is not None: e.weight = max(0.01, float(weight))
+            self._cond.notify_all()
+
+    def cancel(self, name: str):
+        """Drop a project's scenes that haven't been granted; running slices stop starting new work"""
+        with self._cond:
+            e = self._entries.get(name)
+            if e is None:
+                return
+            e.cancelled = True
+            dropped, e.pending = e.pending, []
+            self._cond.notify_all()
+        for i in dropped:
+            e.emit({"kind": "scene_cancelled", "index": i})
+        if dropped and not e.granting:
+            e.emit({"kind": "project_submitted", "started": e.started, "failed": e.failed})
+
+    def forget(self, name: str):
+        """Remove a project from the queue view (its operations stop counting)"""
+        self.cancel(name)
+        with self._cond:
+            e = self._entries.pop(name, None)
+            if e is not None:
+                for n in e.ops: self._live.pop(n, None)
+            self._cond.notify_all()
+
+    # -- introspection --
+
+    def inflight(self) -> int:
+        """Operations rendering plus operations reserved by slices still submitting"""
+        with self._cond:
+            self._expire()
+            return len(self._live) + self._reserved
+
+    def queue(self) -> List[Dict]:
+        """Rows for a queue view, highest priority first"""
+        with self._cond:
+            self._expire()
+            rows = [{"project": e.name, "priority": e.priority, "weight": e.weight, "state": e.state,
+                     "scenes": e.total, "waiting": len(e.pending), "submitting": e.granting,
+                     "started": e.started, "failed": e.failed, "inflight": len(e.ops)}
+                    for e in sorted(self._entries.values(), key=lambda x: (-x.priority, x.seq))]
+        return rows
+
+    # -- scheduling --
+
+    def _expire(self):
+        # operations that never report back stop holding capacity after op_timeout_sec
+        cutoff = time.monotonic() - float(_settings()['op_timeout_sec'])
+        for n in [n for n, t in self._live.items() if t < cutoff]:
+            del self._live[n]
+            for e in self._entries.values(): e.ops.discard(n)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='project-scheduler', daemon=True)
+            self._thread.start()
+
+    def _pick(self) -> Optional[_Entry]:
+        cands = [e for e in self._entries.values() if e.pending]
+        if not cands:
+            return None
+        top = max(e.priority for e in cands)
+        return min((e for e in cands if e.priority == top), key=lambda e: (e.vtime, e.seq))
+
+    def _grant(self) -> Optional[tuple]:
+        """Reserve capacity for the next slice of scenes, or None if nothing can go now"""
+        self._expire()
+        e = self._pick()
+        if e is None:
+            return None
+        free = self.target_inflight - len(self._live) - self._reserved
+        per_call = max(1, _max_start_batch() // e.copies)
+        n = min(len(e.pending), per_call, free // e.copies)
+        if n <= 0:
+            # a project with more copies per scene than the target still gets one scene at a time
+            if self._live or self._reserved:
+                return None
+            n = 1
+        idx, e.pending = e.pending[:n], e.pending[n:]
+        e.granting += n
+        e.vtime += n * e.copies / e.weight
+        self._reserved += n * e.copies
+        return e, idx
+
+    def _run(self):
+        while True:
+            with self._cond:
+                g = self._grant()
+                if g is None:
+                    self._cond.wait(1.0)
+                    continue
+            self._pool.submit(self._submit_slice, *g)
+
+    def _submit_slice(self, e: _Entry, idx: List[int]):
+        sub = [e.jobs[i] for i in idx]
+        before = [set(j.get("operation_names") or []) for j in sub]
+        counts = {"scene_started": 0, "scene_failed": 0}
+
+        def on_event(ev):
+            kind = ev.get("kind")
+            if kind in counts: counts[kind] += 1
+            if "index" in ev: ev = {**ev, "index": idx[ev["index"]]}
+            e.emit(ev)
+
+        try:
+            SubmissionEngine(e.client, e.model, e.aspect, e.copies, e.project_id, concurrency=1,
+                             on_event=on_event, should_stop=lambda: e.cancelled).run(sub)
+        except Exception as ex:
+            e.emit({"kind": "log", "level": "ERR", "msg": f"Lỗi gửi cảnh: {ex}"})
+        new = [n for j, b in zip(sub, before) for n in (j.get("operation_names") or []) if n not in b]
+        meta = {n: m for j in sub for n, m in (j.get("op_meta") or {}).items() if n in new}
+        now = time.monotonic()
+        with self._cond:
+            self._reserved -= len(idx) * e.copies
+            e.granting -= len(idx)
+            e.started += counts["scene_started"]; e.failed += counts["scene_failed"]
+            for n in new: self._live[n] = now
+            e.ops.update(new)
+            finished = not e.pending and not e.granting
+            self._cond.notify_all()
+        if new:
+            wid = get_poller().watch(e.client, new, self._on_results, meta)
+            with self._cond:
+                open_ops = set(new) & set(self._live)
+                if open_ops: self._watches[wid] = open_ops
+            if not open_ops:
+                get_poller().unwatch(wid)
+        e.emit({"kind": "grant_done", "scenes": len(idx), "ops": len(new)})
+        if finished:
+            e.emit({"kind": "project_submitted", "started": e.started, "failed": e.failed})
+
+    def _on_results(self, rs: Dict[str, dict]):
+        done = [n for n, info in (rs or {}).items() if is_terminal(info)]
+        if not done:
+            return
+        drop = []
+        with self._cond:
+            for n in done:
+                self._live.pop(n, None)
+                for e in self._entries.values(): e.ops.discard(n)
+            for wid, names in self._watches.items():
+                names.difference_update(done)
+                if not names: drop.append(wid)
+            for wid in drop: del self._watches[wid]
+            self._cond.notify_all()
+        for wid in drop:
+            get_poller().unwatch(wid)
+
+
+_SCHEDULER: Optional[ProjectScheduler] = None
+_SCHEDULER_LOCK = threading.Lock()
+
+
+def get_scheduler() -> ProjectScheduler:
+    """The process-wide scheduler shared by every project panel"""
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = ProjectScheduler()
+        return _SCHEDULER
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Per-key token-bucket rate limiting
+Each (provider, key) gets buckets for requests/min, requests/day and tokens/min loaded from
+config ``rate_limits``. Callers ask for the soonest-available key instead of sleeping a fixed
+delay, so N Google keys give N x 15 RPM rather than one global pace.
+
+Config example::
+
+    "rate_limits": {"google": {"rpm": 15, "rpd": 1500, "tpm": 1000000}, "openai": {"rpm": 500}}
+"""
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from services.http_retry import retry_hint
+
+# Free-tier Gemini defaults; other providers are unlimited unless configured
+DEFAULT_LIMITS = {
+    'google': {'rpm': 15, 'rpd': 1500},
+}
+DEFAULT_PENALTY_SEC = 60.0  # 429 without a server hint: one rpm window
+
+
+class TokenBucket:
+    """Classic token bucket that allows debt: reserving past empty returns the wait instead of failing"""
+
+    def __init__(self, capacity: float, per_sec: float):
+        self.capacity = float(capacity)
+        self.per_sec = float(per_sec)
+        self.tokens = float(capacity)
+        self.stamp = time.monotonic()
+
+    def _refill(self, now: float):
+        if now > self.stamp:
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.per_sec)
+            self.stamp = now
+
+    def wait_time(self, n: float = 1.0, now: Optional[float] = None) -> float:
+        """Seconds until n tokens are available"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if self.tokens >= n:
+            return 0.0
+        return (n - self.tokens) / self.per_sec if self.per_sec > 0 else float('inf')
+
+    def consume(self, n: float = 1.0, now: Optional[float] = None):
+        self._refill(time.monotonic() if now is None else now)
+        self.tokens -= n
+
+    def drain_for(self, seconds: float, now: Optional[float] = None):
+        """Force the bucket empty for `seconds` (server said 429): the next token arrives then"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        self.tokens = min(self.tokens, 1.0 - seconds * self.per_sec)
+
+
+class KeyLimiter:
+    """All buckets for one API key"""
+
+    def __init__(self, limits: Dict[str, float]):
+        self.requests: List[TokenBucket] = []
+        if limits.get('rpm'):
+            self.requests.append(TokenBucket(limits['rpm'], limits['rpm'] / 60.0))
+        if limits.get('rpd'):
+            self.requests.append(TokenBucket(limits['rpd'], limits['rpd'] / 86400.0))
+        self.tokens = TokenBucket(limits['tpm'], limits['tpm'] / 60.0) if limits.get('tpm') else None
+        self.last_used = 0.0
+
+    def wait_time(self, tokens: int = 0, now: Optional[float] = None) -> float:
+        waits = [b.wait_time(1, now) for b in self.requests]
+        if self.tokens is not None and tokens:
+            waits.append(self.tokens.wait_time(min(tokens, self.tokens.capacity), now))
+        return max(waits) if waits else 0.0
+
+    def consume(self, tokens: int = 0, now: Optional[float] = None):
+        for b in self.requests:
+            b.consume(1, now)
+        if self.tokens is not None and tokens:
+            self.tokens.consume(min(tokens, self.tokens.capacity), now)
+        self.last_used = time.monotonic() if now is None else now
+
+    def penalize(self, seconds: float, now: Optional[float] = None):
+        for b in self.requests[:1] or []:
+            b.drain_for(seconds, now)
+        if not self.requests:
+            # unlimited key: remember the server's window with a 1-request bucket
+            b = TokenBucket(1, 1.0 / max(seconds, 1e-3))
+            b.drain_for(seconds, now)
+            self.requests.append(b)
+
+
+_LIMITERS: Dict[Tuple[str, str], KeyLimiter] = {}
+_LOCK = threading.Lock()
+
+
+def provider_limits(provider: str) -> Dict[str, float]:
+    try:
+        from services.core.config import load as load_config
+        conf = (load_config().get('rate_limits') or {}).get(provider)
+    except Exception:
+        conf = None
+    return dict(conf if isinstance(conf, dict) else DEFAULT_LIMITS.get(provider, {}))
+
+
+def _limiter(provider: str, key: str) -> KeyLimiter:
+    lim = _LIMITERS.get((provider, key))
+    if lim is None:
+        lim = KeyLimiter(provider_limits(provider))
+        _LIMITERS[(provider, key)] = lim
+    return lim
+
+
+def reserve(provider: str, keys: Sequence[str], tokens: int = 0) -> Tuple[str, float]:
+    """
+    Pick the soonest-available key and reserve one request on it
+
+    Args:
+        provider: 'google', 'openai', ...
+        keys: Candidate keys
+        tokens: Estimated tokens for tokens/min buckets (0 = not counted)
+
+    Returns:
+        (key, seconds the caller must wait before sending); ("", 0) when keys is empty
+    """
+    keys = [k for k in keys if k]
+    if not keys:
+        return "", 0.0
+    with _LOCK:
+        now = time.monotonic()
+        best = min(keys, key=lambda k: (_limiter(provider, k).wait_time(tokens, now), _limiter(provider, k).last_used))
+        lim = _limiter(provider, best)
+        wait = lim.wait_time(tokens, now)
+        lim.consume(tokens, now)
+        return best, wait
+
+
+def acquire_key(provider: str, keys: Sequence[str], tokens: int = 0, on_wait=None) -> str:
+    """reserve() then sleep only as long as the chosen key needs (usually 0 with several keys)"""
+    key, wait = reserve(provider, keys, tokens)
+    if wait > 0:
+        if on_wait:
+            try: on_wait(key, wait)
+            except Exception: pass
+        time.sleep(wait)
+    return key
+
+
+def penalize(provider: str, key: str, seconds: float):
+    """Server rejected the key with 429: keep it out of rotation for `seconds`"""
+    if not key or seconds <= 0:
+        return
+    with _LOCK:
+        _limiter(provider, key).penalize(seconds)
+
+
+def retry_window(status: int, headers=None, body=None) -> float:
+    """How long a 429'd key should sit out: server hint, else DEFAULT_PENALTY_SEC"""
+    hint, _ = retry_hint(status, headers, body)
+    return DEFAULT_PENALTY_SEC if hint is None else hint
+
+
+def next_available_in(provider: str, keys: Sequence[str]) -> float:
+    """Seconds until any of the keys can send (without reserving)"""
+    keys = [k for k in keys if k]
+    if not keys:
+        return 0.0
+    with _LOCK:
+        now = time.monotonic()
+        return min(_limiter(provider, k).wait_time(0, now) for k in keys)
+
+
+def reset():
+    """Forget all buckets (limits are re-read from config on next use)"""
+    with _LOCK:
+        _LIMITERS.clear()
+
+
+def _on_config_change(old, new):
+    # limits changed: rebuild buckets with the new values on next use
+    if (old or {}).get('rate_limits') != (new or {}).get('rate_limits'):
+        reset()
+
+
+try:
+    from services.core.config import subscribe as _subscribe
+    _subscribe(_on_config_change)
+except Exception:
+    pass
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Render-time history per (model key, aspect ratio)
+The op poller records how long each operation took from submit to DONE and asks
+next_check_delay() when to look again: sparse before the fastest renders usually
+finish, dense around the expected finish, backed off for stragglers.
+"""
+import atexit
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+STATS_PATH = Path.home() / ".veo_render_stats.json"
+MAX_SAMPLES = 200   # most recent durations kept per key
+MIN_SAMPLES = 5     # below this the poller uses its fixed interval
+_SAVE_INTERVAL = 30.0
+
+_SAMPLES: Dict[str, List[float]] = {}
+_LOCK = threading.Lock()
+_dirty = False
+_last_save = 0.0
+
+
+def _key(model: str, aspect: str) -> str:
+    return f"{model or '?'}|{aspect or '?'}"
+
+
+def _load():
+    try:
+        with open(STATS_PATH, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        for k, v in (raw or {}).items():
+            if isinstance(v, list):
+                _SAMPLES[k] = [float(x) for x in v][-MAX_SAMPLES:]
+    except Exception:
+        pass
+
+
+def save(force: bool = False):
+    """Persist samples (throttled to one write per _SAVE_INTERVAL unless forced)"""
+    global _dirty, _last_save
+    with _LOCK:
+        now = time.monotonic()
+        if not _dirty or (not force and now - _last_save < _SAVE_INTERVAL):
+            return
+        data = {k: list(v) for k, v in _SAMPLES.items()}
+        _dirty = False; _last_save = now
+    try:
+        tmp = STATS_PATH.with_suffix('.tmp')
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        tmp.replace(STATS_PATH)
+    except Exception:
+        pass
+
+
+def record(model: str, aspect: str, seconds: float):
+    """Add one submit-to-done duration"""
+    global _dirty
+    if seconds <= 0:
+        return
+    with _LOCK:
+        xs = _SAMPLES.setdefault(_key(model, aspect), [])
+        xs.append(round(float(seconds), 1))
+        del xs[:-MAX_SAMPLES]
+        _dirty = True
+    save()
+
+
+def quantiles(model: str, aspect: str) -> Optional[Tuple[float, float, float]]:
+    """(p10, p50, p90) render time in seconds, or None with too little history"""
+    with _LOCK:
+        xs = sorted(_SAMPLES.get(_key(model, aspect)) or [])
+    if len(xs) < MIN_SAMPLES:
+        return None
+    pick = lambda q: xs[min(len(xs) - 1, int(q * (len(xs) - 1) + 0.5))]
+    return pick(0.1), pick(0.5), pick(0.9)
+
+
+def next_check_delay(model: str, aspect: str, age: float, base: float = 5.0, max_delay: float = 60.0) -> float:
+    """
+    Seconds until an operation should be checked again
+
+    Args:
+        model: Video model key the operation was submitted with
+        aspect: Aspect ratio
+        age: Seconds since submit
+        base: Dense polling interval (also used without history)
+        max_delay: Upper bound for any single wait
+
+    Returns:
+        Delay in seconds
+    """
+    q = quantiles(model, aspect)
+    if q is None:
+        return base
+    p10, p50, p90 = q
+    if age < p10:
+        # sparse early, but land on p10 so the fastest renders are not detected late
+        return min(max_delay, max(base, p10 - age))
+    if age <= p90:
+        return base
+    # straggler: back off linearly with how far past p90 it is
+    return min(max_delay, base + (age - p90) * 0.25)
+
+
+def snapshot() -> Dict[str, dict]:
+    """{model|aspect: {n, p10, p50, p90}} for diagnostics"""
+    out = {}
+    for k in list(_SAMPLES):
+        model, _, aspect = k.partition('|')
+        q = quantiles(model, aspect)
+        out[k] = {'n': len(_SAMPLES.get(k, [])), **(dict(zip(('p10', 'p50', 'p90'), q)) if q else {})}
+    return out
+
+
+_load()
+atexit.register(save, True)
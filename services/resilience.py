@@ -1,8 +1,18 @@
 # -*- coding: utf-8 -*-
+"""
+Adaptive (AIMD) concurrency limits per provider
+The in-flight limit grows by ~1 per limit's worth of healthy responses and is cut
+multiplicatively on 429/503 or when latency spikes above the running baseline, so
+Labs throughput follows the backend's real capacity instead of a fixed 3.
+"""
 import threading
+import time
+from collections import deque
 from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
 
 def _cfg():
+    # utils.config.load() is an mtime-cached snapshot, cheap enough to call per request
     try:
         from utils import config as cfg
         return cfg.load() if hasattr(cfg,'load') else {}
@@ -13,21 +23,220 @@ def _limit(name:str, default:int):
     c=_cfg()
     return int(c.get('resilience', {}).get('concurrency', {}).get(name, default))
 
-_SEMAPHORES = {
-    'labs': threading.Semaphore(_limit('labs', 3)),
-    'google': threading.Semaphore(_limit('google', 5)),
-    'openai': threading.Semaphore(_limit('openai', 5)),
-    'elevenlabs': threading.Semaphore(_limit('elevenlabs', 3)),
+_DEFAULT_LIMITS = {'labs': 3, 'google': 5, 'openai': 5, 'elevenlabs': 3}
+
+_ADAPTIVE_DEFAULTS = {
+    'enabled': True,
+    'min': 1,               # never go below this many in flight
+    'max_factor': 4,        # ceiling = initial limit x this (unless adaptive.max.<provider> is set)
+    'backoff': 0.5,         # multiplicative cut on 429/503/latency spike
+    'latency_ratio': 2.5,   # spike = latency above baseline x this
+    'min_samples': 10,      # healthy responses before the latency baseline is trusted
+    'cut_interval_sec': 2.0,  # one cut per burst of failures
 }
+_OVERLOAD_STATUS = (429, 503)
+
+def _adaptive_cfg(provider:str)->dict:
+    a = dict(_ADAPTIVE_DEFAULTS)
+    a.update({k: v for k, v in (_cfg().get('resilience', {}).get('adaptive') or {}).items() if k != 'max'})
+    a['max'] = (_cfg().get('resilience', {}).get('adaptive') or {}).get('max', {}).get(provider)
+    return a
+
+
+class AdaptiveLimiter:
+    """Blocking concurrency limiter whose limit moves by AIMD on reported outcomes"""
+
+    def __init__(self, name:str, initial:int, min_limit:int=1, max_limit:Optional[int]=None,
+                 backoff:float=0.5, latency_ratio:float=2.5, min_samples:int=10,
+                 cut_interval_sec:float=2.0, enabled:bool=True):
+        self.name = name
+        self.initial = int(initial)
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit or initial))
+        self.backoff = float(backoff)
+        self.latency_ratio = float(latency_ratio)
+        self.min_samples = int(min_samples)
+        self.cut_interval = float(cut_interval_sec)
+        self.enabled = bool(enabled)
+        self._limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self._inflight = 0
+        self._cond = threading.Condition()
+        self._baseline = None   # EWMA of healthy latencies (seconds)
+        self._samples = 0
+        self._last_cut = 0.0
+        self._history = deque(maxlen=500)  # (wall time, limit, reason)
+        self._history.append((time.time(), int(self._limit), 'init'))
+        self._watchers: List[Callable[[], None]] = []
+
+    @property
+    def limit(self)->int:
+        return int(self._limit)
+
+    def acquire(self, timeout:Optional[float]=None)->bool:
+        """Block until a slot is free (False on timeout)"""
+        with self._cond:
+            ok = self._cond.wait_for(lambda: self._inflight < int(self._limit), timeout)
+            if ok: self._inflight += 1
+            return ok
+
+    def try_acquire(self)->bool:
+        with self._cond:
+            if self._inflight < int(self._limit):
+                self._inflight += 1
+                return True
+            return False
+
+    def add_watcher(self, fn:Callable[[], None]):
+        """Call fn (from the releasing thread; it must not block) whenever a slot may have freed up"""
+        with self._cond:
+            self._watchers.append(fn)
+
+    def remove_watcher(self, fn:Callable[[], None]):
+        with self._cond:
+            if fn in self._watchers: self._watchers.remove(fn)
+
+    def _notify(self):
+        self._cond.notify_all()
+        for fn in list(self._watchers):
+            try: fn()
+            except Exception: pass
+
+    def release(self, status:Optional[int]=None, latency:Optional[float]=None):
+        """
+        Free a slot and feed the outcome into the AIMD controller
+
+        Args:
+            status: HTTP status of the request (None = unknown/not judged, e.g. network error)
+            latency: Seconds the request was on the wire
+        """
+        with self._cond:
+            self._inflight = max(0, self._inflight - 1)
+            if self.enabled and status is not None:
+                self._update(status, latency)
+            self._notify()
+
+    def _update(self, status:int, latency:Optional[float]):
+        before = int(self._limit)
+        if status in _OVERLOAD_STATUS:
+            self._cut(str(status))
+        elif 200 <= status < 300:
+            spike = (latency is not None and self._baseline is not None and self._samples >= self.min_samples
+                     and latency > self._baseline * self.latency_ratio)
+            if spike:
+                self._cut('latency')
+            else:
+                if latency is not None:
+                    self._baseline = latency if self._baseline is None else 0.9 * self._baseline + 0.1 * latency
+                    self._samples += 1
+                # additive increase: +1 per `limit` healthy responses
+                self._limit = min(float(self.max_limit), self._limit + 1.0 / max(1.0, self._limit))
+                if int(self._limit) != before:
+                    self._history.append((time.time(), int(self._limit), 'increase'))
+
+    def _cut(self, reason:str):
+        now = time.monotonic()
+        if now - self._last_cut < self.cut_interval:
+            return
+        self._last_cut = now
+        self._limit = max(float(self.min_limit), self._limit * self.backoff)
+        self._history.append((time.time(), int(self._limit), reason))
+
+    def reconfigure(self, initial:int, min_limit:int, max_limit:int, backoff:float, latency_ratio:float,
+                    min_samples:int, cut_interval_sec:float, enabled:bool):
+        """Apply new config in place; the learned limit is kept unless the configured start value changed"""
+        with self._cond:
+            self.min_limit = max(1, int(min_limit))
+            self.max_limit = max(self.min_limit, int(max_limit or initial))
+            self.backoff, self.latency_ratio = float(backoff), float(latency_ratio)
+            self.min_samples, self.cut_interval, self.enabled = int(min_samples), float(cut_interval_sec), bool(enabled)
+            target = float(initial) if int(initial) != self.initial else self._limit
+            self.initial = int(initial)
+            new = min(max(target, float(self.min_limit)), float(self.max_limit))
+            if int(new) != int(self._limit):
+                self._history.append((time.time(), int(new), 'config'))
+            self._limit = new
+            self._notify()
+
+    def stats(self)->dict:
+        with self._cond:
+            return {'provider': self.name, 'limit': int(self._limit), 'inflight': self._inflight,
+                    'min': self.min_limit, 'max': self.max_limit,
+                    'baseline_latency': round(self._baseline, 3) if self._baseline is not None else None}
+
+    def history(self)->List[tuple]:
+        with self._cond:
+            return list(self._history)
+
+
+class Slot:
+    """Handle yielded by acquire(); call done(status) so the limiter learns from the response"""
+    __slots__ = ('status', 't0')
+
+    def __init__(self):
+        self.status = None
+        self.t0 = time.monotonic()
+
+    def done(self, status:int):
+        self.status = status
+
+
+_LIMITERS: Dict[str, AdaptiveLimiter] = {}
+_LOCK = threading.Lock()
+
+def limit(provider:str)->int:
+    """Configured initial concurrent requests for a provider"""
+    return _limit(provider, _DEFAULT_LIMITS.get(provider, 3))
+
+def max_limit(provider:str)->int:
+    """Ceiling the adaptive limit may reach (sizes the provider's connection pool)"""
+    a = _adaptive_cfg(provider)
+    if not a['enabled']: return limit(provider)
+    return int(a['max'] or limit(provider) * a['max_factor'])
+
+def limiter(provider:str)->AdaptiveLimiter:
+    lim = _LIMITERS.get(provider)
+    if lim is None:
+        with _LOCK:
+            lim = _LIMITERS.get(provider)
+            if lim is None:
+                lim = AdaptiveLimiter(provider, **_limiter_args(provider))
+                _LIMITERS[provider] = lim
+    return lim
+
+def _limiter_args(provider:str)->dict:
+    a = _adaptive_cfg(provider)
+    return dict(initial=limit(provider), min_limit=a['min'], max_limit=max_limit(provider),
+                backoff=a['backoff'], latency_ratio=a['latency_ratio'], min_samples=a['min_samples'],
+                cut_interval_sec=a['cut_interval_sec'], enabled=a['enabled'])
+
+def _on_config_change(old, new):
+    for provider, lim in list(_LIMITERS.items()):
+        lim.reconfigure(**_limiter_args(provider))
 
 @contextmanager
 def acquire(provider:str):
-    sem = _SEMAPHORES.get(provider)
-    if sem is None:
-        sem = threading.Semaphore(_limit(provider, 3))
-        _SEMAPHORES[provider] = sem
-    sem.acquire()
+    """Hold one in-flight slot for `provider`; report the response with slot.done(status)"""
+    lim = limiter(provider)
+    lim.acquire()
+    slot = Slot()
     try:
-        yield
+        yield slot
     finally:
-        sem.release()
+        lim.release(slot.status, time.monotonic() - slot.t0)
+
+def current_limit(provider:str)->int:
+    return limiter(provider).limit
+
+def stats()->List[dict]:
+    """Current limit / in-flight / latency baseline for every provider used so far"""
+    return [lim.stats() for lim in list(_LIMITERS.values())]
+
+def history(provider:str)->List[tuple]:
+    """Limit changes for a provider as (unix time, limit, reason)"""
+    return limiter(provider).history()
+
+try:
+    from utils.config import subscribe as _subscribe
+    _subscribe(_on_config_change)
+except Exception:
+    pass
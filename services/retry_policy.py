@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Retry policies - built once per (provider, endpoint) from config, not looked up per attempt
+Layering (later wins): RetryPolicy defaults -> resilience.* globals -> PROVIDER_DEFAULTS /
+resilience.providers.<provider> -> ENDPOINT_DEFAULTS / resilience.endpoints.<endpoint>.
+Policies are rebuilt when the config file changes.
+"""
+import random
+import threading
+from dataclasses import dataclass, fields, replace
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from services.core.config import load as load_config, subscribe
+from services.transport import provider_of
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_attempts: int = 5
+    conn_timeout: float = 15.0
+    read_timeout: float = 60.0
+    base_backoff_sec: float = 1.2      # exponential base, full jitter
+    max_backoff_sec: float = 30.0
+    linear_step_sec: float = 0.0       # >0: fixed step x attempt instead of exponential backoff
+    max_retry_after_sec: float = 120.0  # cap on server Retry-After / RetryInfo hints
+    deadline_sec: Optional[float] = None  # total budget including sleeps
+
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        return (self.conn_timeout, self.read_timeout)
+
+    def backoff(self, attempt: int) -> float:
+        """Delay before retry `attempt` when the server gave no hint"""
+        if self.linear_step_sec > 0:
+            return self.linear_step_sec * attempt
+        return random.random() * min(self.base_backoff_sec ** attempt, self.max_backoff_sec)
+
+    def with_overrides(self, overrides: Optional[dict]) -> 'RetryPolicy':
+        """Copy with known fields from a config dict (unknown keys ignored)"""
+        names = {f.name for f in fields(self)}
+        kw = {k: v for k, v in (overrides or {}).items() if k in names}
+        return replace(self, **kw) if kw else self
+
+
+# Built-in tuning; config can override every field
+PROVIDER_DEFAULTS = {
+    'labs': {'max_attempts': 3, 'conn_timeout': 20, 'read_timeout': 180, 'linear_step_sec': 0.7},
+}
+ENDPOINT_DEFAULTS = {
+    # polled every few seconds anyway: fail fast, the next poll is the retry
+    'batch_check': {'max_attempts': 2, 'read_timeout': 30, 'linear_step_sec': 0.5, 'max_retry_after_sec': 10},
+    # large bodies on slow links: more attempts and a long budget
+    'upload': {'max_attempts': 5, 'read_timeout': 300, 'linear_step_sec': 0, 'base_backoff_sec': 2.0,
+               'max_backoff_sec': 60, 'deadline_sec': 900},
+    'submit': {},
+    # video files: long read timeout, patient retries
+    'download': {'max_attempts': 5, 'conn_timeout': 20, 'read_timeout': 600, 'max_backoff_sec': 60},
+}
+
+# URL path suffix -> endpoint name
+_ENDPOINT_PATHS = {
+    ':batchCheckAsyncVideoGenerationStatus': 'batch_check',
+    ':uploadUserImage': 'upload',
+    ':batchAsyncGenerateVideoText': 'submit',
+    ':batchAsyncGenerateVideoStartImage': 'submit',
+}
+
+_POLICIES: Dict[Tuple[str, str], RetryPolicy] = {}
+_LOCK = threading.Lock()
+
+
+def endpoint_of(url: str) -> str:
+    """Endpoint name for a URL ('' when it has no dedicated policy)"""
+    path = urlsplit(url).path or ''
+    for suffix, name in _ENDPOINT_PATHS.items():
+        if path.endswith(suffix):
+            return name
+    return ''
+
+
+def _build(provider: str, endpoint: str) -> RetryPolicy:
+    res = load_config().get('resilience') or {}
+    p = RetryPolicy().with_overrides(res)
+    p = p.with_overrides(PROVIDER_DEFAULTS.get(provider))
+    p = p.with_overrides((res.get('providers') or {}).get(provider))
+    p = p.with_overrides(ENDPOINT_DEFAULTS.get(endpoint))
+    return p.with_overrides((res.get('endpoints') or {}).get(endpoint))
+
+
+def policy_for(url: Optional[str] = None, *, provider: Optional[str] = None,
+               endpoint: Optional[str] = None) -> RetryPolicy:
+    """
+    Retry policy for a call
+
+    Args:
+        url: Request URL (provider and endpoint are derived from it when not given)
+        provider: 'labs', 'google', ... ('' = generic)
+        endpoint: 'batch_check', 'upload', 'submit', 'download' ('' = provider default)
+
+    Returns:
+        Cached RetryPolicy
+    """
+    if provider is None:
+        provider = provider_of(url) if url else ''
+    if endpoint is None:
+        endpoint = endpoint_of(url) if url else ''
+    key = (provider, endpoint)
+    pol = _POLICIES.get(key)
+    if pol is None:
+        with _LOCK:
+            pol = _POLICIES.get(key)
+            if pol is None:
+                pol = _build(provider, endpoint)
+                _POLICIES[key] = pol
+    return pol
+
+
+def _on_config_change(old, new):
+    with _LOCK:
+        _POLICIES.clear()
+
+
+subscribe(_on_config_change)
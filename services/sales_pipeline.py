@@ -3,6 +3,10 @@ import os, time
 from typing import List, Dict, Any
 from utils import config as cfg
 from services.labs_flow_service import LabsClient, DEFAULT_PROJECT_ID
+from concurrent.futures import wait as wait_futures
+from services.artifact_store import op_key
+from services.downloader import submit as submit_download
+from services.op_poller import TERMINAL, wait_for
 
 _RATIO_MAP = {
     '16:9': 'VIDEO_ASPECT_RATIO_LANDSCAPE',
@@ -24,52 +28,55 @@ def start_pipeline(project_name:str, ratio_str:str, scenes:List[Dict[str,Any]],
     aspect = _aspect(ratio_str)
 
     media_id = None
+    # the shared image is uploaded with one account; every scene starts on it (media ids are per account)
+    pin = {}
     try:
-        if product_imgs: media_id = client.upload_image_file(product_imgs[0])
-        elif model_imgs: media_id = client.upload_image_file(model_imgs[0])
+        ref = (product_imgs or model_imgs or [None])[0]
+        if ref: media_id = client.upload_image_file(ref, token=client.job_token(pin))
     except Exception:
         media_id = None
+    uploaded_at = time.time()
 
-    jobs = []
+    bodies = []
     for sc in scenes:
-        body = {"project": project_name, "scene": sc.get("index"), "media_id": media_id}
         prompt_json = {"objective": sc.get("prompt_video") or sc.get("desc") or "", "language": lang, "image_style": image_style}
-        rc = client.start_one(body, model_key="auto", aspect_ratio=aspect, prompt_text=prompt_json, copies=max(1, int(copies)), project_id=proj_id)
-        op_names = body.get("operation_names") or getattr(client, "last_operation_names", []) or []
-        for nm in op_names:
-            jobs.append({"scene": sc.get("index"), "copy": 1, "op": nm})
+        bodies.append({"project": project_name, "scene": sc.get("index"), "media_id": media_id, "uploaded_at": uploaded_at, "prompt": prompt_json,
+                       **({"token_fp": pin["token_fp"]} if media_id and pin.get("token_fp") else {})})
+    # all scenes share model/aspect: packed into as few start calls as labs.max_start_batch allows
+    client.start_many(bodies, model_key="auto", aspect_ratio=aspect, copies=max(1, int(copies)), project_id=proj_id)
+    jobs = []
+    for body in bodies:
+        for nm in body.get("operation_names") or []:
+            ci = (body.get("op_index_map") or {}).get(nm, 0) + 1
+            jobs.append({"scene": body["scene"], "copy": ci, "op": nm, "meta": (body.get("op_meta") or {}).get(nm)})
     return {"jobs": jobs, "project_id": proj_id}
 
 def poll_and_download(client:LabsClient, jobs:List[Dict[str,Any]], out_dir:str, on_progress=None, sleep_sec:int=5)->List[Dict[str,Any]]:
+    """Follow jobs through the shared operation poller and download finished videos concurrently (sleep_sec: unused, poller interval applies)"""
     os.makedirs(out_dir, exist_ok=True)
     done = []
-    ops = [j["op"] for j in jobs]
-    while ops:
-        rs = client.batch_check_operations(ops) or {}
-        new_ops = []
-        for j in jobs:
-            info = rs.get(j["op"]) or {}
-            st = info.get("status") or "PROCESSING"
-            if st in ("DONE","COMPLETED","DONE_NO_URL","FAILED","ERROR"):
-                url = (info.get("video_urls") or [None])[0]
-                if url and st in ("DONE","COMPLETED"):
-                    import requests
-                    fp = os.path.join(out_dir, f"scene_{j['scene']}_copy_{j['copy']}.mp4")
-                    try:
-                        r = requests.get(url, timeout=600); r.raise_for_status()
-                        with open(fp, "wb") as f: f.write(r.content)
-                        j["path"] = fp
-                    except Exception:
-                        pass
-                j["status"] = st
-                done.append(j)
-            else:
-                new_ops.append(j["op"])
-            if callable(on_progress):
-                try: on_progress(j, info)
-                except Exception: pass
-        ops = new_ops
-        if ops:
-            try: time.sleep(sleep_sec)
-            except Exception: pass
+    fetches = []
+    by_op = {}
+    for j in jobs: by_op.setdefault(j["op"], []).append(j)
+
+    def on_update(rs):
+        for op, info in rs.items():
+            for j in by_op.get(op, []):
+                st = info.get("status") or "PROCESSING"
+                if st in TERMINAL and "status" not in j:
+                    url = (info.get("video_urls") or [None])[0]
+                    if url and st in ("DONE","COMPLETED"):
+                        fp = os.path.join(out_dir, f"scene_{j['scene']}_copy_{j['copy']}.mp4")
+                        def on_done(path, err, j=j):
+                            if err is None: j["path"] = path
+                        fetches.append(submit_download(url, fp, on_done=on_done, keys=[op_key(op)]))
+                    j["status"] = st
+                    done.append(j)
+                if callable(on_progress):
+                    try: on_progress(j, info)
+                    except Exception: pass
+
+    meta = {j["op"]: j["meta"] for j in jobs if j.get("meta")}
+    wait_for(client, list(by_op), on_update=on_update, meta=meta)
+    wait_futures(fetches)
     return done
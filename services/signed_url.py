@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Expiry of signed download URLs
+Finished videos are served from signed URLs that stop working after a while, and downloads
+often run long after the status check that handed the URL out (auto-check cycles, manual
+re-downloads, resumed projects). expires_at() reads the expiry from the signing parameters:
+
+- Expires=<unix time> (GCS V2 and most CDNs)
+- X-Goog-Date=<YYYYMMDDTHHMMSSZ> + X-Goog-Expires=<seconds> (GCS V4)
+- X-Amz-Date + X-Amz-Expires (S3-style V4)
+- exp= / expire= / expires_at= <unix time>
+
+URLs without any of them are treated as not expiring. services.orchestrator keeps the expiry
+per copy (job["url_exp_by_idx"]) and re-checks operations in bulk when their URLs are within
+url_refresh_margin_sec of expiring.
+
+Config (optional)::
+
+    "download": {"url_refresh_margin_sec": 300}
+"""
+import calendar
+import time
+from typing import Optional
+from urllib.parse import parse_qsl, urlsplit
+
+from services.core.config import load as load_config
+
+DEFAULT_MARGIN_SEC = 300
+# statuses a storage server answers for an expired or revoked signature
+EXPIRED_STATUS = (400, 401, 403, 410)
+_EPOCH_PARAMS = ('expires', 'exp', 'expire', 'expires_at')
+
+
+def _stamp(value: str) -> Optional[float]:
+    try:
+        return float(calendar.timegm(time.strptime(value, "%Y%m%dT%H%M%SZ")))
+    except (TypeError, ValueError):
+        return None
+
+
+def expires_at(url: Optional[str]) -> Optional[float]:
+    """Unix time the URL's signature expires (None: no recognizable expiry)"""
+    if not url:
+        return None
+    q = {k.lower(): v for k, v in parse_qsl(urlsplit(url).query, keep_blank_values=True)}
+    for date_key, ttl_key in (('x-goog-date', 'x-goog-expires'), ('x-amz-date', 'x-amz-expires')):
+        if ttl_key in q:
+            start = _stamp(q.get(date_key, ''))
+            try:
+                return start + float(q[ttl_key]) if start is not None else None
+            except ValueError:
+                return None
+    for k in _EPOCH_PARAMS:
+        if k in q:
+            try:
+                t = float(q[k])
+            except ValueError:
+                continue
+            return t / 1000.0 if t > 1e11 else t    # milliseconds
+    return None
+
+
+def refresh_margin() -> float:
+    """Seconds before expiry at which a URL is refreshed"""
+    v = (load_config().get('download') or {}).get('url_refresh_margin_sec')
+    return float(DEFAULT_MARGIN_SEC if v is None else v)
+
+
+def is_stale(expiry: Optional[float], margin_sec: Optional[float] = None, now: Optional[float] = None) -> bool:
+    """True when a known expiry falls within the margin (or has passed)"""
+    if expiry is None:
+        return False
+    margin = refresh_margin() if margin_sec is None else margin_sec
+    return expiry - (time.time() if now is None else now) <= margin
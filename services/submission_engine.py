@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Pipelined scene submission - uploads and starts run in bounded worker pools
+Scene i+1 uploads while scene i is starting; scenes that are ready to start are packed
+into multi-scene LabsClient.start_many calls while start slots are free. The Labs AIMD
+limiter (services.resilience) still caps requests actually in flight, so the pool sizes
+only bound how much work is queued behind it.
+Events are reported in completion order on the thread that calls run().
+
+Config (optional)::
+
+    "submission": {"concurrency": 12, "upload_concurrency": 3}   (batch size: labs.max_start_batch)
+"""
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from services import image_prep
+from services.core.config import load as load_config
+from services.labs_flow_service import _max_start_batch
+from services.resilience import max_limit
+
+
+def _settings() -> dict:
+    s = load_config().get('submission') or {}
+    return {'concurrency': int(s.get('concurrency') or max_limit('labs')),
+            'upload_concurrency': int(s.get('upload_concurrency') or 3)}
+
+
+class SubmissionEngine:
+    """Upload + start a list of scene jobs with bounded parallelism"""
+
+    def __init__(self, client, model: str, aspect: str, copies: int, project_id: Optional[str],
+                 concurrency: Optional[int] = None, upload_concurrency: Optional[int] = None,
+                 max_batch: Optional[int] = None, on_event: Optional[Callable[[dict], None]] = None,
+                 should_stop: Optional[Callable[[], bool]] = None):
+        s = _settings()
+        self.client = client
+        self.model, self.aspect, self.copies, self.project_id = model, aspect, copies, project_id
+        self.concurrency = max(1, int(concurrency or s['concurrency']))
+        self.upload_concurrency = max(1, int(upload_concurrency or s['upload_concurrency']))
+        self.max_batch = max(1, int(max_batch or _max_start_batch()))
+        self.on_event = on_event
+        self.should_stop = should_stop
+        self._stop = threading.Event()
+
+    def stop(self):
+        """Don't start anything not already in flight"""
+        self._stop.set()
+
+    def _stopped(self) -> bool:
+        if not self._stop.is_set() and self.should_stop and self.should_stop():
+            self._stop.set()
+        return self._stop.is_set()
+
+    def _emit(self, kind: str, **kw):
+        if self.on_event:
+            try: self.on_event({"kind": kind, **kw})
+            except Exception: pass
+
+    def run(self, jobs: List[Dict]) -> int:
+        """
+        Submit every job and block until all have started, failed or been cancelled
+
+        Args:
+            jobs: Scene job dicts (prompt, optional image_path/media_id); updated in place
+                  like LabsClient.start_one does
+
+        Returns:
+            Number of scenes that started at least one operation
+
+        Events (on_event, in completion order):
+            {"kind": "scene_uploaded", "index", "media_id"}
+            {"kind": "scene_started", "index", "ops"}
+            {"kind": "scene_failed", "index", "stage": "upload"|"start", "error"}
+            {"kind": "scene_cancelled", "index"}
+        """
+        inbox: "queue.Queue[dict]" = queue.Queue()
+        started = 0
+        per_call = max(1, self.max_batch // max(1, int(self.copies)))
+        ready: List[int] = []
+        inflight = 0
+        uploads = ThreadPoolExecutor(self.upload_concurrency, thread_name_prefix='submit-upload')
+        starts = ThreadPoolExecutor(self.concurrency, thread_name_prefix='submit-start')
+
+        def start(idx: List[int]):
+            batch = [jobs[i] for i in idx]
+            before = [len(j.get("operation_names") or []) for j in batch]
+            err = None
+            try:
+                self.client.start_many(batch, self.model, self.aspect, copies=self.copies,
+                                       project_id=self.project_id, max_batch=self.max_batch)
+            except Exception as e:
+                err = str(e)
+            for i, j, b in zip(idx, batch, before):
+                n = len(j.get("operation_names") or []) - b
+                if n > 0:
+                    inbox.put({"kind": "scene_started", "index": i, "ops": n})
+                else:
+                    inbox.put({"kind": "scene_failed", "index": i, "stage": "start",
+                               "error": err or "không nhận được operation"})
+            inbox.put({"kind": "_batch_done"})
+
+        def upload(i: int, j: Dict):
+            if self._stopped():
+                inbox.put({"kind": "scene_cancelled", "index": i}); return
+            try:
+                # upload and start on the same account (least-loaded token, see services.token_dispatch)
+                mid = self.client.upload_image_file(j["image_path"], token=self.client.job_token(j))
+                if not mid: raise RuntimeError("upload trả về rỗng (không có mediaId)")
+            except Exception as e:
+                j["status"] = "UPLOAD_FAILED"
+                inbox.put({"kind": "scene_failed", "index": i, "stage": "upload", "error": str(e)}); return
+            # start_plan retries a 400 once shortly after this instead of always sleeping first
+            j["media_id"] = mid; j["uploaded_at"] = time.time()
+            inbox.put({"kind": "scene_uploaded", "index": i, "media_id": mid})
+
+        # images are resized/re-encoded ahead on the image_prep pool while earlier ones upload
+        image_prep.prefetch(j["image_path"] for j in jobs if j.get("image_path") and not j.get("media_id"))
+        try:
+            for i, j in enumerate(jobs):
+                if j.get("image_path") and not j.get("media_id"):
+                    uploads.submit(upload, i, j)
+                else:
+                    ready.append(i)
+            remaining = len(jobs)
+            while remaining:
+                # whatever is ready goes out in multi-scene calls while start slots are free
+                while ready and inflight < self.concurrency:
+                    if self._stopped():
+                        for i in ready: self._emit("scene_cancelled", index=i)
+                        remaining -= len(ready); ready.clear(); break
+                    idx, ready[:] = ready[:per_call], ready[per_call:]
+                    starts.submit(start, idx); inflight += 1
+                if not remaining:
+                    break
+                try:
+                    ev = inbox.get(timeout=0.5)
+                except queue.Empty:
+                    self._stopped()
+                    continue
+                kind = ev.pop("kind")
+                if kind == "_batch_done":
+                    inflight -= 1; continue
+                if kind == "scene_uploaded":
+                    ready.append(ev["index"])
+                else:
+                    remaining -= 1
+                if kind == "scene_started":
+                    started += 1
+                self._emit(kind, **ev)
+        finally:
+            uploads.shutdown(wait=True)
+            starts.shutdown(wait=True)
+        return started
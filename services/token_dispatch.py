@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+Outstanding-operation-aware Labs token dispatch
+LabsClient._tok rotates tokens per HTTP request, so one scene's upload, start and status
+checks could land on different accounts and one account could collect most of the renders.
+This module keeps a process-wide count of operations in flight per token (by fingerprint,
+shared by every client with the same tokens):
+
+- a new start goes to the least-loaded token that is out of cooldown and under its cap
+  (reserve/settle; callers wait while every token is full)
+- each operation is pinned to the token that created it, and status checks use that token
+- a scene's upload and start use the same token (job["token_fp"])
+
+Operations leave the count when a status check reports them terminal, or after op_ttl_sec.
+The pin that routes an operation's status checks is kept apart from that count and lasts
+until the operation is reported terminal; operations this process never pinned are looked
+up in the job store (services.job_store) by their token fingerprint.
+
+Config (optional)::
+
+    "labs": {"token_dispatch": {"max_inflight_per_token": 0, "caps": {"<token fingerprint>": 8},
+                                "wait_sec": 600, "op_ttl_sec": 1800}}   (0 = no cap)
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+from services.core import key_manager
+from services.core.config import load as load_config
+from services.core.key_manager import _fingerprint
+
+_DEFAULTS = {'max_inflight_per_token': 0, 'caps': {}, 'wait_sec': 600.0, 'op_ttl_sec': 1800.0}
+
+_OPS: Dict[str, tuple] = {}        # op name -> (token fp, pinned at monotonic); load accounting
+_PINS: "OrderedDict[str, str]" = OrderedDict()  # op name -> token fp that must check it
+_MAX_PINS = 20000                  # oldest pins are dropped past this (ops never reported terminal)
+_RESERVED: Dict[str, int] = {}     # token fp -> ops reserved by starts in progress
+_LAST_PICK: Dict[str, float] = {}  # token fp -> last time it was handed out (tie-break)
+_LOCK = threading.Lock()
+
+
+def _settings() -> dict:
+    return {**_DEFAULTS, **((load_config().get('labs') or {}).get('token_dispatch') or {})}
+
+
+def _cap(fp: str, s: dict) -> int:
+    return int((s.get('caps') or {}).get(fp) or s.get('max_inflight_per_token') or 0)
+
+
+def _expire(s: dict):
+    cutoff = time.monotonic() - float(s['op_ttl_sec'])
+    for n in [n for n, (_, t) in _OPS.items() if t < cutoff]:
+        del _OPS[n]
+
+
+def _pin(op_name: str, fp: str):
+    _PINS[op_name] = fp
+    _PINS.move_to_end(op_name)
+    while len(_PINS) > _MAX_PINS:
+        _PINS.popitem(last=False)
+
+
+def _stored_fps(op_names: List[str]) -> Dict[str, str]:
+    # operations started before a restart (or by another window) that nothing pinned here
+    try:
+        from services import job_store
+        return job_store.get_store().token_fps(op_names)
+    except Exception:
+        return {}
+
+
+def _loads() -> Dict[str, int]:
+    out: Dict[str, int] = dict(_RESERVED)
+    for fp, _ in _OPS.values():
+        out[fp] = out.get(fp, 0) + 1
+    return out
+
+
+def token_of(tokens: Iterable[str], fp: Optional[str]) -> Optional[str]:
+    """The token among `tokens` with fingerprint fp"""
+    if not fp:
+        return None
+    for t in tokens:
+        if t and _fingerprint(t) == fp:
+            return t
+    return None
+
+
+def pick(tokens: Iterable[str], pinned: Optional[str] = None) -> Optional[str]:
+    """Least-loaded token without reserving (the pinned fingerprint wins when it is one of tokens)"""
+    toks = [t for t in tokens if t]
+    if not toks:
+        return None
+    t = token_of(toks, pinned)
+    if t:
+        return t
+    with _LOCK:
+        _expire(_settings())
+        loads = _loads()
+        ready = [t for t in toks if key_manager.is_available('labs', t)] or toks
+        t = min(ready, key=lambda t: (loads.get(_fingerprint(t), 0), _LAST_PICK.get(_fingerprint(t), 0.0)))
+        _LAST_PICK[_fingerprint(t)] = time.monotonic()
+        return t
+
+
+def reserve(tokens: Iterable[str], n: int, pinned: Optional[str] = None) -> Optional[str]:
+    """
+    Reserve room for n new operations on the least-loaded token
+
+    Args:
+        tokens: Candidate tokens
+        n: Operations the start will create
+        pinned: Fingerprint the start must use (the scene's image was uploaded with it);
+                ignored when it isn't one of tokens
+
+    Returns:
+        The token (release with settle()), or None while every candidate is at its cap
+    """
+    toks = [t for t in tokens if t]
+    if not toks:
+        return None
+    s = _settings()
+    t = token_of(toks, pinned)
+    cands = [t] if t else ([t for t in toks if key_manager.is_available('labs', t)] or toks)
+    with _LOCK:
+        _expire(s)
+        loads = _loads()
+        best = None
+        for t in cands:
+            fp = _fingerprint(t); load = loads.get(fp, 0); cap = _cap(fp, s)
+            # a start bigger than the cap still goes through on an idle token
+            if cap and load + n > cap and load:
+                continue
+            k = (load, _LAST_PICK.get(fp, 0.0))
+            if best is None or k < best[0]:
+                best = (k, t)
+        if best is None:
+            return None
+        t = best[1]; fp = _fingerprint(t)
+        _RESERVED[fp] = _RESERVED.get(fp, 0) + n
+        _LAST_PICK[fp] = time.monotonic()
+        return t
+
+
+def wait_sec() -> float:
+    return float(_settings()['wait_sec'])
+
+
+def settle(token: Optional[str], reserved: int, op_names: Iterable[str] = ()):
+    """Turn a reservation into the operations actually started (possibly none)"""
+    if not token:
+        return
+    fp = _fingerprint(token); now = time.monotonic()
+    with _LOCK:
+        left = _RESERVED.get(fp, 0) - reserved
+        if left > 0: _RESERVED[fp] = left
+        else: _RESERVED.pop(fp, None)
+        for n in op_names:
+            if n: _OPS[n] = (fp, now); _pin(n, fp)
+
+
+def pin(op_name: str, fp: Optional[str]):
+    """Adopt an operation created earlier (e.g. restored after a restart) for its token"""
+    if not op_name or not fp:
+        return
+    with _LOCK:
+        _OPS.setdefault(op_name, (fp, time.monotonic()))
+        _pin(op_name, fp)
+
+
+def token_for(op_name: str, tokens: Iterable[str]) -> Optional[str]:
+    """Token that created the operation, if it is one of tokens"""
+    with _LOCK:
+        fp = _PINS.get(op_name)
+    return token_of(tokens, fp)
+
+
+def group(op_names: Iterable[str], tokens: Iterable[str]) -> Dict[Optional[str], List[str]]:
+    """Operation names by pinned token (None: unknown, any token may check them)"""
+    toks = [t for t in tokens if t]
+    names = [n for n in op_names if n]
+    with _LOCK:
+        fps = {n: _PINS.get(n) for n in names}
+    unknown = [n for n, fp in fps.items() if not fp]
+    if unknown:
+        stored = _stored_fps(unknown)
+        with _LOCK:
+            for n, fp in stored.items():
+                _pin(n, fp)
+        fps.update(stored)
+    out: Dict[Optional[str], List[str]] = {}
+    for n in names:
+        out.setdefault(token_of(toks, fps.get(n)), []).append(n)
+    return out
+
+
+def release(op_names: Iterable[str]):
+    """Operations that finished no longer count against their token (nor need their pin)"""
+    with _LOCK:
+        for n in op_names:
+            _OPS.pop(n, None); _PINS.pop(n, None)
+
+
+def snapshot() -> Dict[str, dict]:
+    """{token fingerprint: {"inflight", "reserved", "cap"}} for diagnostics"""
+    s = _settings()
+    with _LOCK:
+        _expire(s)
+        fps = {fp for fp, _ in _OPS.values()} | set(_RESERVED)
+        return {fp: {'inflight': sum(1 for f, _ in _OPS.values() if f == fp),
+                     'reserved': _RESERVED.get(fp, 0), 'cap': _cap(fp, s)} for fp in fps}
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Shared HTTP transport - one keep-alive connection pool per provider host
+Every service module goes through here instead of calling requests.post/get directly,
+so repeated Labs/Gemini calls reuse TCP+TLS connections.
+"""
+import threading
+from typing import Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from services.endpoints import LABS_HOSTS
+from services.resilience import max_limit
+
+# Host -> provider name (matches services.resilience concurrency keys)
+PROVIDER_HOSTS = {
+    'aisandbox-pa.googleapis.com': 'labs',
+    'labs.google': 'labs',
+    'generativelanguage.googleapis.com': 'google',
+    'api.openai.com': 'openai',
+    'api.elevenlabs.io': 'elevenlabs',
+}
+
+# Hosts pre-connected by warm_up() when no explicit list is given
+WARM_UP_URLS = [
+    'https://aisandbox-pa.googleapis.com/',
+    'https://generativelanguage.googleapis.com/',
+    'https://labs.google/',
+]
+
+DEFAULT_POOL_SIZE = 16   # unknown hosts (signed download URLs: 4 files x 4 ranges by default, Drive, Sheets)
+POLL_HEADROOM = 4        # extra connections for status checks/downloads beside the limit ceiling
+
+_SESSIONS: Dict[str, requests.Session] = {}
+_LOCK = threading.Lock()
+
+
+def provider_of(url: str) -> str:
+    """Provider name for a URL ('' if the host is not a known API provider)"""
+    host = (urlsplit(url).hostname or '').lower()
+    return PROVIDER_HOSTS.get(host) or ('labs' if host in LABS_HOSTS else '')
+
+
+def origin(url: str) -> str:
+    """scheme://host[:port] key used for per-host pools"""
+    parts = urlsplit(url)
+    return f"{parts.scheme.lower()}://{(parts.netloc or '').lower()}"
+
+
+def pool_size(url: str) -> int:
+    """Connection pool size for a URL's host: adaptive concurrency ceiling + polling headroom"""
+    provider = provider_of(url)
+    if not provider:
+        return DEFAULT_POOL_SIZE
+    return max(1, max_limit(provider)) + POLL_HEADROOM
+
+
+def session_for(url: str) -> requests.Session:
+    """
+    Get the shared keep-alive session for the URL's host (created on first use)
+
+    Args:
+        url: Any URL on the target host
+
+    Returns:
+        requests.Session whose pool is sized from the provider concurrency ceiling
+    """
+    key = origin(url)
+    sess = _SESSIONS.get(key)
+    if sess is not None:
+        return sess
+    with _LOCK:
+        sess = _SESSIONS.get(key)
+        if sess is None:
+            size = pool_size(url)
+            sess = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size, max_retries=0)
+            sess.mount(key + '/', adapter)
+            _SESSIONS[key] = sess
+        return sess
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """requests.request() through the shared per-host session"""
+    return session_for(url).request(method=method, url=url, **kwargs)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request('GET', url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request('POST', url, **kwargs)
+
+
+def warm_up(urls: Optional[Iterable[str]] = None, timeout: float = 5.0) -> Dict[str, bool]:
+    """
+    Pre-open one connection per host so the first real call skips the TCP/TLS handshake
+
+    Args:
+        urls: URLs whose hosts should be pre-connected (default WARM_UP_URLS)
+        timeout: Per-host connect/read timeout in seconds
+
+    Returns:
+        Mapping origin -> True if a connection was established
+    """
+    out = {}
+    for url in (urls or WARM_UP_URLS):
+        try:
+            session_for(url).head(url, timeout=timeout, allow_redirects=False)
+            out[origin(url)] = True
+        except requests.RequestException:
+            out[origin(url)] = False
+    return out
+
+
+def warm_up_async(urls: Optional[Iterable[str]] = None, timeout: float = 5.0) -> threading.Thread:
+    """Run warm_up() on a daemon thread (safe to call from the UI thread at app start)"""
+    th = threading.Thread(target=warm_up, args=(list(urls or WARM_UP_URLS), timeout),
+                          name='transport-warm-up', daemon=True)
+    th.start()
+    return th
+
+
+def close_all():
+    """Close every pooled connection (app shutdown)"""
+    with _LOCK:
+        for sess in _SESSIONS.values():
+            try:
+                sess.close()
+            except Exception:
+                pass
+        _SESSIONS.clear()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Streamed JSON request bodies with an embedded base64 file
+An image upload used to hold the raw bytes, their base64 string, the payload dict and the
+serialized JSON body in memory at once (about 4x the file), and _post serialized it again
+for every retry. B64JSONBody serializes the JSON around a placeholder once, then streams
+prefix + base64 of the memory-mapped file (encoded in fixed-size chunks) + suffix. Its
+length is known up front, so the request goes out with a Content-Length instead of chunked
+encoding, and the same object can be sent again on a retry. Peak memory per upload is a
+couple of chunks regardless of image size.
+
+requests sends it as ``data=body`` (it iterates the body and takes the length from len());
+aiohttp sends ``data=body.aiter()`` with the Content-Length header.
+"""
+import base64
+import json
+import mmap
+import os
+from typing import Iterator, Optional, Union
+
+CHUNK = 3 * 64 * 1024   # raw bytes per base64 chunk (multiple of 3: no padding mid-stream)
+_PLACEHOLDER = "\u0000b64\u0000"
+
+
+class B64JSONBody:
+    """A JSON document with one string value made of base64 of a file (or bytes), streamed"""
+
+    SLOT = _PLACEHOLDER
+
+    def __init__(self, payload: dict, source: Union[str, bytes], data_url_mime: Optional[str] = None):
+        """
+        Args:
+            payload: JSON payload where exactly one string value is B64JSONBody.SLOT
+            source: File path (memory-mapped while streaming) or bytes
+            data_url_mime: Emit a "data:<mime>;base64," URL instead of bare base64 (Whisk)
+        """
+        text = json.dumps(payload, separators=(',', ':'))
+        slot = json.dumps(_PLACEHOLDER)[1:-1]
+        if text.count(slot) != 1:
+            raise ValueError("payload needs exactly one B64JSONBody.SLOT value")
+        head, tail = text.split(slot)
+        if data_url_mime:
+            head += f"data:{data_url_mime};base64,"
+        self.prefix = head.encode('utf-8')
+        self.suffix = tail.encode('utf-8')
+        self.source = source
+        n = os.path.getsize(source) if isinstance(source, str) else len(source)
+        self._len = len(self.prefix) + 4 * ((n + 2) // 3) + len(self.suffix)
+
+    def __len__(self) -> int:
+        return self._len
+
+    @property
+    def headers(self) -> dict:
+        return {"Content-Type": "application/json", "Content-Length": str(self._len)}
+
+    def _chunks(self, raw) -> Iterator[bytes]:
+        mv = memoryview(raw)
+        for i in range(0, len(mv), CHUNK):
+            yield base64.b64encode(mv[i:i + CHUNK])
+
+    def __iter__(self) -> Iterator[bytes]:
+        # a fresh pass each time: retries resend the same body
+        yield self.prefix
+        if isinstance(self.source, (bytes, bytearray, memoryview)):
+            yield from self._chunks(self.source)
+        elif os.path.getsize(self.source):
+            with open(self.source, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                yield from self._chunks(mm)
+        yield self.suffix
+
+    async def aiter(self):
+        """Async iteration for aiohttp (chunks are read from the page cache, no executor needed)"""
+        for part in self:
+            yield part
+
+    def read_all(self) -> bytes:
+        """Whole body in memory (for transports that can't stream)"""
+        return b"".join(self)
+
+
+def labs_upload(source: Union[str, bytes], mime: str, aspect_hint: str, session_id: str) -> B64JSONBody:
+    """uploadUserImage body for a prepared image"""
+    return B64JSONBody({"imageInput": {"rawImageBytes": B64JSONBody.SLOT, "mimeType": mime, "isUserUploaded": True,
+                                       "aspectRatio": aspect_hint},
+                        "clientContext": {"sessionId": session_id}}, source)
+
+
+def whisk_upload(source: Union[str, bytes], mime: str, workflow_id: str, session_id: str) -> B64JSONBody:
+    """backbone.uploadImage body (rawBytes is a data: URL)"""
+    return B64JSONBody({"json": {"clientContext": {"workflowId": workflow_id, "sessionId": session_id},
+                                 "uploadMediaInput": {"mediaCategory": "MEDIA_CATEGORY_SUBJECT",
+                                                      "rawBytes": B64JSONBody.SLOT}}},
+                       source, data_url_mime=mime)
+
+
+def serialize(payload) -> Union[bytes, B64JSONBody]:
+    """Request body to reuse across retries: a streamed body as is, anything else as JSON bytes once"""
+    if isinstance(payload, B64JSONBody):
+        return payload
+    return json.dumps(payload).encode('utf-8')
@@ -4,12 +4,13 @@ Whisk Service - Google Labs Image Remix API integration
 Correct 3-step workflow from real browser traffic analysis
 """
 import requests
-import base64
 import uuid
 import time
 from pathlib import Path
 from typing import Dict, Any, List, Optional
 
+from services import image_prep, transport, upload_body
+
 
 # Correct Whisk API endpoints from real browser traffic
 WHISK_UPLOAD_ENDPOINT = "https://labs.google/fx/api/trpc/backbone.uploadImage"
@@ -102,54 +103,26 @@ class WhiskClient:
             _log("[ERROR] No session token available for Whisk upload")
             raise WhiskError("No session token available for Whisk upload")
         
-        # Read image file
+        # Prepared image (oriented, downsized, re-encoded; cached per source hash), streamed as a
+        # data: URL inside the JSON body instead of building the base64 string in memory
         try:
-            with open(image_path, 'rb') as f:
-                image_data = f.read()
+            source, mime_type = image_prep.prepared_file(image_path, 'whisk')
+            body = upload_body.whisk_upload(source, mime_type, workflow_id, session_id)
         except Exception as e:
             raise WhiskError(f"Failed to read image file: {e}")
         
-        # Encode to base64
-        image_b64 = base64.b64encode(image_data).decode('utf-8')
-        
-        # Determine mime type
-        ext = Path(image_path).suffix.lower()
-        mime_map = {
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.png': 'image/png',
-            '.webp': 'image/webp'
-        }
-        mime_type = mime_map.get(ext, 'image/jpeg')
-        
-        # Build raw_bytes in correct format
-        raw_bytes = f"data:{mime_type};base64,{image_b64}"
-        
         # Upload request with cookie-based auth (correct format from real traffic)
         headers = {
             'Cookie': f'__Secure-next-auth.session-token={session_token}',
             'Content-Type': 'application/json'
         }
         
-        payload = {
-            "json": {
-                "clientContext": {
-                    "workflowId": workflow_id,
-                    "sessionId": session_id
-                },
-                "uploadMediaInput": {
-                    "mediaCategory": "MEDIA_CATEGORY_SUBJECT",
-                    "rawBytes": raw_bytes
-                }
-            }
-        }
-        
         try:
             _log(f"[INFO] Whisk: Uploading {Path(image_path).name}...")
-            response = requests.post(
+            response = transport.post(
                 WHISK_UPLOAD_ENDPOINT,
                 headers=headers,
-                json=payload,
+                data=body,
                 timeout=60
             )
             
@@ -250,7 +223,7 @@ class WhiskClient:
         # Make request
         try:
             _log(f"[INFO] Whisk: Sending generation request with {len(media_ids)} references...")
-            response = requests.post(
+            response = transport.post(
                 WHISK_RECIPE_ENDPOINT,
                 json=payload,
                 headers=headers,
@@ -405,7 +378,7 @@ def generate_image(
         
         # Step 3: Download image
         if result and result.get("imageUrl"):
-            img_response = requests.get(result["imageUrl"], timeout=IMAGE_DOWNLOAD_TIMEOUT)
+            img_response = transport.get(result["imageUrl"], timeout=IMAGE_DOWNLOAD_TIMEOUT)
             img_response.raise_for_status()
             return img_response.content
         
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+Shared test setup: HOME points at a scratch directory before any service module is imported
+(several of them keep state in ~/.veo_*), and `config` writes the app config for one test.
+"""
+import json
+import os
+import sys
+import tempfile
+
+_HOME = tempfile.mkdtemp(prefix="veo_test_home_")
+os.environ["HOME"] = _HOME
+os.environ["USERPROFILE"] = _HOME
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+from utils import config as cfg_store  # noqa: E402
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    """Write the app config (dict) for this test; returns the writer"""
+    path = tmp_path / "cfg.json"
+    monkeypatch.setattr(cfg_store, "CFG_PATH", str(path))
+    cfg_store.reset()
+
+    def write(data: dict):
+        path.write_text(json.dumps(data), encoding="utf-8")
+        cfg_store.reset()
+        return cfg_store.load()
+
+    write({})
+    yield write
+    cfg_store.reset()
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import threading
+import time
+
+import pytest
+
+from services import async_clients, circuit_breaker
+from services.resilience import AdaptiveLimiter
+
+
+def _later(delay, fn):
+    t = threading.Timer(delay, fn)
+    t.start()
+    return t
+
+
+def test_slot_wakes_on_release_from_another_thread():
+    lim = AdaptiveLimiter("test", 1)
+    assert lim.acquire(0)
+
+    async def main():
+        slot = async_clients._Slot("")
+        slot.lim = lim
+        t0 = time.monotonic()
+        _later(0.2, lambda: lim.release(200, 0.1))
+        async with slot:
+            waited = time.monotonic() - t0
+            assert lim.stats()["inflight"] == 1
+        return waited
+
+    waited = asyncio.run(main())
+    assert 0.15 <= waited < 0.5
+    assert lim.stats()["inflight"] == 0 and lim._watchers == []
+
+
+def test_breaker_wait_wakes_when_probe_reports():
+    settings = dict(circuit_breaker._DEFAULTS, max_wait_sec=5)
+    br = circuit_breaker.CircuitBreaker(("test", "/x"), settings)
+    br._state = circuit_breaker.HALF_OPEN
+    br._probe_out = True                    # another caller holds the probe: retry_in is 1 s
+
+    async def main():
+        t0 = time.monotonic()
+        _later(0.1, lambda: br.record(False))
+        await async_clients._breaker_acquire(br, 5)
+        return time.monotonic() - t0
+
+    assert asyncio.run(main()) < 0.5
+    assert br.state == circuit_breaker.CLOSED and br._watchers == []
+
+
+def test_breaker_wait_gives_up_after_wait():
+    br = circuit_breaker.CircuitBreaker(("test", "/y"), dict(circuit_breaker._DEFAULTS))
+    br._trip(time.monotonic(), escalate=False)
+    with pytest.raises(circuit_breaker.CircuitOpenError):
+        asyncio.run(async_clients._breaker_acquire(br, 0.1))
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+from services import circuit_breaker as cb
+
+
+def _breaker(**kw):
+    s = {**cb._DEFAULTS, 'window_sec': 60, 'min_calls': 4, 'error_rate': 0.5, 'cooldown_sec': 0.2,
+         'max_cooldown_sec': 0.8, **kw}
+    return cb.CircuitBreaker(("test", "/x"), s)
+
+
+def _trip(br):
+    for _ in range(4):
+        assert br.try_acquire()[0]
+        br.record(True)
+    assert br.state == cb.OPEN
+
+
+def test_is_failure():
+    assert cb.is_failure(0) and cb.is_failure(503)
+    assert cb.is_failure(200) is False and cb.is_failure(404) is False
+    assert cb.is_failure(429) is None
+
+
+def test_stays_closed_below_min_calls_and_error_rate():
+    br = _breaker()
+    for failed in (True, True, True):
+        br.record(failed)
+    assert br.state == cb.CLOSED          # 3 calls < min_calls
+    br = _breaker()
+    for failed in (False, False, False, False, False, True, True, True):
+        br.record(failed)
+    assert br.state == cb.CLOSED          # 3/8 < 50 %
+    for _ in range(10):
+        br.record(None)                   # 429s are not judged
+    assert br.stats()["calls"] == 8
+
+
+def test_opens_then_lets_one_probe_through():
+    br = _breaker()
+    _trip(br)
+    ok, retry_in = br.try_acquire()
+    assert not ok and 0 < retry_in <= 0.2
+    time.sleep(0.25)
+    assert br.state == cb.HALF_OPEN
+    assert br.try_acquire() == (True, 0.0)        # the probe
+    assert br.try_acquire() == (False, 1.0)       # everyone else waits for it
+    br.record(False)
+    assert br.state == cb.CLOSED and br.try_acquire()[0]
+
+
+def test_failed_probe_reopens_with_doubled_cooldown():
+    br = _breaker()
+    _trip(br)
+    time.sleep(0.25)
+    assert br.try_acquire()[0]
+    br.record(True)
+    assert br.state == cb.OPEN
+    assert 0.3 < br.stats()["open_for"] <= 0.4
+
+
+def test_unjudged_probe_frees_the_probe_slot():
+    br = _breaker()
+    _trip(br)
+    time.sleep(0.25)
+    assert br.try_acquire()[0]
+    br.record(None)                               # probe got a 429
+    assert br.state == cb.HALF_OPEN and br.try_acquire()[0]
+
+
+def test_acquire_fails_fast_and_raises_with_retry_in():
+    br = _breaker()
+    _trip(br)
+    with pytest.raises(cb.CircuitOpenError) as e:
+        br.acquire(0)
+    assert e.value.key == ("test", "/x") and 0 < e.value.retry_in <= 0.2
+
+
+def test_blocking_acquire_wakes_when_probe_succeeds():
+    br = _breaker(cooldown_sec=0.05)
+    _trip(br)
+    time.sleep(0.1)
+    assert br.try_acquire()[0]                    # this thread holds the probe
+    threading.Timer(0.1, br.record, args=(False,)).start()
+    t0 = time.monotonic()
+    br.acquire(5)
+    assert time.monotonic() - t0 < 0.5
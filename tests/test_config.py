@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+from utils import config as cfg_store
+
+
+def test_snapshot_lists_stay_lists_and_read_only(config):
+    snap = config({"tokens": ["a", "b"], "labs": {"project_pool": ["p1"]}})
+    assert isinstance(snap["tokens"], list) and snap["tokens"] == ["a", "b"]
+    assert isinstance(snap["labs"]["project_pool"], list)
+    with pytest.raises(TypeError):
+        snap["tokens"].append("c")
+    with pytest.raises(TypeError):
+        snap["labs"]["x"] = 1
+    assert json.loads(json.dumps(snap)) == {"tokens": ["a", "b"], "labs": {"project_pool": ["p1"]}}
+    assert snap["tokens"] + ["c"] == ["a", "b", "c"]
+
+
+def test_thaw_gives_mutable_copy(config):
+    snap = config({"tokens": ["a"]})
+    copy = cfg_store.thaw(snap)
+    copy["tokens"].append("b")
+    assert type(copy["tokens"]) is list and snap["tokens"] == ["a"]
+
+
+def test_reload_on_change_notifies_subscribers(config):
+    seen = []
+    fn = cfg_store.subscribe(lambda old, new: seen.append(((old or {}).get("v"), (new or {}).get("v"))))
+    try:
+        config({"v": 1})
+        config({"v": 22})
+        assert cfg_store.load()["v"] == 22
+        assert seen[-1] == (1, 22), seen
+    finally:
+        cfg_store.unsubscribe(fn)
+
+
+def test_whisk_client_reads_tokens_from_config(config):
+    from services.whisk_service import WhiskClient
+    config({"session_tokens": ["sess-1"], "labs_tokens": ["oauth-1"]})
+    client = WhiskClient()
+    assert client._get_session_token() == "sess-1"
+    assert client._get_oauth_token() == "oauth-1"
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+from services import downloader
+from tools import labs_standin
+
+KB = 1024
+
+
+@pytest.fixture(scope="module")
+def server():
+    srv = labs_standin.serve(port=0)
+    yield f"http://127.0.0.1:{srv.server_address[1]}"
+    srv.shutdown()
+
+
+@pytest.fixture
+def video(server, config):
+    """(url, expected bytes) of a fresh stand-in video; every test starts without drops"""
+    config({"artifacts": {"enabled": False},
+            "download": {"parts": 1, "chunk_kb": 16},
+            "resilience": {"endpoints": {"download": {"linear_step_sec": 0.01, "max_attempts": 3}}}})
+    st = labs_standin.STATE
+    st["stats"].clear(); st["drop_bytes"] = 0; st["url_ttl_sec"] = 0; st["video_bytes"] = 256 * KB
+
+    def make(name, size_kb=256):
+        st["video_bytes"] = size_kb * KB
+        st["ops"][name] = {}
+        return f"{server}/video/{name}.mp4", labs_standin._video_bytes(name)
+
+    yield make
+    st["drop_bytes"] = 0
+
+
+def _stats():
+    return dict(labs_standin.STATE["stats"])
+
+
+def test_single_stream(video, tmp_path):
+    url, data = video("plain")
+    dest = str(tmp_path / "v.mp4")
+    assert downloader.download_file(url, dest) == dest
+    assert open(dest, "rb").read() == data
+    assert _stats() == {"video|full": 1}
+
+
+def test_resumes_with_range_after_dropped_connection(video, tmp_path):
+    url, data = video("dropped")
+    labs_standin.STATE["drop_bytes"] = 64 * KB
+    dest = str(tmp_path / "v.mp4")
+    downloader.download_file(url, dest)
+    assert open(dest, "rb").read() == data
+    assert _stats()["video|range"] >= 3
+
+
+def test_resumes_from_existing_part(video, tmp_path):
+    url, data = video("partial")
+    dest = str(tmp_path / "v.mp4")
+    with open(dest + ".part", "wb") as f:
+        f.write(data[:100 * KB])
+    downloader.download_file(url, dest)
+    assert open(dest, "rb").read() == data
+    assert _stats() == {"video|range": 1}
+
+
+def test_split_ranges(video, tmp_path, config):
+    url, data = video("split", 4096)
+    config({"artifacts": {"enabled": False}, "download": {"parts": 4, "split_min_mb": 1, "chunk_kb": 16}})
+    seen = []
+    dest = str(tmp_path / "v.mp4")
+    downloader.download_file(url, dest, on_progress=lambda done, total: seen.append(total))
+    assert open(dest, "rb").read() == data
+    assert _stats() == {"video|range": 5}     # size probe + one range per 1 MB part
+    assert set(seen) == {len(data)}
+
+
+def test_split_ranges_resume_after_drops(video, tmp_path, config):
+    url, data = video("split-drop", 4096)
+    config({"artifacts": {"enabled": False}, "download": {"parts": 4, "split_min_mb": 1, "chunk_kb": 16},
+            "resilience": {"endpoints": {"download": {"linear_step_sec": 0.01, "max_attempts": 3}}}})
+    labs_standin.STATE["drop_bytes"] = 512 * KB
+    dest = str(tmp_path / "v.mp4")
+    downloader.download_file(url, dest)
+    assert open(dest, "rb").read() == data
+
+
+def test_not_found_is_not_retried(video, tmp_path, server):
+    with pytest.raises(downloader.DownloadError) as e:
+        downloader.download_file(f"{server}/video/missing.mp4", str(tmp_path / "v.mp4"))
+    assert e.value.status == 404
+
+
+def test_same_dest_transfers_one_at_a_time(video, tmp_path, monkeypatch):
+    url, data = video("shared")
+    active, peak = [0], [0]
+    real = downloader._download
+
+    def counting(*a, **kw):
+        active[0] += 1; peak[0] = max(peak[0], active[0])
+        try:
+            time.sleep(0.05)
+            return real(*a, **kw)
+        finally:
+            active[0] -= 1
+
+    monkeypatch.setattr(downloader, "_download", counting)
+    dest = str(tmp_path / "v.mp4")
+    threads = [threading.Thread(target=downloader.download_file, args=(url, dest)) for _ in range(3)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert peak[0] == 1
+    assert open(dest, "rb").read() == data
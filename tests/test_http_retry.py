@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import email.utils
+import json
+import time
+
+import pytest
+
+from services.http_retry import _parse_duration, plan_retry, retry_hint
+from services.retry_policy import RetryPolicy
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("1s", 1.0), ("20ms", 0.02), ("6m0s", 360.0), ("1h2m3.5s", 3723.5), ("30.5s", 30.5), ("7", 7.0),
+    ("", None), ("soon", None),
+])
+def test_parse_duration(value, seconds):
+    assert _parse_duration(value) == seconds
+
+
+def test_retry_after_seconds_wins_over_everything():
+    assert retry_hint(503, {"retry-after": "12"}, '{"error": {"message": "retry in 3s"}}') == (12.0, "retry_after")
+
+
+def test_retry_after_http_date():
+    when = email.utils.formatdate(time.time() + 30, usegmt=True)
+    hint, source = retry_hint(429, {"Retry-After": when})
+    assert source == "retry_after" and 28 <= hint <= 31
+
+
+def test_openai_reset_uses_the_exhausted_bucket():
+    headers = {"x-ratelimit-remaining-requests": "5", "x-ratelimit-reset-requests": "1s",
+               "x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "6m0s"}
+    assert retry_hint(429, headers) == (360.0, "ratelimit_reset")
+    # reset headers only count for 429
+    assert retry_hint(503, headers) == (None, "")
+
+
+def test_google_retry_info_and_message():
+    body = {"error": {"code": 429, "details": [
+        {"@type": "type.googleapis.com/google.rpc.QuotaFailure"},
+        {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "17s"}]}}
+    assert retry_hint(429, {}, body) == (17.0, "retry_info")
+    assert retry_hint(429, {}, json.dumps(body).encode()) == (17.0, "retry_info")
+    assert retry_hint(503, {}, {"error": {"message": "Please retry in 2.5s."}}) == (2.5, "retry_info")
+    assert retry_hint(503, {}, "upstream busy, retry in 400ms") == (0.4, "retry_info")
+
+
+def test_no_hint_for_non_retryable_status():
+    body = {"error": {"details": [{"@type": "google.rpc.RetryInfo", "retryDelay": "5s"}]}}
+    assert retry_hint(400, {}, body) == (None, "")
+
+
+def test_plan_retry_backoff_and_exhaustion():
+    pol = RetryPolicy(max_attempts=3, linear_step_sec=0.5)
+    assert plan_retry(1, policy=pol) == (0.5, "backoff")
+    assert plan_retry(2, status=500, policy=pol) == (1.0, "backoff")
+    assert plan_retry(3, policy=pol) == (None, "exhausted")
+    assert plan_retry(3, max_attempts=5, policy=pol) == (1.5, "backoff")
+
+
+def test_plan_retry_caps_server_hint():
+    pol = RetryPolicy(max_retry_after_sec=10)
+    delay, reason = plan_retry(1, status=429, headers={"Retry-After": "4"}, policy=pol)
+    assert reason == "retry_after" and 4.0 <= delay <= 4.4     # up to 10% jitter
+    delay, _ = plan_retry(1, status=429, headers={"Retry-After": "600"}, policy=pol)
+    assert 10.0 <= delay <= 11.0
+
+
+def test_plan_retry_respects_deadline():
+    pol = RetryPolicy(linear_step_sec=5)
+    assert plan_retry(1, policy=pol, deadline_at=time.monotonic() + 2) == (None, "deadline")
+    assert plan_retry(1, policy=pol, deadline_at=time.monotonic() + 60)[1] == "backoff"
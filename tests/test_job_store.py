@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from services import job_store
+
+
+@pytest.fixture
+def store(tmp_path):
+    return job_store.JobStore(str(tmp_path / "jobs.sqlite3"))
+
+
+def _job(scene, urls, downloaded=(), status=None):
+    ops = [f"op-{scene}-{i}" for i in range(len(urls))]
+    j = {"scene_id": scene, "prompt": f"scene {scene}", "operation_names": ops,
+         "op_index_map": {op: i for i, op in enumerate(ops)}, "video_by_idx": list(urls),
+         "downloaded_idx": set(downloaded), "thumb_icons": {"0": object()},
+         "op_meta": {op: {"model": "veo", "aspect": "16:9", "submitted_at": 1.0, "token_fp": "fp-a"} for op in ops}}
+    if status:
+        j["op_status"] = {op: status for op in ops}
+    return j
+
+
+def test_round_trip_keeps_order_and_types(store):
+    store.save_job("p", _job(2, ["http://x/2a", None], downloaded=[1]), seq=1)
+    store.save_job("p", _job(1, [None]), seq=0)
+    store.save_job("other", _job(9, [None]))
+    assert store.flush()
+    jobs = store.load_jobs("p")
+    assert [j["scene_id"] for j in jobs] == [1, 2]
+    assert jobs[1]["downloaded_idx"] == {1}
+    assert jobs[1]["op_index_map"] == {"op-2-0": 0, "op-2-1": 1}
+    assert jobs[1]["thumb_icons"] == {}
+    assert store.projects() == ["p", "other"]
+
+
+def test_outstanding(store):
+    store.save_job("p", _job(1, [None], status="PROCESSING"))                    # rendering
+    store.save_job("p", _job(2, ["http://x/2"], status="COMPLETED"))              # not downloaded
+    store.save_job("p", _job(3, ["http://x/3"], downloaded=[1], status="COMPLETED"))
+    store.save_job("p", _job(4, [None], status="FAILED"))
+    store.save_job("q", _job(5, [None], status="PENDING"))
+    assert store.flush()
+    assert sorted(o["op_name"] for o in store.outstanding("p")) == ["op-1-0", "op-2-0"]
+    assert store.outstanding("q")[0]["token_fp"] == "fp-a"
+    assert store.projects(outstanding_only=True) == ["p", "q"]
+
+
+def test_reads_include_queued_writes_without_waiting(store, monkeypatch):
+    store.save_job("p", _job(1, [None], status="PROCESSING"), seq=0)
+    store.save_job("p", _job(2, [None], status="PROCESSING"), seq=1)
+    assert store.flush()
+    gate = threading.Event()
+    real = job_store.JobStore._apply
+    monkeypatch.setattr(job_store.JobStore, "_apply", staticmethod(lambda con, item: (gate.wait(), real(con, item))))
+    try:
+        store.save_job("p", _job(1, ["http://x/1"], status="COMPLETED"), seq=0)
+        store.delete_job("p", "2")
+        store.save_job("p", _job(3, [None], status="PENDING"))
+        t0 = time.monotonic()
+        jobs = store.load_jobs("p")
+        ops = sorted(o["op_name"] for o in store.outstanding("p"))
+        assert time.monotonic() - t0 < 1.0
+        assert [j["scene_id"] for j in jobs] == [1, 3]
+        assert jobs[0]["video_by_idx"] == ["http://x/1"]
+        assert ops == ["op-1-0", "op-3-0"]
+        store.delete_project("p")
+        assert store.load_jobs("p") == [] and store.outstanding("p") == [] and store.projects() == []
+    finally:
+        gate.set()
+    assert store.flush()
+    assert store.load_jobs("p") == [] and store._unwritten == {} and store._dropped == {}
+
+
+def test_failed_batch_is_retried_one_by_one(store, monkeypatch, caplog):
+    gate = threading.Event()
+    real = job_store.JobStore._apply
+
+    def apply(con, item):
+        gate.wait()                     # holds the writer on the first write while the rest queue up
+        if item[0] == "job" and item[2] == "2":
+            raise sqlite3.IntegrityError("bad row")
+        real(con, item)
+
+    monkeypatch.setattr(job_store.JobStore, "_apply", staticmethod(apply))
+    store.save_job("p", _job(0, [None]), seq=0)
+    time.sleep(0.1)
+    for sid in (1, 2, 3):
+        store.save_job("p", _job(sid, [None]), seq=sid)
+    gate.set()
+    assert store.flush()
+    assert [j["scene_id"] for j in store.load_jobs("p")] == [0, 1, 3]
+    assert store.errors == 1
+    assert "retrying one by one" in caplog.text and "dropped job write for p/2" in caplog.text
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from services import labs_flow_service as lfs
+from services import model_ladder
+
+ASPECT = "VIDEO_ASPECT_RATIO_LANDSCAPE"
+
+
+@pytest.fixture(autouse=True)
+def ladder(monkeypatch, tmp_path):
+    monkeypatch.setattr(model_ladder, "LADDER_PATH", tmp_path / "ladder.json")
+    model_ladder.clear()
+    yield
+    model_ladder.clear()
+
+
+def _client(monkeypatch, accepts):
+    """LabsClient whose start calls succeed only for the models in `accepts`"""
+    client = lfs.LabsClient(["tok-a"])
+    seen = []
+
+    def fake_post(url, payload, circuit_wait=None, token=None):
+        model = payload["requests"][0]["videoModelKey"]
+        seen.append(model)
+        lfs._LAST_TOKEN.set(token)
+        if model not in accepts:
+            raise RuntimeError("400 Client Error: INVALID_ARGUMENT invalid argument")
+        return {"operations": [{"operation": {"name": f"op-{model}-{i}"}} for i in range(len(payload["requests"]))]}
+
+    monkeypatch.setattr(client, "_post", fake_post)
+    return client, seen
+
+
+def _ladder():
+    return lfs._model_ladder("veo_3_1_t2v_fast", ASPECT, False)
+
+
+def test_rejection_counts_when_another_model_accepts(monkeypatch):
+    first, second = _ladder()[:2]
+    client, seen = _client(monkeypatch, {second})
+    assert client.start_one({"scene_id": 1}, first, ASPECT, "a cat", 1) == 1
+    assert seen == [first, second]
+    assert model_ladder.order(_ladder(), ["tok-a"], ASPECT)[0] == second
+
+
+def test_rejection_of_every_model_is_not_learned(monkeypatch):
+    client, seen = _client(monkeypatch, set())
+    client.start_one({"scene_id": 1}, _ladder()[0], ASPECT, "a blocked prompt", 1)
+    assert len(seen) > 1
+    assert model_ladder.order(_ladder(), ["tok-a"], ASPECT) == _ladder()
+    assert all(r["strikes"] == 0 for r in model_ladder.snapshot().values())
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+import requests
+
+from services import op_poller
+from services.circuit_breaker import CircuitOpenError
+
+
+class _Client:
+    tokens = ("tok",)
+
+    def __init__(self, exc=None):
+        self.exc = exc
+        self.calls = 0
+
+    def batch_check_operations(self, names):
+        self.calls += 1
+        if self.exc is not None:
+            raise self.exc
+        return {n: {"status": "PENDING"} for n in names}
+
+
+def _http_error(status, headers=None):
+    r = requests.Response()
+    r.status_code = status
+    r.headers.update(headers or {})
+    r._content = b"{}"
+    return requests.HTTPError(f"{status}", response=r)
+
+
+@pytest.fixture
+def poller(monkeypatch, config):
+    config({"poller": {"interval_sec": 5, "max_backoff_sec": 300}})
+    p = op_poller.OperationPoller()
+    monkeypatch.setattr(p, "_ensure_thread", lambda: None)
+    return p
+
+
+def _due_in(p, name):
+    return p._ops[name].due - time.monotonic()
+
+
+def test_failed_chunk_backs_off_exponentially(poller):
+    client = _Client(RuntimeError("boom"))
+    poller.watch(client, ["op-1"], lambda sub: None)
+    waits = []
+    for _ in range(4):
+        poller._ops["op-1"].due = 0.0
+        poller.poll_once()
+        waits.append(_due_in(poller, "op-1"))
+    assert client.calls == 4 and poller.stats["errors"] == 4
+    for n, w in enumerate(waits):
+        full = 5 * 2 ** n
+        assert full * 0.5 - 0.1 <= w <= full
+    assert poller._next_wake() > 1.0
+
+
+def test_failed_chunk_honors_retry_after(poller):
+    poller.watch(_Client(_http_error(429, {"Retry-After": "90"})), ["op-1"], lambda sub: None)
+    poller.poll_once()
+    assert 89 <= _due_in(poller, "op-1") <= 90
+
+
+def test_failed_chunk_waits_for_open_circuit(poller):
+    poller.watch(_Client(CircuitOpenError(("labs", "batch_check"), 40)), ["op-1"], lambda sub: None)
+    poller.poll_once()
+    assert 39 <= _due_in(poller, "op-1") <= 40
+
+
+def test_success_resets_failures(poller):
+    client = _Client(RuntimeError("boom"))
+    poller.watch(client, ["op-1"], lambda sub: None)
+    poller.poll_once()
+    assert poller._ops["op-1"].failures == 1
+    client.exc = None
+    poller._ops["op-1"].due = 0.0
+    poller.poll_once()
+    assert poller._ops["op-1"].failures == 0
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+from services import orchestrator
+
+
+def _job(scene, ops):
+    return {"scene_id": scene, "operation_names": list(ops), "op_index_map": {op: i for i, op in enumerate(ops)},
+            "video_by_idx": [None] * len(ops), "thumb_by_idx": [None] * len(ops), "downloaded_idx": set(),
+            "status": "PROCESSING"}
+
+
+def test_follow_queues_each_copy_once_across_poll_updates(monkeypatch, tmp_path):
+    jobs = [_job(1, ["op-1a", "op-1b"]), _job(2, ["op-2a"])]
+    done = {n: {"status": "COMPLETED", "video_urls": [f"http://x/{n}.mp4"]} for n in ("op-1a", "op-1b", "op-2a")}
+    calls, active, peak = [], [0], [0]
+    lock = threading.Lock()
+
+    def fake_download(job, copy_no, url, outdir, project_name, expected_copies, lock=None):
+        with lock:
+            calls.append((job["scene_id"], copy_no)); active[0] += 1; peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        job["downloaded_idx"].add(copy_no)
+        with lock: active[0] -= 1
+        return str(tmp_path / f"{job['scene_id']}_{copy_no}.mp4")
+
+    def fake_wait_for(client, names, on_update=None, **kw):
+        for _ in range(5):          # the same finished ops reported on every tick
+            on_update(done)
+            time.sleep(0.01)
+        return done
+
+    monkeypatch.setattr(orchestrator, "download_video", fake_download)
+    monkeypatch.setattr(orchestrator, "wait_for", fake_wait_for)
+    runner = orchestrator.ProjectRunner("p", None, "m", "a", 2, None, str(tmp_path), persist=False,
+                                        download_concurrency=4)
+    runner.jobs = jobs
+    ok, failed = runner.follow()
+    assert (ok, failed) == (3, 0)
+    assert sorted(calls) == [(1, 1), (1, 2), (2, 1)]
+
+
+class _RecordingLock:
+    def __init__(self):
+        self.held = False
+        self.entries = 0
+
+    def __enter__(self):
+        assert not self.held
+        self.held = True; self.entries += 1
+
+    def __exit__(self, *exc):
+        self.held = False
+
+
+def test_download_jobs_changes_jobs_only_under_lock(monkeypatch, tmp_path):
+    from concurrent.futures import Future
+
+    lock = _RecordingLock()
+    jobs = [_job(1, ["op-1a", "op-1b"])]
+    jobs[0]["video_by_idx"] = ["http://x/1.mp4", "http://x/2.mp4"]
+
+    def fake_submit(url, dest, **kw):
+        f = Future(); f.set_result(dest)
+        return f
+
+    class _Job(dict):
+        def __setitem__(self, k, v):
+            assert lock.held, k
+            super().__setitem__(k, v)
+
+    jobs[0] = _Job(jobs[0])
+    seen = []
+    monkeypatch.setattr(orchestrator, "submit_download", fake_submit)
+    ok, attempts, all_success = orchestrator.download_jobs(
+        jobs, str(tmp_path), "p", 2, on_event=lambda ev: seen.append((ev["kind"], lock.held)), lock=lock)
+    assert (ok, attempts, all_success) == (2, 2, True)
+    assert jobs[0]["downloaded_idx"] == {1, 2} and jobs[0]["completed_at"]
+    assert ("job_update", True) in seen
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from services import rate_limiter as rl
+
+
+@pytest.fixture(autouse=True)
+def _fresh_buckets():
+    rl.reset()
+    yield
+    rl.reset()
+
+
+def test_bucket_refills_up_to_capacity():
+    b = rl.TokenBucket(2, 1.0)
+    b.stamp = 100.0
+    b.consume(2, 100.0)
+    assert b.wait_time(1, 100.0) == pytest.approx(1.0)
+    assert b.wait_time(1, 101.0) == 0.0
+    assert b.wait_time(1, 1000.0) == 0.0 and b.tokens == 2.0
+
+
+def test_bucket_goes_into_debt_instead_of_failing():
+    b = rl.TokenBucket(1, 0.5)
+    b.stamp = 0.0
+    b.consume(1, 0.0)
+    b.consume(1, 0.0)
+    assert b.tokens == -1.0
+    assert b.wait_time(1, 0.0) == pytest.approx(4.0)
+
+
+def test_drain_for_keeps_bucket_empty_for_the_window():
+    b = rl.TokenBucket(15, 0.25)
+    b.stamp = 0.0
+    b.drain_for(30, 0.0)
+    assert b.wait_time(1, 0.0) == pytest.approx(30.0)
+    b.drain_for(1, 0.0)             # a shorter window never shortens an existing one
+    assert b.wait_time(1, 20.0) == pytest.approx(10.0)
+    assert b.wait_time(1, 30.0) == 0.0
+
+
+def test_reserve_spreads_requests_over_keys(config):
+    config({"rate_limits": {"google": {"rpm": 2}}})
+    picks = [rl.reserve("google", ["a", "b"]) for _ in range(4)]
+    assert sorted(k for k, _ in picks) == ["a", "a", "b", "b"]
+    assert all(w == 0.0 for _, w in picks)
+    key, wait = rl.reserve("google", ["a", "b"])
+    assert 29 < wait <= 30.0                        # 2 rpm: one request per 30 s
+    assert rl.reserve("google", []) == ("", 0.0)
+
+
+def test_penalize_takes_key_out_of_rotation(config):
+    config({"rate_limits": {"google": {"rpm": 60}}})
+    rl.penalize("google", "a", 20)
+    assert [rl.reserve("google", ["a", "b"])[0] for _ in range(3)] == ["b", "b", "b"]
+    assert 19 < rl.next_available_in("google", ["a"]) <= 20.0
+
+
+def test_penalize_unlimited_provider_remembers_window():
+    assert rl.next_available_in("openai", ["k"]) == 0.0
+    rl.penalize("openai", "k", 10)
+    assert 9 < rl.next_available_in("openai", ["k"]) <= 10.0
+
+
+def test_tokens_per_minute_bucket(config):
+    config({"rate_limits": {"google": {"tpm": 600}}})
+    assert rl.reserve("google", ["a"], tokens=600)[1] == 0.0
+    assert 29 < rl.reserve("google", ["a"], tokens=300)[1] <= 30.0
+
+
+def test_retry_window_prefers_server_hint():
+    assert rl.retry_window(429, {"Retry-After": "7"}) == 7.0
+    assert rl.retry_window(429, {}) == rl.DEFAULT_PENALTY_SEC
+
+
+def test_config_change_rebuilds_buckets(config):
+    config({"rate_limits": {"google": {"rpm": 1}}})
+    rl.reserve("google", ["a"])
+    assert rl.next_available_in("google", ["a"]) > 0
+    config({"rate_limits": {"google": {"rpm": 100}}})
+    assert rl.next_available_in("google", ["a"]) == 0.0
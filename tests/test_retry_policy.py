@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from services.labs_flow_service import BATCH_CHECK_URL, UPLOAD_IMAGE_URL
+from services.retry_policy import RetryPolicy, endpoint_of, policy_for
+
+
+def test_backoff_linear_and_capped_exponential():
+    assert RetryPolicy(linear_step_sec=0.7).backoff(3) == 0.7 * 3
+    pol = RetryPolicy(base_backoff_sec=2.0, max_backoff_sec=5.0)
+    assert all(0.0 <= pol.backoff(10) <= 5.0 for _ in range(50))
+
+
+def test_endpoint_of():
+    assert endpoint_of(BATCH_CHECK_URL) == "batch_check"
+    assert endpoint_of(UPLOAD_IMAGE_URL) == "upload"
+    assert endpoint_of("https://example.com/other") == ""
+
+
+def test_layering_later_wins(config):
+    config({"resilience": {"max_attempts": 9, "read_timeout": 11,
+                           "providers": {"labs": {"conn_timeout": 7}},
+                           "endpoints": {"batch_check": {"max_attempts": 4}}}})
+    pol = policy_for(BATCH_CHECK_URL)
+    # endpoint config > endpoint default (2) > provider default (3) > global (9)
+    assert pol.max_attempts == 4
+    assert pol.conn_timeout == 7            # provider config
+    assert pol.read_timeout == 30           # endpoint default beats the global read_timeout
+    assert pol.linear_step_sec == 0.5
+    assert policy_for(provider="google").max_attempts == 9
+
+
+def test_policies_are_cached_and_rebuilt_on_config_change(config):
+    first = policy_for(provider="labs", endpoint="submit")
+    assert policy_for(provider="labs", endpoint="submit") is first
+    config({"resilience": {"providers": {"labs": {"max_attempts": 6}}}})
+    assert policy_for(provider="labs", endpoint="submit").max_attempts == 6
+
+
+def test_unknown_override_keys_are_ignored():
+    pol = RetryPolicy()
+    assert pol.with_overrides({"nope": 1}) is pol
+    assert pol.with_overrides(None) is pol
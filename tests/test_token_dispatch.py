@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from services import job_store, token_dispatch
+from services.core.key_manager import _fingerprint
+
+A, B = "tok-a", "tok-b"
+
+
+@pytest.fixture(autouse=True)
+def dispatch(monkeypatch, tmp_path, config):
+    config({"labs": {"token_dispatch": {"op_ttl_sec": 1800}}})
+    for d in (token_dispatch._OPS, token_dispatch._PINS, token_dispatch._RESERVED, token_dispatch._LAST_PICK):
+        d.clear()
+    monkeypatch.setattr(job_store, "_STORE", job_store.JobStore(str(tmp_path / "jobs.sqlite3")))
+
+
+def test_pin_outlives_load_accounting(config):
+    tok = token_dispatch.reserve([A, B], 1)
+    token_dispatch.settle(tok, 1, ["op-1"])
+    config({"labs": {"token_dispatch": {"op_ttl_sec": 0}}})
+    assert token_dispatch.snapshot() == {}
+    assert token_dispatch.group(["op-1"], [A, B]) == {tok: ["op-1"]}
+
+
+def test_release_drops_count_and_pin():
+    token_dispatch.settle(A, 1, ["op-1"])
+    token_dispatch.release(["op-1"])
+    assert token_dispatch.snapshot() == {}
+    assert token_dispatch.group(["op-1"], [A, B]) == {None: ["op-1"]}
+
+
+def test_group_falls_back_to_job_store():
+    job = {"scene_id": 1, "operation_names": ["op-9"], "op_index_map": {"op-9": 0},
+           "op_meta": {"op-9": {"token_fp": _fingerprint(B)}}}
+    store = job_store.get_store()
+    store.save_job("p", job)
+    assert store.flush()
+    assert token_dispatch.group(["op-9", "op-x"], [A, B]) == {B: ["op-9"], None: ["op-x"]}
+    assert token_dispatch.token_for("op-9", [A, B]) == B
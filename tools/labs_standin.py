@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the Labs video API and the Flow project endpoints (testing only)
+
+    python tools/labs_standin.py --port 8765 --render-sec 20
+
+then point the app at it:
+
+    "labs": {"base_url": "http://127.0.0.1:8765", "flow_base_url": "http://127.0.0.1:8765"}
+
+Any bearer token is accepted; each token is its own account. Projects created with
+project.createProject belong to the creating token, and starts are rejected (400) when their
+clientContext.projectId is not one of the sender's projects (--any-project turns that off;
+--project ID pre-registers an id for every token). Operations finish after --render-sec, and
+only the token that started an operation can check it. Finished videos are served from
+/video/<operation>.mp4 (--video-kb bytes, with Range support; --drop-kb cuts every response
+after that many bytes to exercise resumed downloads). With --url-ttl-sec the video URLs are
+signed (Expires=...&Signature=...) and refused with 403 once expired; every status check signs
+a fresh one.
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+_LOCK = threading.Lock()
+_IDS = itertools.count(1)
+STATE = {"projects": {}, "ops": {}, "media": {}, "render_sec": 20.0, "any_project": False, "shared": set(),
+         "video_bytes": 256 * 1024, "drop_bytes": 0, "url_ttl_sec": 0, "videos": {},
+         "stats": {}}
+
+
+def _token(handler) -> str:
+    auth = handler.headers.get("authorization") or ""
+    return auth.split(" ", 1)[1].strip() if " " in auth else ""
+
+
+def _count(name: str, token: str):
+    with _LOCK:
+        k = f"{name}|{token[:12]}"
+        STATE["stats"][k] = STATE["stats"].get(k, 0) + 1
+
+
+def _sign(name: str, exp: int) -> str:
+    return hashlib.sha256(f"{name}|{exp}".encode("utf-8")).hexdigest()[:24]
+
+
+def _video_bytes(name: str) -> bytes:
+    """Deterministic, non-repeating content per operation (a misplaced range shows up as a mismatch)"""
+    with _LOCK:
+        data = STATE["videos"].get(name)
+        if data is None or len(data) != STATE["video_bytes"]:
+            data = STATE["videos"][name] = random.Random(name).randbytes(STATE["video_bytes"])
+        return data
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, code: int, obj=None, body: bytes = None, ctype="application/json", headers=None):
+        data = body if body is not None else json.dumps(obj or {}).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        drop = STATE["drop_bytes"]
+        try:
+            if drop and len(data) > drop:
+                self.wfile.write(data[:drop]); self.wfile.flush()
+                self.close_connection = True
+                return
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True   # client went away (a stopped download)
+
+    def _video(self, data: bytes):
+        rng = re.match(r"bytes=(\d*)-(\d*)$", (self.headers.get("Range") or "").strip())
+        if not rng or not (rng.group(1) or rng.group(2)):
+            _count("video", "full")
+            return self._send(200, body=data, ctype="video/mp4", headers={"Accept-Ranges": "bytes"})
+        n = len(data)
+        if rng.group(1):
+            a, b = int(rng.group(1)), int(rng.group(2) or n - 1)
+        else:
+            a, b = max(0, n - int(rng.group(2))), n - 1
+        if a >= n or a > b:
+            return self._send(416, body=b"", ctype="video/mp4", headers={"Content-Range": f"bytes */{n}"})
+        b = min(b, n - 1)
+        _count("video", "range")
+        self._send(206, body=data[a:b + 1], ctype="video/mp4",
+                   headers={"Accept-Ranges": "bytes", "Content-Range": f"bytes {a}-{b}/{n}"})
+
+    def _error(self, code: int, msg: str):
+        self._send(code, {"error": {"code": code, "message": msg}})
+
+    def _body(self):
+        n = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(n) if n else b""
+        try: return json.loads(raw or b"{}")
+        except ValueError: return None
+
+    def _base(self) -> str:
+        return f"http://{self.headers.get('Host') or '127.0.0.1'}"
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        tok = _token(self); body = self._body()
+        if not tok: return self._error(401, "missing bearer token")
+        if body is None: return self._error(400, "invalid JSON")
+        if path.endswith(":uploadUserImage"):
+            _count("upload", tok)
+            mid = f"media-{next(_IDS)}"
+            with _LOCK: STATE["media"][mid] = tok
+            return self._send(200, {"mediaGenerationId": {"mediaGenerationId": mid}})
+        if path.endswith(":batchAsyncGenerateVideoText") or path.endswith(":batchAsyncGenerateVideoStartImage"):
+            _count("start", tok)
+            pid = (body.get("clientContext") or {}).get("projectId")
+            with _LOCK:
+                owned = pid in STATE["shared"] or STATE["projects"].get(pid) == tok
+            if not STATE["any_project"] and not owned:
+                return self._error(400, f"project {pid} not found for this account")
+            ops = []
+            for req in body.get("requests") or []:
+                mid = (req.get("startImage") or {}).get("mediaId")
+                with _LOCK:
+                    if mid and STATE["media"].get(mid) != tok:
+                        return self._error(400, f"media {mid} not found for this account")
+                    name = f"op-{next(_IDS)}"
+                    STATE["ops"][name] = {"token": tok, "project": pid, "t0": time.time()}
+                ops.append({"operation": {"name": name}, "status": "MEDIA_GENERATION_STATUS_PENDING"})
+            return self._send(200, {"operations": ops})
+        if path.endswith(":batchCheckAsyncVideoGenerationStatus"):
+            _count("check", tok)
+            out = []
+            for it in body.get("operations") or []:
+                name = (it.get("operation") or {}).get("name")
+                with _LOCK: op = STATE["ops"].get(name)
+                if not op or op["token"] != tok:
+                    return self._error(404, f"operation {name} not found for this account")
+                if time.time() - op["t0"] < STATE["render_sec"]:
+                    out.append({"operation": {"name": name}, "status": "MEDIA_GENERATION_STATUS_ACTIVE"})
+                else:
+                    url = f"{self._base()}/video/{name}.mp4"
+                    if STATE["url_ttl_sec"]:
+                        exp = int(time.time() + STATE["url_ttl_sec"])
+                        url += f"?Expires={exp}&Signature={_sign(name, exp)}"
+                    out.append({"operation": {"name": name, "metadata": {"video": {"fifeUrl": url}}},
+                                "status": "MEDIA_GENERATION_STATUS_SUCCEEDED"})
+            return self._send(200, {"operations": out})
+        if path.endswith("/api/trpc/project.createProject"):
+            pid = str(uuid.uuid4())
+            with _LOCK: STATE["projects"][pid] = tok
+            return self._send(200, {"result": {"data": {"json": {"result": {"projectId": pid}}}}})
+        self._error(404, "unknown endpoint")
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        if parts.path.endswith("/api/trpc/project.getProject"):
+            tok = _token(self)
+            try: pid = json.loads(unquote((parse_qs(parts.query).get("input") or ["{}"])[0]))["json"]["projectId"]
+            except Exception: return self._error(400, "bad input")
+            with _LOCK: ok = pid in STATE["shared"] or STATE["projects"].get(pid) == tok
+            return self._send(200, {"result": {"data": {"json": {"projectId": pid}}}}) if ok else self._error(404, "not found")
+        if parts.path.startswith("/video/"):
+            name = os.path.basename(parts.path)[:-4]
+            with _LOCK: known = name in STATE["ops"]
+            if not known: return self._error(404, "no such video")
+            if STATE["url_ttl_sec"]:
+                q = parse_qs(parts.query)
+                try: exp = int((q.get("Expires") or ["0"])[0])
+                except ValueError: exp = 0
+                if exp < time.time() or (q.get("Signature") or [""])[0] != _sign(name, exp):
+                    _count("video", "expired")
+                    return self._error(403, "signed URL expired")
+            data = _video_bytes(name)
+            return self._video(data)
+        if parts.path == "/stats":
+            with _LOCK: return self._send(200, dict(STATE["stats"]))
+        self._error(404, "unknown endpoint")
+
+
+def serve(port: int = 8765, render_sec: float = 20.0, any_project: bool = False, projects=(), host="127.0.0.1",
+          video_kb: int = 256, drop_kb: int = 0, url_ttl_sec: float = 0):
+    """Start the stand-in on a daemon thread; returns the server (server.shutdown() to stop)"""
+    STATE["render_sec"] = float(render_sec); STATE["any_project"] = bool(any_project)
+    STATE["video_bytes"] = max(1, int(video_kb)) * 1024; STATE["drop_bytes"] = max(0, int(drop_kb)) * 1024
+    STATE["url_ttl_sec"] = max(0.0, float(url_ttl_sec))
+    STATE["shared"].update(p for p in projects if p)
+    srv = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=srv.serve_forever, name="labs-standin", daemon=True).start()
+    return srv
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Local stand-in for the Labs video API (testing)")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--render-sec", type=float, default=20.0, help="seconds until an operation finishes")
+    ap.add_argument("--any-project", action="store_true", help="accept starts without a known project id")
+    ap.add_argument("--project", action="append", default=[], help="project id valid for every token")
+    ap.add_argument("--video-kb", type=int, default=256, help="size of every served video")
+    ap.add_argument("--drop-kb", type=int, default=0, help="cut each response after this many KB (0 = never)")
+    ap.add_argument("--url-ttl-sec", type=float, default=0, help="sign video URLs valid this long (0 = unsigned)")
+    args = ap.parse_args()
+    serve(args.port, args.render_sec, args.any_project, args.project, args.host, args.video_kb, args.drop_kb,
+          args.url_ttl_sec)
+    print(f"Labs stand-in on http://{args.host}:{args.port} (render {args.render_sec}s)", flush=True)
+    try:
+        while True: time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
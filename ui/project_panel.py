@@ -1,8 +1,8 @@
-import os, json, webbrowser, glob, time, shutil, re, datetime
+import os, json, webbrowser, glob, threading
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QTextEdit, QLineEdit,
     QTableWidget, QTableWidgetItem, QFileDialog, QSpinBox, QComboBox, QProgressBar,
-    QSplitter, QAbstractItemView, QHeaderView, QApplication, QMessageBox, QListWidget, QListWidgetItem
+    QSplitter, QAbstractItemView, QHeaderView, QMessageBox, QListWidget, QListWidgetItem
 )
 from PyQt5.QtCore import Qt, QObject, QThread, pyqtSignal, QByteArray, QTimer
 from PyQt5.QtGui import QPixmap, QIcon, QFont
@@ -17,129 +17,40 @@ except Exception:  # pragma: no cover
 
 try:
     from services.labs_flow_service import LabsClient, DEFAULT_PROJECT_ID
+    from services import transport
+    from services.op_poller import get_poller
+    from services.project_scheduler import get_scheduler
+    from services.job_store import get_store
+    from services.orchestrator import (
+        safe_name, parse_prompt_any, parse_prompt_file, apply_check_results, build_jobs, project_paths, download_jobs,
+    )
 except Exception:  # pragma: no cover
     from labs_flow_service import LabsClient, DEFAULT_PROJECT_ID
-
-def safe_name(s: str)->str:
-    s = s or ""
-    s = s.lower().strip()
-    s = re.sub(r"\s+", "_", s)
-    s = re.sub(r"[^a-z0-9._-]+", "_", s)
-    s = re.sub(r"_+", "_", s).strip("_")
-    return s or "project"
+    import transport
+    from op_poller import get_poller
+    from project_scheduler import get_scheduler
+    from job_store import get_store
+    from orchestrator import (
+        safe_name, parse_prompt_any, parse_prompt_file, apply_check_results, build_jobs, project_paths, download_jobs,
+    )
 
 BASE_COLS = ["Dự án","Cảnh","Image","Prompt","Trạng thái"]
 def _video_labels(n): return [f"Video {i+1}" for i in range(max(0,n))]
 TAIL_COLS = ["Hoàn thành"]
 IMAGE_GLOB = ("*.png","*.jpg","*.jpeg","*.webp","*.bmp")
+DL_RETRY_MS = 30000   # failed downloads of finished ops are retried this often...
+DL_RETRY_MAX = 5      # ...this many times in a row, then again on new poll results or reopen
 
 def short_text(s, n=90):
     s=(s or "").replace("\n"," ").strip()
     return s if len(s)<=n else s[:n-1]+"…"
 
-def parse_prompt_any(obj):
-    scenes=[]
-    def _to_text(p):
-        if isinstance(p, str):
-            return p
-        try:
-            return json.dumps(p, ensure_ascii=False)
-        except Exception:
-            return str(p)
-    if isinstance(obj, list):
-        for it in obj:
-            if isinstance(it, dict) and "prompt" in it:
-                scenes.append(_to_text(it["prompt"]))
-            else:
-                scenes.append(_to_text(it))
-    elif isinstance(obj, dict):
-        if "scenes" in obj and isinstance(obj["scenes"], list):
-            for it in obj["scenes"]:
-                if isinstance(it, dict) and "prompt" in it:
-                    scenes.append(_to_text(it["prompt"]))
-                else:
-                    scenes.append(_to_text(it))
-        elif "prompt" in obj:
-            scenes.append(_to_text(obj["prompt"]))
-        else:
-            scenes.append(_to_text(obj))
-    return scenes
-
-def parse_prompt_file(path):
-    try:
-        with open(path,"r",encoding="utf-8") as f:
-            obj=json.load(f)
-    except Exception:
-        return []
-    return parse_prompt_any(obj)
-
-class SeqWorker(QObject):
-    log = pyqtSignal(str,str)
-    progress = pyqtSignal(int, str)
-    row_update = pyqtSignal(int, dict)
-    started = pyqtSignal()
-    finished = pyqtSignal(int)
-    def __init__(self, client, jobs, model, aspect, copies, project_id):
-        super().__init__(); self.client=client; self.jobs=jobs; self.model=model; self.aspect=aspect; self.copies=copies; self.project_id=project_id
-    def run(self):
-        self.started.emit()
-        total=max(1,len(self.jobs)); done=0
-        for i,j in enumerate(self.jobs):
-            if j.get("image_path"):
-                self.log.emit("INFO", f"[{i+1}/{len(self.jobs)}] Upload ảnh…")
-                self.progress.emit(int(done*100/total), f"Cảnh {i+1}/{len(self.jobs)}: upload…")
-                if not j.get("media_id"):
-                    try:
-                        mid=self.client.upload_image_file(j["image_path"]); j["media_id"]=mid
-                        self.log.emit("HTTP", f"UPLOAD OK mediaId={mid}")
-                    except Exception as e:
-                        self.log.emit("ERR", f"Upload lỗi: {e}")
-                        j["status"]="UPLOAD_FAILED"; self.row_update.emit(i,j); continue
-            self.log.emit("INFO", f"[{i+1}/{len(self.jobs)}] Start generate…")
-            try:
-                self.progress.emit(int(done*100/total), f"Cảnh {i+1}/{len(self.jobs)}: start…")
-                rc=self.client.start_one(j, self.model, self.aspect, j.get("prompt",""), copies=self.copies, project_id=self.project_id)
-                self.log.emit("HTTP", f"START OK -> {rc} ref(s).")
-            except Exception as e:
-                self.log.emit("ERR", f"Start thất bại: {e}")
-            self.row_update.emit(i,j); done+=1; self.progress.emit(int(done*100/total), f"Đã gửi {done}/{len(self.jobs)} cảnh")
-            time.sleep(1.2)
-        self.progress.emit(100, "Hoàn tất gửi tuần tự"); self.finished.emit(1)
-
-class CheckWorker(QObject):
-    log = pyqtSignal(str,str); progress = pyqtSignal(int, str); row_update = pyqtSignal(int, dict); finished = pyqtSignal()
-    def __init__(self, client, jobs): super().__init__(); self.client=client; self.jobs=jobs
-    def run(self):
-        names=[n for j in self.jobs for n in j.get("operation_names",[])]
-        if not names: self.log.emit("INFO","[Check] chưa có operation."); self.finished.emit(); return
-        self.progress.emit(0, "Đang check…")
-        try:
-            rs=self.client.batch_check_operations(names)
-        except Exception as e:
-            self.log.emit("ERR", f"Check lỗi: {e.__class__.__name__}: {e}"); self.finished.emit(); return
-        total=max(1,len(self.jobs)); done=0
-        for idx,j in enumerate(self.jobs):
-            found=False
-            for nm in j.get("operation_names",[]):
-                if nm in rs:
-                    v=rs[nm]; found=True
-                    if v.get("video_urls"):
-                        vids=v["video_urls"]; ci=j.get("op_index_map",{}).get(nm,0)
-                        while len(j["video_by_idx"]) <= ci: j["video_by_idx"].append(None); j["thumb_by_idx"].append(None)
-                        if not j["video_by_idx"][ci]: j["video_by_idx"][ci]=vids[0]
-                        if v.get("image_urls"): j["thumb_by_idx"][ci]=v["image_urls"][0]
-                    j["status"]=v.get("status","PROCESSING")
-            if not found and j.get("status")=="PENDING": j["status"]="PROCESSING"
-            self.row_update.emit(idx,j); done+=1; self.progress.emit(int(done*100/total), f"Đã check {done}/{len(self.jobs)} cảnh")
-        self.log.emit("HTTP","Check xong."); self.finished.emit()
-
 class ThumbWorker(QObject):
     done = pyqtSignal(int, int, object)
     def __init__(self, row, idx, url): super().__init__(); self.row=row; self.idx=idx; self.url=url
     def run(self):
-        import requests
         try:
-            r=requests.get(self.url, timeout=15); r.raise_for_status(); data=r.content
+            r=transport.get(self.url, timeout=15); r.raise_for_status(); data=r.content
         except Exception:
             self.done.emit(self.row,self.idx,None); return
         pix=QPixmap(); pix.loadFromData(QByteArray(data))
@@ -151,49 +62,40 @@ class ThumbWorker(QObject):
 
 class DownloadWorker(QObject):
     log = pyqtSignal(str,str); progress = pyqtSignal(int, str); row_update = pyqtSignal(int, dict); finished = pyqtSignal(int,int, bool)
-    def __init__(self, jobs, outdir, only_missing=True, expected_copies=1, project_name="project"):
-        super().__init__(); self.jobs=jobs; self.outdir=outdir; self.only_missing=only_missing; self.expected_copies=expected_copies; self.project_name=project_name
+    def __init__(self, jobs, outdir, only_missing=True, expected_copies=1, project_name="project", client=None, lock=None):
+        super().__init__(); self.jobs=jobs; self.outdir=outdir; self.only_missing=only_missing; self.expected_copies=expected_copies; self.project_name=project_name; self.client=client; self.lock=lock
     def run(self):
-        os.makedirs(self.outdir, exist_ok=True)
-        total=max(1,len(self.jobs)); done=0; ok=0; attempts=0
-        all_success=True
-        for idx,j in enumerate(self.jobs):
-            vids=j.get("video_by_idx") or []
-            if not vids: done+=1; self.progress.emit(int(done*100/total), f"Đã tải {ok}/{attempts}"); all_success=False; continue
-            j.setdefault("downloaded_idx", set())
-            for i,u in enumerate(vids, start=1):
-                if not u: continue
-                if self.only_missing and (i in j["downloaded_idx"]): continue
-                attempts+=1
-                base = f"{safe_name(self.project_name)}_canh_{j.get('scene_id','')}_video_{i}"
-                dest=os.path.join(self.outdir, f"{base}.mp4")
-                try:
-                    import requests
-                    with requests.get(u, stream=True, timeout=300, allow_redirects=True) as r:
-                        r.raise_for_status(); open(dest,"wb").write(r.content)
-                    j["downloaded_idx"].add(i); j.setdefault("local_paths",[]).append(dest); j["status"]="DOWNLOADED"; ok+=1
-                    # nếu đủ số lượng video mong đợi -> set thời gian hoàn thành
-                    if len(j["downloaded_idx"]) >= min(self.expected_copies, len(vids)):
-                        j["completed_at"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    self.log.emit("HTTP", f"Tải OK -> {dest}")
-                except Exception as e:
-                    self.log.emit("ERR", f"Tải thất bại: {u}")
-                    all_success=False
-            self.row_update.emit(idx,j); done+=1; self.progress.emit(int(done*100/total), f"Đã tải {ok}/{attempts}")
+        def on_event(ev):
+            k=ev.get("kind")
+            if k=="log": self.log.emit(ev["level"], ev["msg"])
+            elif k=="progress": self.progress.emit(ev["percent"], ev["text"])
+            elif k=="job_update": self.row_update.emit(ev["index"], ev["job"])
+        ok, attempts, all_success = download_jobs(self.jobs, self.outdir, self.project_name, self.expected_copies,
+                                                  only_missing=self.only_missing, on_event=on_event, client=self.client, lock=self.lock)
         self.finished.emit(ok, attempts, all_success)
 
 class ProjectPanel(QWidget):
     project_completed = pyqtSignal(str)  # emit project_name when all videos downloaded
     run_all_requested = pyqtSignal()
+    poll_results = pyqtSignal(dict)      # from the shared op poller thread -> UI thread
+    sched_event = pyqtSignal(dict)       # from the global project scheduler -> UI thread
     def __init__(self, project_name:str, base_dir:str, settings_provider=None, parent=None):
         super().__init__(parent)
         self.project_name=project_name; self.base_dir=base_dir; self.project_dir=os.path.join(base_dir, project_name)
         os.makedirs(self.project_dir, exist_ok=True)
         self.settings_provider = settings_provider or (lambda: load_cfg())
         self.tokens=[]; self.client=None; self.jobs=[]; self.max_videos=4
-        self.scenes=[]; self.image_files=[]; self._seq_running=False
+        self.scenes=[]; self.image_files=[]; self._seq_running=False; self._submitted=0
         self._build_ui(); self.console.info(f"Dự án '{project_name}' đã sẵn sàng.")
-        self._timer=None
+        self._watch_id=None; self._dl_running=False; self._dl_again=False
+        # the download worker modifies jobs on its threads; snapshots for the job store take this lock
+        self._jobs_lock=threading.Lock()
+        self._dl_retries=0; self._dl_retry_dir=None
+        self._dl_retry_timer=QTimer(self); self._dl_retry_timer.setSingleShot(True)  # child: dies with the panel
+        self._dl_retry_timer.timeout.connect(lambda: self._download(True, self._dl_retry_dir))
+        self.poll_results.connect(self._on_poll_results)
+        self.sched_event.connect(self._on_sched_event)
+        QTimer.singleShot(0, self._resume)
 
     def _build_ui(self):
         root=QVBoxLayout(self); root.setContentsMargins(8,8,8,8); root.setSpacing(6)
@@ -235,7 +137,7 @@ class ProjectPanel(QWidget):
         # Nút lớn bắt đầu
         self.btn_run=QPushButton("BẮT ĐẦU TẠO VIDEO"); self.btn_run.setMinimumHeight(46)
         self.btn_run.setStyleSheet("QPushButton{background:#1976d2;color:white;font-weight:700;font-size:17px;border-radius:8px;padding:12px;} QPushButton:hover{background:#1e88e5;}")
-        self.btn_run.clicked.connect(self._run_seq)
+        self.btn_run.clicked.connect(lambda: self._run_seq())
         lv.addWidget(self.btn_run)
 
         self.btn_run_all=QPushButton("CHẠY TOÀN BỘ CÁC DỰ ÁN (THEO THỨ TỰ)")
@@ -302,28 +204,17 @@ class ProjectPanel(QWidget):
         k=ev.get("kind")
         if k=="http_ok": self.console.http("HTTP 200")
         elif k=="http_other_err": self.console.err(f"HTTP {ev.get('code')}: {ev.get('detail','')}")
+        elif k=="retry": self.console.warn(f"Thử lại sau {ev.get('delay')}s ({ev.get('reason')}, HTTP {ev.get('code')})")
 
     def _settings(self):
         return (self.settings_provider() if callable(self.settings_provider) else load_cfg())
 
     def _project_paths(self):
-        cfg = self._settings()
-        root = cfg.get("download_root")
-        if not root: root = os.path.join(os.path.expanduser("~"), "Downloads", "VeoProjects")
-        proj_dir = os.path.join(root, self.project_name)
-        dirs = {
-            "root": root,
-            "project": proj_dir,
-            "prompts": os.path.join(proj_dir, "Prompt video"),
-            "images": os.path.join(proj_dir, "Ảnh tham chiếu"),
-            "videos": os.path.join(proj_dir, "Video"),
-        }
-        for d in dirs.values():
-            if isinstance(d, str): os.makedirs(d, exist_ok=True)
-        return dirs
+        return project_paths(self._settings(), self.project_name)
 
     def _prepare_jobs(self):
         self.jobs=[]; self.table.setRowCount(0)
+        get_store().delete_project(self.project_name)
         # lấy scenes từ text box nếu chưa có
         if not self.scenes and self.ed_json.toPlainText().strip():
             try:
@@ -332,60 +223,43 @@ class ProjectPanel(QWidget):
             except Exception:
                 self.scenes=[]
 
-        scenes=self.scenes or []; imgs=self.image_files or []
         model_str = getattr(self.cb_model, "currentText", lambda: "")()
         is_t2v = "_t2v" in (model_str or "")
-
-        if not scenes:
-            self.console.warn("Chưa có kịch bản (JSON)."); return 0
-
-        if not is_t2v and not imgs:
-            self.console.warn("Chưa có ảnh tham chiếu."); return 0
-
-        if is_t2v:
-            n=len(scenes)
-        else:
-            n=min(len(scenes), len(imgs))
-            if len(imgs)<len(scenes): self.console.warn(f"Số ảnh ({len(imgs)}) ít hơn số cảnh ({len(scenes)}); chỉ tạo {n} cảnh đầu.")
-
-        copies=int(self.sp_copies.value())
-
-        paths = self._project_paths()
         # Lưu prompt + copy ảnh vào thư mục dự án, đặt tên chuẩn
-        for i in range(n):
-            scene_id = i+1
-            # prompt file
-            prompt_text = scenes[i]
-            prompt_filename = f"{safe_name(self.project_name)}_canh_{scene_id}_prompt.json"
+        jobs, warnings = build_jobs(self.project_name, self.scenes or [], self.image_files or [],
+                                    int(self.sp_copies.value()), is_t2v, self._project_paths())
+        for w in warnings: self.console.warn(w)
+        for job in jobs:
+            row=self.table.rowCount(); self.table.insertRow(row)
+            self.jobs.append(job); self._refresh_row(row, job); self._persist(row)
+        return len(jobs)
+
+    # Persistence (services.job_store): every job change is queued to SQLite; resume on open
+    def _persist(self, idx, _job=None):
+        # the signal's dict is a converted copy (sets lost): always save the live job
+        if 0 <= idx < len(self.jobs):
             try:
-                # nếu có thể parse -> lưu json đẹp
-                obj=json.loads(prompt_text)
-                open(os.path.join(paths["prompts"], prompt_filename), "w", encoding="utf-8").write(json.dumps(obj, ensure_ascii=False, indent=2))
-            except Exception:
-                open(os.path.join(paths["prompts"], prompt_filename.replace(".json",".txt")), "w", encoding="utf-8").write(prompt_text)
-
-            # image copy
-            if not is_t2v:
-                src = imgs[i]
-                ext = os.path.splitext(src)[1].lower() or ".jpg"
-                img_filename = f"{safe_name(self.project_name)}_canh_{scene_id}_anh{ext}"
-                dst = os.path.join(paths["images"], img_filename)
-                try:
-                    if os.path.abspath(src) != os.path.abspath(dst):
-                        shutil.copy2(src, dst)
-                except Exception as e:
-                    self.console.err(f"Không thể copy ảnh: {e}")
-                    dst = src
-            else:
-                dst = None
+                with self._jobs_lock: get_store().save_job(self.project_name, self.jobs[idx], seq=idx)
+            except Exception as e: self.console.warn(f"Không lưu được trạng thái: {e}")
 
-            row=self.table.rowCount(); self.table.insertRow(row)
-            job={"scene_id":f"{scene_id}","prompt":prompt_text,"image_path":dst,"image_name":os.path.basename(dst) if dst else "",
-                 "media_id":None,"operation_names":[],"status":"NEW","video_by_idx":[None]*copies,"thumb_by_idx":[None]*copies,"op_index_map":{},
-                 "downloaded_idx":set(),"thumb_icons":{},"completed_at":""}
-            self.jobs.append(job); self._refresh_row(row, job)
-        if n==0: self.console.warn("Không có cặp (prompt, ảnh) nào.")
-        return n
+    def _resume(self):
+        """Reload saved jobs; continue polling/downloading operations left open by a crash or close"""
+        try: jobs=get_store().load_jobs(self.project_name)
+        except Exception as e:
+            self.console.warn(f"Không đọc được trạng thái đã lưu: {e}"); return
+        if not jobs or self.jobs: return
+        self.jobs=jobs; self.table.setRowCount(0)
+        self.sp_copies.setValue(max([len(j.get("video_by_idx") or []) for j in jobs] + [1]))
+        for j in jobs:
+            row=self.table.rowCount(); self.table.insertRow(row); self._refresh_row(row, j)
+        pending=[o for o in get_store().outstanding(self.project_name)]
+        self.console.info(f"Khôi phục {len(jobs)} cảnh; {len(pending)} video đang chờ render/tải.")
+        if not pending: return
+        cfg=self._settings(); toks=[t.strip() for t in cfg.get("tokens", []) if t.strip()]
+        if not toks: self.console.warn("Chưa có token: không thể tiếp tục kiểm tra."); return
+        if not self.client: self.client=LabsClient(toks, on_event=self._on_event)
+        self._watch_ops()
+        if any(o.get("video_url") for o in pending): self._download(True, self._project_paths()["videos"])
 
     def _set_cell(self, row, col, text, tooltip=None, icon=None):
         it=self.table.item(row,col)
@@ -432,9 +306,11 @@ class ProjectPanel(QWidget):
             self.client = LabsClient(toks, on_event=self._on_event)
         return True
 
-    def _run_seq(self):
+    def _run_seq(self, priority=0, weight=1.0):
+        """Queue this project's scenes on the global scheduler (returns True if queued)"""
         try:
-            if not self._ensure_client(): return
+            if not self._ensure_client(): return False
+            if self._seq_running: self.console.warn("Đang gửi cảnh, vui lòng chờ…"); return False
             if not self.scenes and self.ed_json.toPlainText().strip():
                 try:
                     obj=json.loads(self.ed_json.toPlainText())
@@ -442,34 +318,49 @@ class ProjectPanel(QWidget):
                 except Exception:
                     pass
             n=self._prepare_jobs()
-            if n<=0: return
+            if n<=0: return False
             cfg = self._settings()
             model=self.cb_model.currentText(); aspect=self.cb_aspect.currentText(); copies=int(self.sp_copies.value()); pid=cfg.get("default_project_id") or DEFAULT_PROJECT_ID
-            if self._seq_running: self.console.warn("Đang chạy tuần tự, vui lòng chờ…"); return
+            self._submitted=0
+            if not get_scheduler().enqueue(self.project_name, self.client, self.jobs, model, aspect, copies, pid,
+                                           priority=priority, weight=weight, on_event=self.sched_event.emit):
+                self.console.warn("Dự án vẫn còn cảnh trong hàng đợi, vui lòng chờ…"); return False
             self._seq_running=True
-            self.btn_run.setEnabled(False); self.btn_run.setText("ĐANG TẠO…"); QApplication.setOverrideCursor(Qt.WaitCursor)
-            self.pb.setValue(0); self.pb_text.setText(f"Bắt đầu: {n} cảnh, {copies} video/cảnh")
-            self.console.info(f"Bắt đầu gửi tuần tự {n} cảnh; copies={copies}.")
-            self._t=QThread(self)
-            self._w=SeqWorker(self.client,self.jobs,model,aspect,copies,pid)
-            self._w.moveToThread(self._t)
-            self._t.started.connect(self._w.run)
-            self._w.progress.connect(self._on_prog); self._w.row_update.connect(self._refresh_row)
-            self._w.log.connect(lambda lv,msg: getattr(self.console, lv.lower())(msg) if hasattr(self.console, lv.lower()) else self.console.info(msg))
-            def on_finish(_):
-                self.console.info("Đã gửi xong theo tuần tự.")
-                self.btn_run.setEnabled(True); self.btn_run.setText("BẮT ĐẦU TẠO VIDEO"); QApplication.restoreOverrideCursor()
-                self.pb_text.setText("Hoàn tất gửi.")
-                self._seq_running=False
-                # start auto-check (hidden) mỗi 10s
-                if not self._timer:
-                    self._timer=QTimer(self); self._timer.setInterval(10000); self._timer.timeout.connect(self._check)
-                self._timer.start()
-            self._w.finished.connect(on_finish); self._w.finished.connect(self._t.quit); self._w.finished.connect(self._w.deleteLater); self._t.finished.connect(self._t.deleteLater); self._t.start()
+            self.btn_run.setEnabled(False); self.btn_run.setText("ĐANG TẠO…")
+            self.pb.setValue(0); self.pb_text.setText(f"Xếp hàng: {n} cảnh, {copies} video/cảnh")
+            self.console.info(f"Đã xếp {n} cảnh vào hàng đợi chung; copies={copies}.")
+            return True
         except Exception as e:
             self.console.err(f"Lỗi khởi chạy: {e}")
-            try: QApplication.restoreOverrideCursor(); self.btn_run.setEnabled(True); self.btn_run.setText("BẮT ĐẦU TẠO VIDEO"); self._seq_running=False
-            except Exception: pass
+            self.btn_run.setEnabled(True); self.btn_run.setText("BẮT ĐẦU TẠO VIDEO"); self._seq_running=False
+            return False
+
+    def _on_sched_event(self, ev):
+        kind=ev.get("kind"); n=len(self.jobs)
+        if kind=="log":
+            lv=ev.get("level","INFO").lower(); getattr(self.console, lv, self.console.info)(ev.get("msg","")); return
+        if kind=="grant_done":
+            # follow the new operations right away (batched with every other project)
+            if ev.get("ops"): self._watch_ops()
+            return
+        if kind=="project_submitted":
+            self.console.info(f"Đã gửi xong: {ev.get('started',0)} cảnh chạy, {ev.get('failed',0)} lỗi.")
+            self.btn_run.setEnabled(True); self.btn_run.setText("BẮT ĐẦU TẠO VIDEO")
+            self.pb_text.setText("Hoàn tất gửi.")
+            self._seq_running=False
+            return
+        i=ev.get("index",0)
+        if not 0 <= i < n: return
+        if kind=="scene_uploaded":
+            self.console.http(f"[{i+1}/{n}] UPLOAD OK mediaId={ev.get('media_id')}"); return
+        if kind=="scene_started":
+            self.console.http(f"[{i+1}/{n}] START OK -> {ev.get('ops')} ref(s).")
+        elif kind=="scene_failed":
+            what="Upload lỗi" if ev.get("stage")=="upload" else "Start thất bại"
+            self.console.err(f"[{i+1}/{n}] {what}: {ev.get('error')}")
+        self._submitted+=1
+        self._refresh_row(i, self.jobs[i]); self._persist(i)
+        self._on_prog(int(self._submitted*100/max(1,n)), f"Đã gửi {self._submitted}/{n} cảnh")
 
     def _on_prog(self, v, t): self.pb.setValue(v); self.pb_text.setText(t)
 
@@ -482,27 +373,52 @@ class ProjectPanel(QWidget):
             if len(j.get("downloaded_idx", set())) < exp: return False
         return True
 
+    def _watch_ops(self):
+        names=[n for j in self.jobs for n in j.get("operation_names",[])]
+        if not names: self.console.info("[Check] chưa có operation."); return
+        meta={n: m for j in self.jobs for n, m in (j.get("op_meta") or {}).items()}
+        poller=get_poller()
+        if self._watch_id is None: self._watch_id=poller.watch(self.client, names, self.poll_results.emit, meta)
+        else: poller.add(self._watch_id, names, meta)
+
+    def _unwatch_ops(self):
+        if self._watch_id is not None: get_poller().unwatch(self._watch_id); self._watch_id=None
+
     def _check(self):
+        """Poll now instead of waiting for the shared poller's next tick"""
         if not getattr(self,"client",None) or not self.jobs: return
-        self._t2=QThread(self); self._w2=CheckWorker(self.client,self.jobs); self._w2.moveToThread(self._t2)
-        self._t2.started.connect(self._w2.run); self._w2.progress.connect(self._on_prog); self._w2.row_update.connect(self._refresh_row)
-        self._w2.log.connect(lambda lv,msg: getattr(self.console, lv.lower())(msg) if hasattr(self.console, lv.lower()) else self.console.info(msg))
-        def on_finished():
+        self._watch_ops(); get_poller().poll_now()
+
+    def _on_poll_results(self, rs):
+        with self._jobs_lock: touched=apply_check_results(self.jobs, rs)
+        for idx in touched: self._refresh_row(idx, self.jobs[idx]); self._persist(idx)
+        if touched:
+            self.console.http(f"Check xong ({len(rs)} operation).")
+            self._dl_retries=0
             # auto-download về thư mục dự án/<Video>
-            out = self._project_paths()["videos"]
-            self._download(True, out)
-        self._w2.finished.connect(on_finished); self._w2.finished.connect(self._t2.quit); self._w2.finished.connect(self._w2.deleteLater); self._t2.finished.connect(self._t2.deleteLater); self._t2.start()
+            self._download(True, self._project_paths()["videos"])
 
     def _download(self, only_missing, outdir):
-        self._t3=QThread(self); self._w3=DownloadWorker(self.jobs,outdir,only_missing=only_missing, expected_copies=int(self.sp_copies.value()), project_name=self.project_name); self._w3.moveToThread(self._t3)
-        self._t3.started.connect(self._w3.run); self._w3.progress.connect(self._on_prog); self._w3.row_update.connect(self._refresh_row)
+        if self._dl_running: self._dl_again=True; return
+        self._dl_running=True; self._dl_again=False
+        self._t3=QThread(self); self._w3=DownloadWorker(self.jobs,outdir,only_missing=only_missing, expected_copies=int(self.sp_copies.value()), project_name=self.project_name, client=self.client, lock=self._jobs_lock); self._w3.moveToThread(self._t3)
+        self._t3.started.connect(self._w3.run); self._w3.progress.connect(self._on_prog); self._w3.row_update.connect(self._refresh_row); self._w3.row_update.connect(self._persist)
         self._w3.log.connect(lambda lv,msg: getattr(self.console, lv.lower())(msg) if hasattr(self.console, lv.lower()) else self.console.info(msg))
         def on_done(ok, attempts, all_success):
+            self._dl_running=False
+            if all_success: self._dl_retries=0
             if all_success and self._all_downloaded():
                 # stop checking + phát tín hiệu hoàn tất dự án
-                if self._timer: self._timer.stop()
+                self._unwatch_ops()
                 self.console.info("Đã tải xong toàn bộ video. Dừng kiểm tra.")
                 self.project_completed.emit(self.project_name)
+            elif self._dl_again:
+                self._download(only_missing, outdir)
+            elif not all_success and self._dl_retries < DL_RETRY_MAX:
+                # failed downloads of finished ops: try again later (their ops no longer poll)
+                self._dl_retries+=1; self._dl_retry_dir=outdir; self._dl_retry_timer.start(DL_RETRY_MS)
+            elif not all_success:
+                self.console.warn(f"Tải thất bại sau {DL_RETRY_MAX} lần thử lại; sẽ thử lại khi có kết quả mới hoặc khi mở lại dự án.")
         self._w3.finished.connect(on_done); self._w3.finished.connect(self._t3.quit); self._w3.finished.connect(self._w3.deleteLater); self._t3.finished.connect(self._t3.deleteLater); self._t3.start()
 
     def _open_cell(self, row, col):
@@ -534,16 +450,18 @@ class ProjectPanel(QWidget):
         for r in rows:
             if 0 <= r < len(self.jobs):
                 self.table.removeRow(r)
-                self.jobs.pop(r, None)
+                get_store().delete_job(self.project_name, self.jobs.pop(r).get("scene_id",""))
         self.console.info(f"Đã xóa {len(rows)} cảnh đã chọn.")
 
     def _delete_all_scenes(self):
-        self.jobs.clear()
+        get_scheduler().cancel(self.project_name)
+        self._unwatch_ops()
+        self.jobs.clear(); get_store().delete_project(self.project_name)
         self.table.setRowCount(0)
         self.console.info("Đã xóa toàn bộ cảnh.")
 
     def closeEvent(self, e):
         try:
-            if self._timer: self._timer.stop()
+            self._dl_retry_timer.stop(); self._unwatch_ops()
         finally:
             e.accept()
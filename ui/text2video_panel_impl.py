@@ -9,6 +9,10 @@ from PyQt5.QtGui import QIcon, QPixmap
 from PyQt5.Qt import QDesktopServices
 from utils import config as cfg
 from services.labs_flow_service import LabsClient, DEFAULT_PROJECT_ID
+from services.artifact_store import op_key
+from services.downloader import submit as submit_download
+from services.op_poller import wait_for
+from concurrent.futures import wait as wait_futures
 
 _ASPECT_MAP = {
     "16:9": "VIDEO_ASPECT_RATIO_LANDSCAPE",
@@ -180,17 +184,17 @@ class _Worker(QObject):
         self.log.emit("[INFO] Hoàn tất sinh kịch bản & lưu file.")
         self.story_done.emit(data, ctx)
 
-    def _download(self, url, dst_path):
-        try:
-            import requests
-            r = requests.get(url, timeout=300)
-            r.raise_for_status()
-            with open(dst_path, "wb") as f:
-                f.write(r.content)
-            return True
-        except Exception as e:
-            self.log.emit(f"[ERR] Download fail: {e}")
-            return False
+    def _download(self, url, dst_path, card, thumbs_dir, op):
+        """Queue the video on the shared downloader; the card is updated when it lands"""
+        def on_done(path, err):
+            if err is not None:
+                self.log.emit(f"[ERR] Download fail: {err}")
+                return
+            card['path']=path; card['status']='DOWNLOADED'
+            th=self._make_thumb(path, thumbs_dir, card['scene'], card['copy'])
+            if th: card['thumb']=th
+            self.job_card.emit(card)
+        return submit_download(url, dst_path, on_done=on_done, keys=[op_key(op)])
 
     def _make_thumb(self, video_path, out_dir, scene, copy):
         try:
@@ -216,28 +220,34 @@ class _Worker(QObject):
         up4k = p.get("upscale_4k", False)
         thumbs_dir = os.path.join(dir_videos, "thumbs")
 
-        jobs = []
+        jobs = []; op_meta = {}
+        model_key = p.get("model_key","")
+        # one multi-scene start call per aspect ratio (chunked by labs.max_start_batch)
+        by_ratio = {}
         for scene_idx, scene in enumerate(p["scenes"], start=1):
-            ratio = scene["aspect"]
-            model_key = p.get("model_key","")
-            for copy_idx in range(1, copies+1):
-                body = {"prompt": scene["prompt"], "copies": 1, "model": model_key, "aspect_ratio": ratio}
-                self.log.emit(f"[INFO] Start scene {scene_idx} copy {copy_idx}…")
-                rc = client.start_one(body, model_key, ratio, scene["prompt"], copies=1, project_id=project_id)
-                card={"scene":scene_idx,"copy":copy_idx,"status":"PROCESSING","json":scene["prompt"],"url":"","path":"","thumb":"","dir":dir_videos}
-                self.job_card.emit(card)
-                if rc>0: jobs.append((card, body))
-                else: card["status"]="FAILED_START"; self.job_card.emit(card)
+            body = {"scene": scene_idx, "prompt": scene["prompt"], "copies": copies, "model": model_key, "aspect_ratio": scene["aspect"]}
+            by_ratio.setdefault(scene["aspect"], []).append(body)
+        for ratio, bodies in by_ratio.items():
+            self.log.emit(f"[INFO] Start {len(bodies)} cảnh × {copies} bản ({ratio})…")
+            client.start_many(bodies, model_key, ratio, copies=copies, project_id=project_id)
+            for body in bodies:
+                by_copy = {ci: nm for nm, ci in (body.get("op_index_map") or {}).items()}
+                for copy_idx in range(1, copies+1):
+                    card={"scene":body["scene"],"copy":copy_idx,"status":"PROCESSING","json":body["prompt"],"url":"","path":"","thumb":"","dir":dir_videos}
+                    op = by_copy.get(copy_idx-1)
+                    if op: jobs.append((card, op))
+                    else: card["status"]="FAILED_START"
+                    self.job_card.emit(card)
+                op_meta.update(body.get("op_meta") or {})
 
-        # polling
-        for _ in range(120):
-            if not jobs:
-                break
-            names=[op for (_,op) in jobs]
-            rs = client.batch_check_operations(names)
-            new_jobs=[]
-            for (card, op) in jobs:
-                v = rs.get(op) or {}
+        # polling: one shared poller batches these ops with every other panel's
+        cards = {op: card for (card, op) in jobs}
+        fetches = {}
+
+        def on_update(rs):
+            for op, v in rs.items():
+                card = cards.get(op)
+                if card is None or op in fetches: continue
                 stt = v.get('status') or 'PROCESSING'
                 card['status']=stt
                 self.job_card.emit(card)
@@ -246,17 +256,10 @@ class _Worker(QObject):
                     if url:
                         fn=f"{title}_canh_{card['scene']}_video_{card['copy']}.mp4"
                         fp=os.path.join(dir_videos, fn)
-                        if self._download(url, fp):
-                            card['path']=fp; card['status']='DOWNLOADED'
-                            th=self._make_thumb(fp, thumbs_dir, card['scene'], card['copy'])
-                            if th: card['thumb']=th
-                            self.job_card.emit(card)
-                else:
-                    new_jobs.append((card, op))
-            jobs=new_jobs
-            try:
-                import time; time.sleep(5)
-            except Exception: pass
+                        fetches[op] = self._download(url, fp, card, thumbs_dir, op)
+
+        wait_for(client, list(cards), on_update=on_update, timeout=600, meta=op_meta)
+        wait_futures(list(fetches.values()))
 
         # 4K upscale
 
@@ -16,6 +16,7 @@ import datetime
 import time
 from pathlib import Path
 
+from services import artifact_store
 from services import sales_video_service as svc
 from services import sales_script_service as sscript
 from services import image_gen_service
@@ -213,14 +214,12 @@ class ImageGenerationWorker(QThread):
                 if img_data is None:
                     try:
                         # Use Gemini image generation with rate limiting and debug logging
-                        # 8s delay for Gemini free tier (15 req/min = 4s min, use 8s to be safe)
-                        delay = 8.0 if i > 0 else 0
+                        # (per-key token buckets pace requests; no fixed delay)
                         self.progress.emit(f"Cảnh {scene.get('index')}: Dùng Gemini...")
                         
                         # Pass log callback for enhanced debug output
                         img_data = image_gen_service.generate_image_with_rate_limit(
                             prompt, 
-                            delay, 
                             log_callback=lambda msg: self.progress.emit(msg)
                         )
                         
@@ -249,11 +248,9 @@ class ImageGenerationWorker(QThread):
                 
                 # Generate base thumbnail image
                 try:
-                    # Rate limit: 8s delay for Gemini free tier (15 req/min)
-                    delay = 8.0 if (len(scenes) + i) > 0 else 0
+                    # Rate limit handled by per-key token buckets (services.rate_limiter)
                     thumb_data = image_gen_service.generate_image_with_rate_limit(
                         prompt, 
-                        delay,
                         log_callback=lambda msg: self.progress.emit(msg)
                     )
                     
@@ -928,9 +925,7 @@ class VideoBanHangPanel(QWidget):
         cfg = self._collect_cfg()
         dirs = svc.ensure_project_dirs(cfg["project_name"])
         img_path = dirs["preview"] / f"scene_{scene_idx}.png"
-        
-        with open(img_path, 'wb') as f:
-            f.write(img_data)
+        artifact_store.write_bytes(img_data, str(img_path))
         
         # Update UI
         if scene_idx in self.scene_images:
@@ -948,9 +943,7 @@ class VideoBanHangPanel(QWidget):
         cfg = self._collect_cfg()
         dirs = svc.ensure_project_dirs(cfg["project_name"])
         img_path = dirs["preview"] / f"thumbnail_v{version_idx+1}.png"
-        
-        with open(img_path, 'wb') as f:
-            f.write(img_data)
+        artifact_store.write_bytes(img_data, str(img_path))
         
         # Update UI - thumbnail tab
         if version_idx < len(self.thumbnail_widgets):
@@ -1,5 +1,5 @@
 
-import json, os
+import json, os, threading, time
 
 def _atomic_write_json(path, data):
     import json, os, tempfile
@@ -22,18 +22,129 @@ def _atomic_write_json(path, data):
 
 CFG_PATH = os.path.join(os.path.expanduser("~"), ".veo_image2video_cfg.json")
 
-def load()->dict:
+DEFAULTS = {"tokens":[], "default_project_id":"", "google_api_key":"", "download_root":""}
+
+
+class FrozenDict(dict):
+    """Read-only dict used for config snapshots (json-serializable; copy with thaw())"""
+    def _ro(self, *a, **kw):
+        raise TypeError("config snapshot is read-only; use thaw() and save()")
+    __setitem__ = __delitem__ = setdefault = pop = popitem = clear = update = _ro
+
+class FrozenList(list):
+    """Read-only list used for config snapshots (still a list: isinstance checks and json keep working)"""
+    def _ro(self, *a, **kw):
+        raise TypeError("config snapshot is read-only; use thaw() and save()")
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = append = extend = insert = remove = pop = clear = sort = reverse = _ro
+    def __reduce__(self):
+        return (FrozenList, (list(self),))
+
+def _freeze(v):
+    if isinstance(v, dict): return FrozenDict((k, _freeze(x)) for k, x in v.items())
+    if isinstance(v, list): return FrozenList(_freeze(x) for x in v)
+    return v
+
+_FROZEN_DEFAULTS = _freeze(DEFAULTS)
+
+def thaw(v):
+    """Mutable deep copy of a snapshot (dicts/lists)"""
+    if isinstance(v, dict): return {k: thaw(x) for k, x in v.items()}
+    if isinstance(v, (list, tuple)): return [thaw(x) for x in v]
+    return v
+
+
+# Snapshot state: re-parsed only when the file's (mtime, size) changes; the file is
+# stat()ed at most once per CHECK_INTERVAL so hot paths pay a clock read, not a syscall
+CHECK_INTERVAL = 1.0
+_CHECKED_AT = None
+_SNAPSHOT = None      # FrozenDict of the file, or None when there is no readable file
+_STAMP = None         # (st_mtime_ns, st_size) of the parsed file
+_VERSION = 0
+_SUBSCRIBERS = []
+_LOCK = threading.RLock()
+
+def _stamp():
     try:
-        if os.path.exists(CFG_PATH):
-            with open(CFG_PATH, "r", encoding="utf-8") as f:
-                return json.load(f)
-    except Exception:
-        pass
-    return {"tokens":[], "default_project_id":"", "google_api_key":"", "download_root":""}
+        st = os.stat(CFG_PATH)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
 
-def save(cfg: dict)->dict:
+def _notify(old, new):
+    for fn in list(_SUBSCRIBERS):
+        try: fn(old, new)
+        except Exception: pass
+
+def snapshot():
+    """Current config file contents as a FrozenDict (None if the file is missing/unreadable)"""
+    global _SNAPSHOT, _STAMP, _VERSION, _CHECKED_AT
+    now = time.monotonic()
+    if _CHECKED_AT is not None and now - _CHECKED_AT < CHECK_INTERVAL:
+        return _SNAPSHOT
+    _CHECKED_AT = now
+    stamp = _stamp()
+    if stamp == _STAMP:
+        return _SNAPSHOT
+    with _LOCK:
+        if stamp == _STAMP:
+            return _SNAPSHOT
+        old = _SNAPSHOT
+        if stamp is None:
+            new = None
+        else:
+            try:
+                with open(CFG_PATH, "r", encoding="utf-8") as f:
+                    new = _freeze(json.load(f))
+            except Exception:
+                new = old  # half-written/corrupt: keep the last good snapshot, retry on next change
+        _SNAPSHOT, _STAMP = new, stamp
+        if new is old:
+            return new
+        _VERSION += 1
+    _notify(old, new)
+    return new
+
+def version()->int:
+    """Bumped every time a new snapshot is installed"""
+    snapshot()
+    return _VERSION
+
+def subscribe(fn):
+    """fn(old_snapshot, new_snapshot) is called after every config change; returns fn"""
+    with _LOCK:
+        if fn not in _SUBSCRIBERS: _SUBSCRIBERS.append(fn)
+    return fn
+
+def unsubscribe(fn):
+    with _LOCK:
+        if fn in _SUBSCRIBERS: _SUBSCRIBERS.remove(fn)
+
+def load()->dict:
+    snap = snapshot()
+    return snap if snap is not None else _FROZEN_DEFAULTS
+
+def write(cfg: dict)->bool:
+    """Atomically write cfg and install it as the new snapshot (subscribers are notified)"""
+    global _SNAPSHOT, _STAMP, _VERSION
     try:
         _atomic_write_json(CFG_PATH, cfg)
     except Exception:
-        pass
+        return False
+    with _LOCK:
+        old = _SNAPSHOT
+        _SNAPSHOT, _STAMP = _freeze(thaw(cfg)), _stamp()
+        _VERSION += 1
+        new = _SNAPSHOT
+    _notify(old, new)
+    return True
+
+def save(cfg: dict)->dict:
+    write(cfg)
     return cfg
+
+def reset():
+    """Drop the snapshot so the next load() re-reads the file"""
+    global _STAMP, _CHECKED_AT
+    with _LOCK:
+        _STAMP = ("reset",)
+        _CHECKED_AT = None